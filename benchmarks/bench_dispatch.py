@@ -0,0 +1,102 @@
+"""
+Measures the instructions/sec of the interpreter on the bundled roms.
+
+Usage:
+    python benchmarks/bench_dispatch.py [--cycles N] [--trace] [--save FILE] [--compare FILE]
+
+Run it with --save on one revision and with --compare on another to get
+a before/after table. With --trace the fast interpreter is compared with
+the trace interpreter, which logs every instruction.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chip8emulator import Emulator  # noqa: E402
+from chip8emulator.emulator import BUDGET, KEY_WAIT, HALT  # noqa: E402
+
+ROM_DIR = os.path.join(os.path.dirname(__file__), '..', 'roms')
+
+
+def create_emulator(settings):
+    e = Emulator(settings)
+    e.stopped = False
+
+    @e.external('close')
+    def close(exitcode):
+        e.stopped = True
+
+    @e.external('halt')
+    def halt(opcode):
+        e.stopped = True
+
+    e.init_optable()
+    return e
+
+
+def run_rom(path, cycles, settings=None):
+    with open(path, 'rb') as rom:
+        data = bytearray(rom.read())
+    e = create_emulator(dict(settings or {}, seed=0))
+    e.load_to_memory(data)
+    executed = 0
+    start = time.perf_counter()
+    while executed < cycles and not e.stopped:
+        stop = e.run_cycles(cycles - executed, stop_on=(KEY_WAIT, HALT))
+        executed += stop.cycles
+        if stop.reason == KEY_WAIT:
+            # Waiting for a key, answer with key 0.
+            e.key_pressed(0)
+        elif stop.reason != BUDGET:
+            break
+    elapsed = time.perf_counter() - start
+    return executed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=100000)
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--compare', help='json results of an earlier run')
+    parser.add_argument('--trace', action='store_true',
+                        help='compare with the trace interpreter')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    before = {}
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+    elif args.trace:
+        for name in sorted(os.listdir(ROM_DIR)):
+            if not name.startswith('_'):
+                executed, elapsed = run_rom(os.path.join(ROM_DIR, name), args.cycles,
+                                            {'trace': True})
+                before[name] = executed / elapsed if elapsed else 0
+
+    results = {}
+    print(f'{"rom":<20}{"instructions":>14}{"inst/sec":>14}{"baseline":>14}{"speedup":>10}')
+    for name in sorted(os.listdir(ROM_DIR)):
+        if name.startswith('_'):
+            continue
+        executed, elapsed = run_rom(os.path.join(ROM_DIR, name), args.cycles)
+        ips = executed / elapsed if elapsed else 0
+        results[name] = ips
+        old = before.get(name)
+        line = f'{name:<20}{executed:>14}{ips:>14.0f}'
+        if old:
+            line += f'{old:>14.0f}{ips / old:>9.2f}x'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Measures the frame time of the renderer under the SDL dummy video driver.
+
+Usage:
+    python benchmarks/bench_render.py [ROM] [--frames N]
+
+The rom is run headless first and the framebuffer of every frame is
+recorded, then the same frames are drawn with the old path (fill plus one
+draw.rect per lit pixel) and with Renderer (dirty rows plus one scaled blit).
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pygame  # noqa: E402
+from chip8emulator import headless  # noqa: E402
+from chip8emulator.renderer import Renderer  # noqa: E402
+
+ROM_DIR = os.path.join(os.path.dirname(__file__), '..', 'roms')
+
+
+class Frame:
+    def __init__(self, framebuffer, dirty_rows):
+        self.framebuffer = framebuffer
+        self.dirty_rows = dirty_rows
+
+
+def record_frames(path, frames):
+    recorded = []
+
+    def on_frame(emulator, cycle):
+        recorded.append(Frame(list(emulator.framebuffer), emulator.dirty_rows))
+        emulator.dirty_rows = 0
+
+    settings = headless.load_settings()
+    headless.run_rom(path, settings, cycles=frames*settings['speed'],
+                     on_frame=on_frame)
+    return recorded
+
+
+def render_rects(screen, frame, tile_size):
+    # The old Engine.render_tiles, the screen was drawn whenever a sprite
+    # was drawn and flipped on every frame.
+    if frame.dirty_rows:
+        screen.fill(pygame.Color('black'))
+        for x in range(64):
+            for y in range(32):
+                if (frame.framebuffer[y] >> (63 - x)) & 1:
+                    pygame.draw.rect(screen, pygame.Color('white'),
+                                     (x*tile_size, y*tile_size, tile_size, tile_size))
+    return True
+
+
+def measure(frames, draw):
+    # Frame times in milliseconds, of all frames and of the frames which
+    # changed the screen
+    times = []
+    changed = []
+    for frame in frames:
+        dirty = frame.dirty_rows
+        start = time.perf_counter()
+        if draw(frame):
+            pygame.display.flip()
+        elapsed = (time.perf_counter() - start) * 1000
+        times.append(elapsed)
+        if dirty:
+            changed.append(elapsed)
+    return times, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('rom', nargs='?', default=os.path.join(ROM_DIR, 'BLITZ'))
+    parser.add_argument('--frames', type=int, default=600)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    frames = record_frames(args.rom, args.frames)
+    pygame.init()
+    screen = pygame.display.set_mode((640, 320))
+    renderer = Renderer(screen)
+
+    dirty = [frame.dirty_rows for frame in frames]
+    old = measure(frames, lambda frame: render_rects(screen, frame, 10))
+    for frame, rows in zip(frames, dirty):
+        frame.dirty_rows = rows
+    new = measure(frames, renderer.present)
+    print(f'{os.path.basename(args.rom)}, {len(frames)} frames, '
+          f'video driver {pygame.display.get_driver()}')
+    print(f'{"path":<12}{"mean ms":>10}{"max ms":>10}{"changed frames mean ms":>24}')
+    for name, (times, changed) in (('draw.rect', old), ('renderer', new)):
+        print(f'{name:<12}{statistics.mean(times):>10.3f}{max(times):>10.3f}'
+              f'{statistics.mean(changed or [0]):>24.3f}')
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
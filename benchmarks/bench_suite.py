@@ -0,0 +1,177 @@
+"""
+Benchmark suite, gates changes to the emulator on speed.
+
+Usage:
+    python benchmarks/bench_suite.py [--cycles N] [--repeat N] [--save FILE]
+                                     [--compare FILE] [--threshold PERCENT]
+
+Every rom in roms/ is run headless for a fixed number of cycles, with a
+fixed seed and a fixed input script, and the best of --repeat runs gives
+its instructions/sec and ns/instruction. Those count the instructions the
+emulator executed: the iterations of idle loops it skipped (see idle.py)
+only show in the emulated instructions/sec, which is not gated on. The peak memory allocated while
+running it is measured in a separate, shorter run under tracemalloc. Then
+every opcode family is timed on its own through Emulator.execute_opcode.
+
+--save writes the results as a json baseline. With --compare the exit
+status is 1 when any rom is slower than its baseline by more than the
+threshold (10% by default), e.g.
+
+    python benchmarks/bench_suite.py --save baseline.json
+    ... change emulator.py ...
+    python benchmarks/bench_suite.py --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chip8emulator import headless  # noqa: E402
+
+ROM_DIR = os.path.join(os.path.dirname(__file__), '..', 'roms')
+
+SETTINGS = dict(headless.DEFAULT_SETTINGS, seed=0)
+# Presses 1 to F in turn, so that games leave their title screen and move
+SCRIPT = [(cycle, (1 << (cycle // 1000 % 16)) if cycle % 1000 < 200 else 0)
+          for cycle in range(0, 10000000, 200)]
+
+# Opcodes of each family, each one is timed on its own and does not change
+# the state in a way which would make it fault when repeated.
+FAMILIES = {
+    'NNN': [[0x1200], [0xA300], [0xB200], [0x2300, 0x00EE]],
+    'XNN': [[0x3312], [0x4312], [0x6312], [0x7301], [0xC3FF]],
+    'XYK': [[0x5120], [0x9120], [0x8120], [0x8121], [0x8122], [0x8123], [0x8124],
+            [0x8345], [0x8537], [0x8666], [0x866E]],
+    'XKK': [[0xE09E], [0xE0A1], [0xF007], [0xF00F], [0xF01E], [0xF029], [0xF833],
+            [0xF855], [0xF865]],
+    'draw': [[0xD125], [0xD12F]],
+    'clear': [[0x00E0]],
+}
+
+
+def list_roms():
+    return [name for name in sorted(os.listdir(ROM_DIR)) if not name.startswith('_')]
+
+
+def run_rom(name, cycles):
+    return headless.run_rom(os.path.join(ROM_DIR, name), SETTINGS,
+                            cycles=cycles, script=SCRIPT)
+
+
+def peak_memory(name, cycles):
+    tracemalloc.start()
+    run_rom(name, cycles)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def time_family(sequences, count):
+    instructions = 0
+    elapsed = 0
+    for ops in sequences:
+        emulator = headless.create_emulator(dict(SETTINGS))
+        emulator.V[1] = 1
+        emulator.V[2] = 3
+        emulator.V[3] = 5
+        emulator.V[5] = 2
+        emulator.V[6] = 0x81
+        emulator.I = 0x300
+        execute = emulator.execute_opcode
+        start = time.perf_counter()
+        for i in range(count // len(ops)):
+            for op in ops:
+                execute(op)
+        elapsed += time.perf_counter() - start
+        instructions += count // len(ops) * len(ops)
+    return elapsed / instructions * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per rom, the fastest one is kept')
+    parser.add_argument('--save', help='write the results as a json baseline')
+    parser.add_argument('--compare', help='json baseline of an earlier run')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='slowdown in percent which fails --compare')
+    args = parser.parse_args()
+    # Some roms fault under the input script, which is logged with tracebacks
+    logging.disable(logging.CRITICAL)
+
+    baseline = {'roms': {}, 'families': {}}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {
+        'cycles': args.cycles,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'roms': {},
+        'families': {},
+    }
+    regressions = []
+    print(f'{"rom":<20}{"inst/sec":>12}{"ns/inst":>9}{"emulated/sec":>14}{"peak KiB":>10}'
+          f'{"baseline":>12}{"change":>9}')
+    for name in list_roms():
+        best = None
+        for i in range(args.repeat):
+            result = run_rom(name, args.cycles)
+            if best is None or result.elapsed < best.elapsed:
+                best = result
+        ips = best.instructions_per_second
+        peak = peak_memory(name, max(args.cycles // 10, 1000))
+        results['roms'][name] = {
+            'instructions': best.instructions,
+            'executed': best.executed,
+            # Executed instructions per second, --compare is gated on it
+            'executed_per_second': ips,
+            'ns_per_instruction': 1e9 / ips if ips else 0,
+            'emulated_per_second': best.emulated_per_second,
+            'peak_memory': peak,
+        }
+        line = (f'{name:<20}{ips:>12.0f}{1e9 / ips if ips else 0:>9.0f}'
+                f'{best.emulated_per_second:>14.0f}{peak / 1024:>10.0f}')
+        old = baseline['roms'].get(name)
+        # Baselines from before the skipped instructions were told apart
+        # only have the emulated instructions/sec, they are not compared
+        if old and 'executed_per_second' in old:
+            change = (ips / old['executed_per_second'] - 1) * 100
+            line += f'{old["executed_per_second"]:>12.0f}{change:>+8.1f}%'
+            if change < -args.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    print()
+    print(f'{"family":<20}{"ns/inst":>12}{"baseline":>12}{"change":>9}')
+    for family, sequences in FAMILIES.items():
+        ns = min(time_family(sequences, 20000) for i in range(args.repeat))
+        results['families'][family] = ns
+        line = f'{family:<20}{ns:>12.0f}'
+        old = baseline['families'].get(family)
+        if old:
+            line += f'{old:>12.0f}{(ns / old - 1) * 100:>+8.1f}%'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if regressions:
+        print(f'\n{len(regressions)} roms slower than the baseline by more than '
+              f'{args.threshold:g}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Compares the aggregate instructions/sec of VectorEmulator with scalar
+Emulators running one after the other.
+
+Usage:
+    python benchmarks/bench_vector.py [ROM] [--cycles N] [--machines N [N ...]]
+
+Every machine runs the same rom, with the same number of cycles. The scalar
+rate is that of headless.run on a few machines, N scalar emulators take N
+times as long.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chip8emulator import headless  # noqa: E402
+from chip8emulator.vector import VectorEmulator  # noqa: E402
+
+ROM_DIR = os.path.join(os.path.dirname(__file__), '..', 'roms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('rom', nargs='?', default=os.path.join(ROM_DIR, 'BRIX'))
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--machines', type=int, nargs='+', default=[1, 64, 1024, 8192])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with open(args.rom, 'rb') as rom:
+        data = rom.read()
+    settings = headless.load_settings()
+
+    instructions = 0
+    elapsed = 0
+    for i in range(4):
+        result = headless.run_rom(args.rom, settings, cycles=args.cycles)
+        instructions += result.instructions
+        elapsed += result.elapsed
+    scalar = instructions / elapsed
+
+    print(f'{os.path.basename(args.rom)}, {args.cycles} cycles per machine')
+    print(f'{"machines":>9}{"vector inst/sec":>17}{"scalar inst/sec":>17}{"speedup":>9}')
+    for n in args.machines:
+        vec = VectorEmulator(n, dict(settings, seed=0))
+        vec.load_to_memory(data)
+        start = time.perf_counter()
+        vec.run(args.cycles)
+        rate = vec.instructions.sum() / (time.perf_counter() - start)
+        print(f'{n:>9}{rate:>17.0f}{scalar:>17.0f}{rate / scalar:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
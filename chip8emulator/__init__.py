@@ -1,2 +1,10 @@
 from .emulator import Emulator
-from .engine import Engine
+
+
+def __getattr__(name):
+    # The engine needs pygame, only import it when it is used, so that the
+    # emulator can run headless.
+    if name == 'Engine':
+        from .engine import Engine
+        return Engine
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,348 @@
+"""
+Static analysis of a rom, before it runs.
+
+    python -m chip8emulator.analysis ROM
+
+The rom is disassembled recursively from 0x200, following jumps (1NNN),
+calls (2NNN) and both ways of every skip, into basic blocks. On top of them
+come the call graph (the subroutines called from each subroutine, 0x200
+being the main one), the likely data regions (memory read by DXYN, FX33,
+FX55 and FX65 through an I set by ANNN) and the dynamic jumps (BNNN), whose
+targets are not known before running.
+
+An Analysis depends only on the bytes of the rom, so load() caches it in a
+directory, in a compact binary file named after the SHA-256 of the rom, and
+repeated launches and farm workers read it back instead. BlockTranslator
+uses it to compile the blocks of a rom before it starts (prebuild).
+"""
+import argparse
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from .decoder import hexrepr, describe
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+MAGIC = b'C8AN'
+VERSION = 1
+
+# magic, version, SHA-256 of the rom, then the number of uint16 of each of
+# the blocks, functions, data and dynamic jumps arrays which follow
+HEADER = struct.Struct('<4sB32sIIII')
+
+ORIGIN = 0x200
+
+# Value of I when it is not known
+_UNKNOWN = -1
+# Value of I in a block which has not been reached yet
+_UNSEEN = -2
+
+
+def is_skip(op):
+    """
+    True for the opcodes which skip the next instruction on a condition
+    """
+    S = op >> 12
+    if S in (0x3, 0x4):
+        return True
+    if S in (0x5, 0x9):
+        return op & 0xF == 0
+    return S == 0xE and op & 0xFF in (0x9E, 0xA1)
+
+
+def _ends_block(op):
+    return (op >> 12 in (0x1, 0x2, 0xB) or op in (0x00EE, 0x0FFF) or is_skip(op))
+
+
+class Block:
+    def __init__(self, start, end, successors):
+        self.start = start
+        # Address after the last instruction of the block
+        self.end = end
+        # Addresses of the blocks run next, the return address for a call
+        self.successors = successors
+
+    def __repr__(self):
+        return (f'Block({hexrepr(self.start).strip()} - {hexrepr(self.end).strip()} -> '
+                f'{", ".join(hexrepr(s).strip() for s in self.successors)})')
+
+
+class Analysis:
+    def __init__(self, rom_hash, blocks, functions, data, dynamic_jumps):
+        # SHA-256 of the rom, bytes
+        self.rom_hash = rom_hash
+        # Start address -> Block
+        self.blocks = blocks
+        # Entry address of each subroutine -> addresses of the subroutines it calls
+        self.functions = functions
+        # Sorted, disjoint (start, end) ranges of memory read as data
+        self.data = data
+        # Addresses of the BNNN instructions
+        self.dynamic_jumps = dynamic_jumps
+
+    def code(self):
+        """
+        Addresses of every instruction reached
+        """
+        return sorted(addr for block in self.blocks.values()
+                      for addr in range(block.start, block.end, 2))
+
+    def to_bytes(self):
+        blocks = array('H')
+        for block in self.blocks.values():
+            blocks.extend((block.start, block.end, len(block.successors)))
+            blocks.extend(block.successors)
+        functions = array('H')
+        for entry, callees in self.functions.items():
+            functions.extend((entry, len(callees)))
+            functions.extend(callees)
+        data = array('H', [addr for region in self.data for addr in region])
+        dynamic = array('H', self.dynamic_jumps)
+        if sys.byteorder != 'little':
+            for values in (blocks, functions, data, dynamic):
+                values.byteswap()
+        return (HEADER.pack(MAGIC, VERSION, self.rom_hash,
+                            len(blocks), len(functions), len(data), len(dynamic)) +
+                blocks.tobytes() + functions.tobytes() + data.tobytes() + dynamic.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Raises ValueError if data is not an analysis
+        """
+        if len(data) < HEADER.size:
+            raise ValueError('Not an analysis, too short')
+        magic, version, rom_hash, *sizes = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Not an analysis')
+        if version != VERSION:
+            raise ValueError(f'Unsupported analysis version {version}')
+        if len(data) != HEADER.size + 2 * sum(sizes):
+            raise ValueError('Truncated analysis')
+        arrays = []
+        position = HEADER.size
+        for size in sizes:
+            values = array('H')
+            values.frombytes(data[position:position + 2 * size])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            arrays.append(values)
+            position += 2 * size
+        blocks_array, functions_array, data_array, dynamic = arrays
+
+        blocks = {}
+        i = 0
+        while i < len(blocks_array):
+            start, end, count = blocks_array[i:i + 3]
+            blocks[start] = Block(start, end, tuple(blocks_array[i + 3:i + 3 + count]))
+            i += 3 + count
+        functions = {}
+        i = 0
+        while i < len(functions_array):
+            entry, count = functions_array[i:i + 2]
+            functions[entry] = tuple(functions_array[i + 2:i + 2 + count])
+            i += 2 + count
+        regions = [tuple(data_array[i:i + 2]) for i in range(0, len(data_array), 2)]
+        return cls(rom_hash, blocks, functions, regions, list(dynamic))
+
+
+def analyze(rom, origin=ORIGIN):
+    """
+    Analyses a rom (bytes) loaded at origin
+    """
+    memory = bytearray(4096)
+    memory[origin:origin + len(rom)] = rom[:4096 - origin]
+    end_of_rom = min(origin + len(rom), 4096)
+
+    # Recursive disassembly: address -> opcode of every instruction reached
+    code = {}
+    leaders = {origin}
+    entries = {origin}
+    work = [origin]
+    while work:
+        pc = work.pop()
+        while pc not in code and pc + 1 < end_of_rom:
+            op = (memory[pc] << 8) | memory[pc + 1]
+            code[pc] = op
+            S = op >> 12
+            if S == 0x1:
+                targets = [op & 0xFFF]
+            elif S == 0x2:
+                entries.add(op & 0xFFF)
+                targets = [op & 0xFFF, pc + 2]
+            elif is_skip(op):
+                targets = [pc + 2, pc + 4]
+            elif _ends_block(op):
+                # Return, halt and BNNN
+                targets = []
+            else:
+                pc += 2
+                continue
+            leaders.update(targets)
+            work.extend(targets)
+            break
+
+    blocks = {}
+    for start in sorted(leader for leader in leaders if leader in code):
+        pc = start
+        while True:
+            op = code[pc]
+            pc += 2
+            if _ends_block(op) or pc in leaders or pc not in code:
+                break
+        S = op >> 12
+        if S == 0x1:
+            successors = (op & 0xFFF,)
+        elif is_skip(op):
+            successors = (pc, pc + 2)
+        elif S == 0x2 or not _ends_block(op):
+            # The return address of a call, or the next block
+            successors = (pc,)
+        else:
+            successors = ()
+        blocks[start] = Block(start, pc, tuple(s for s in successors if s in code))
+
+    functions = {}
+    for entry in sorted(entries):
+        if entry not in blocks:
+            continue
+        callees = set()
+        seen = {entry}
+        work = [entry]
+        while work:
+            block = blocks[work.pop()]
+            op = code[block.end - 2]
+            if op >> 12 == 0x2:
+                callees.add(op & 0xFFF)
+            for successor in block.successors:
+                if successor not in seen and successor in blocks:
+                    seen.add(successor)
+                    work.append(successor)
+        functions[entry] = tuple(sorted(callees))
+
+    data = _data_regions(code, blocks, entries)
+    dynamic = sorted(pc for pc, op in code.items() if op >> 12 == 0xB)
+    return Analysis(hashlib.sha256(rom).digest(), blocks, functions, data, dynamic)
+
+
+def _data_regions(code, blocks, entries):
+    # The value of I is followed from block to block: it is known at the
+    # start of a block when every way into it sets the same value
+    state = {start: _UNSEEN for start in blocks}
+    for entry in entries:
+        if entry in state:
+            state[entry] = _UNKNOWN
+    regions = []
+    work = [start for start in blocks if state[start] != _UNSEEN]
+    while work:
+        block = blocks[work.pop()]
+        I = state[block.start]
+        for pc in range(block.start, block.end, 2):
+            op = code[pc]
+            S = op >> 12
+            if S == 0xA:
+                I = op & 0xFFF
+            elif S == 0xF and op & 0xFF == 0x29:
+                I = _UNKNOWN
+            elif S == 0xF and op & 0xFF == 0x1E:
+                I = _UNKNOWN
+            elif I >= 0:
+                if S == 0xD and op & 0xF:
+                    regions.append((I, I + (op & 0xF)))
+                elif S == 0xF and op & 0xFF == 0x33:
+                    regions.append((I, I + 3))
+                elif S == 0xF and op & 0xFF in (0x55, 0x65):
+                    regions.append((I, I + ((op >> 8) & 0xF) + 1))
+        if code[block.end - 2] >> 12 == 0x2:
+            # The subroutine may change I
+            I = _UNKNOWN
+        for successor in block.successors:
+            old = state[successor]
+            new = I if old in (_UNSEEN, I) else _UNKNOWN
+            if new != old:
+                state[successor] = new
+                work.append(successor)
+
+    merged = []
+    for start, end in sorted(set(regions)):
+        end = min(end, 4096)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def load(rom, cache_dir=None):
+    """
+    The analysis of a rom, from cache_dir if it was analysed before, else
+    analysed and saved there. Without a cache_dir the rom is always analysed.
+    """
+    rom = bytes(rom)
+    if cache_dir is None:
+        return analyze(rom)
+    rom_hash = hashlib.sha256(rom).digest()
+    path = os.path.join(cache_dir, rom_hash.hex() + '.c8a')
+    try:
+        with open(path, 'rb') as cached:
+            analysis = Analysis.from_bytes(cached.read())
+        if analysis.rom_hash == rom_hash:
+            return analysis
+        logger.warning(f'{path} is the analysis of another rom')
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f'Ignoring the cached analysis {path}: {e}')
+
+    analysis = analyze(rom)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file then renamed, so that other processes
+        # never read a partial file
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as cached:
+            cached.write(analysis.to_bytes())
+        os.replace(temp, path)
+    except OSError as e:
+        logger.warning(f'Unable to cache the analysis in {cache_dir}: {e}')
+    return analysis
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.analysis',
+        description='Prints the basic blocks, subroutines and data of a rom.')
+    parser.add_argument('rom')
+    parser.add_argument('--cache', help='directory of the cached analyses')
+    args = parser.parse_args(argv)
+
+    with open(args.rom, 'rb') as rom:
+        data = rom.read()
+    analysis = load(data, args.cache)
+    memory = bytearray(4096)
+    memory[ORIGIN:ORIGIN + len(data)] = data[:4096 - ORIGIN]
+
+    print(f'{len(analysis.blocks)} blocks, {len(analysis.code())} instructions, '
+          f'{len(analysis.functions)} subroutines')
+    for block in analysis.blocks.values():
+        print(f'\n{block!r}')
+        for pc in range(block.start, block.end, 2):
+            op = (memory[pc] << 8) | memory[pc + 1]
+            print(f'  {hexrepr(pc)} | {hexrepr(op)} | {describe(op)}')
+    print('\nCall graph')
+    for entry, callees in analysis.functions.items():
+        print(f'  {hexrepr(entry)} -> {" ".join(hexrepr(c).strip() for c in callees)}')
+    print('\nData')
+    for start, end in analysis.data:
+        print(f'  {hexrepr(start)} - {hexrepr(end)}')
+    if analysis.dynamic_jumps:
+        print('\nDynamic jumps (BNNN) at ' +
+              ' '.join(hexrepr(pc).strip() for pc in analysis.dynamic_jumps))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
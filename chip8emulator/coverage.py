@@ -0,0 +1,152 @@
+"""
+Opt-in execution coverage, which instructions of a rom ran.
+
+    emulator = Emulator({'coverage': True, ...})
+    emulator.init_optable()
+    ... run ...
+    print(report(emulator.coverage, rom))
+
+With the coverage setting the emulator runs from coverage_table(), where
+every handler of the dispatch table is wrapped to mark its address in
+emu.coverage, and every skip (3XNN, 4XNN, 5XY0, 9XY0, EX9E and EXA1) whether
+it was taken or not. A disabled coverage costs nothing, and an enabled one a
+byte store per instruction, idle loops are still skipped (see idle.py) as
+the iterations skipped would mark the same addresses.
+
+The maps have one byte per address, 0 or 1, which is cheaper to set than a
+bit. bitmap() packs them into 4096 bit maps, and the maps of several runs
+are merged with merge().
+"""
+from .analysis import ORIGIN, analyze, is_skip
+from .decoder import dispatch_table, describe, hexrepr
+
+# Marks of the report, per instruction and per skip
+_RAN = {0: ' ', 1: '+'}
+_SKIPS = {(0, 0): 'never', (1, 0): 'taken', (0, 1): 'not taken', (1, 1): 'both'}
+
+
+class Coverage:
+    def __init__(self):
+        # Address -> 1 once an instruction ran there
+        self.executed = bytearray(4096)
+        # Address of a skip -> 1 once it skipped, and once it did not
+        self.taken = bytearray(4096)
+        self.not_taken = bytearray(4096)
+
+    def maps(self):
+        return self.executed, self.taken, self.not_taken
+
+    def merge(self, other):
+        """
+        Adds the addresses covered by other, returns the number of them
+        which were not covered yet
+        """
+        new = 0
+        for mine, theirs in zip(self.maps(), other.maps()):
+            mine_bits = int.from_bytes(mine, 'big')
+            theirs_bits = int.from_bytes(theirs, 'big')
+            # The maps only hold 0 and 1, each byte is a bit of the ints
+            new += bin(theirs_bits & ~mine_bits).count('1')
+            mine[:] = (mine_bits | theirs_bits).to_bytes(4096, 'big')
+        return new
+
+    def counts(self):
+        """
+        Instructions executed, skips taken and skips not taken
+        """
+        return tuple(sum(values) for values in self.maps())
+
+    def bitmap(self):
+        """
+        The three maps as 4096 bit maps, 512 bytes each, bit 7 of the first
+        byte is address 0
+        """
+        packed = []
+        for values in self.maps():
+            text = values.translate(bytes.maketrans(b'\x00\x01', b'01')).decode()
+            packed.append(int(text, 2).to_bytes(512, 'big'))
+        return b''.join(packed)
+
+    @classmethod
+    def from_bitmap(cls, data):
+        if len(data) != 3 * 512:
+            raise ValueError(f'Coverage bitmap of {len(data)} bytes, expected {3 * 512}')
+        coverage = cls()
+        for i, values in enumerate(coverage.maps()):
+            text = f'{int.from_bytes(data[512*i:512*(i + 1)], "big"):04096b}'
+            values[:] = text.encode().translate(bytes.maketrans(b'01', b'\x00\x01'))
+        return coverage
+
+
+def report(coverage, rom, analysis=None):
+    """
+    The disassembly of a rom (bytes) loaded at 0x200, from its static
+    analysis, with what coverage ran: + before the instructions executed and
+    for the skips whether they were taken. Addresses executed which the
+    analysis did not find as code (reached by BNNN, or code written by the
+    rom) are listed at the end.
+    """
+    if analysis is None:
+        analysis = analyze(rom)
+    memory = bytearray(4096)
+    memory[ORIGIN:ORIGIN + len(rom)] = rom[:4096 - ORIGIN]
+    code = analysis.code()
+    executed, taken, not_taken = coverage.maps()
+
+    def line(pc):
+        op = (memory[pc] << 8) | memory[pc + 1]
+        text = f'{_RAN[executed[pc]]} {hexrepr(pc)} | {hexrepr(op)} | {describe(op)}'
+        if is_skip(op):
+            text += f'  [skip {_SKIPS[taken[pc], not_taken[pc]]}]'
+        return text
+
+    ran = sum(executed[pc] for pc in code)
+    skips = [pc for pc in code if is_skip((memory[pc] << 8) | memory[pc + 1])]
+    both = sum(taken[pc] & not_taken[pc] for pc in skips)
+    lines = [f'{ran}/{len(code)} instructions executed'
+             f' ({100 * ran / len(code) if code else 0:.1f}%), '
+             f'{both}/{len(skips)} skips taken both ways']
+    for block in analysis.blocks.values():
+        lines.append('')
+        lines.extend(line(pc) for pc in range(block.start, block.end, 2))
+    others = sorted(set(pc for pc in range(4095) if executed[pc]) - set(code))
+    if others:
+        lines.append('')
+        lines.append('Executed outside of the code found by the analysis')
+        lines.extend(line(pc) for pc in others)
+    return '\n'.join(lines) + '\n'
+
+
+def _covered(handler):
+    def h(emu, pc):
+        emu.coverage.executed[pc] = 1
+        return handler(emu, pc)
+    return h
+
+
+def _covered_skip(handler):
+    def h(emu, pc):
+        coverage = emu.coverage
+        coverage.executed[pc] = 1
+        next_pc = handler(emu, pc)
+        if next_pc == pc + 4:
+            coverage.taken[pc] = 1
+        else:
+            coverage.not_taken[pc] = 1
+        return next_pc
+    return h
+
+
+_coverage_table = None
+
+
+def coverage_table():
+    """
+    Same as dispatch_table, but every instruction marks emu.coverage
+    """
+    global _coverage_table
+    if _coverage_table is None:
+        table = dispatch_table()
+        _coverage_table = tuple((_covered_skip if is_skip(op) else _covered)(table[op])
+                                for op in range(0x10000))
+    return _coverage_table
@@ -0,0 +1,544 @@
+from .log import create_logger
+from .keypad import KEY_BITS
+
+logger = create_logger(__name__)
+
+# Pre-decoded dispatch table.
+# Every one of the 65536 possible opcodes is decoded once into a small handler
+# with its operands (X, Y, N, NN, NNN) already bound, so executing an opcode is
+# a single indexed fetch and call: table[opcode](emulator, pc) -> next pc.
+# The table does not depend on any emulator instance, so it is built once per
+# process and shared.
+# The handlers do no logging at all, the trace table wraps the same handlers
+# with the per instruction diagnostics (see trace_table).
+
+
+def hexrepr(x): return f"{f'{x:#06x}': ^8}"
+
+
+def notimpl(op): return logger.warning(
+    f'{hexrepr(op)} | External function not implemented')
+
+
+# The framebuffer is a list of 32 rows, each row is a 64 bit integer with
+# the leftmost pixel in the most significant bit.
+_ROW_MASK = (1 << 64) - 1
+_BLANK = [0]*32
+_ALL_ROWS = (1 << 32) - 1
+
+
+def _nop(emu, pc):
+    # Opcodes which have no effect, e.g 0x0000 or 8XY8
+    return pc + 2
+
+
+# 0NNN
+
+
+def _clear(op):
+    def h(emu, pc):
+        emu.framebuffer[:] = _BLANK
+        emu.dirty_rows = _ALL_ROWS
+        clear = emu.ext_functions.get('clear')
+        if clear is not None:
+            clear(op)
+        return pc + 2
+    return h
+
+
+def _return(op):
+    def h(emu, pc):
+        try:
+            emu.stack_pointer -= 1
+            pc = emu.stack.pop()
+        except Exception as e:
+            logger.exception('Illegal return statement')
+            emu.variable_dump()
+            emu.quit(exitcode=-3)
+        return pc + 2
+    return h
+
+
+def _halt(op):
+    # Simple halt function, for debugging purpose
+    def h(emu, pc):
+        emu.ext_functions.get('halt', notimpl)(op)
+        return pc + 2
+    return h
+
+
+def _unknown(op):
+    def h(emu, pc):
+        logger.warning(f'{hexrepr(op)} | Not found in the table')
+        return pc + 2
+    return h
+
+# NNN
+
+
+def _jump(op, nnn):
+    def h(emu, pc):
+        # Already we have jumped, so stay at that position.
+        return nnn
+    return h
+
+
+def _call(op, nnn):
+    def h(emu, pc):
+        emu.stack_pointer += 1
+        if(emu.stack_pointer >= emu.MAX_STACK_SIZE):
+            logger.critical('Stack overflow ! Maximum stack size reached')
+            emu.variable_dump()
+            emu.quit(exitcode=-2)
+        emu.stack.append(pc)
+        return nnn
+    return h
+
+
+def _set_i(op, nnn):
+    def h(emu, pc):
+        emu.I = nnn
+        return pc + 2
+    return h
+
+
+def _jump_v0(op, nnn):
+    def h(emu, pc):
+        return emu.V[0] + nnn
+    return h
+
+# XNN
+
+
+def _skip_eq(op, x, nn):
+    def h(emu, pc):
+        if emu.V[x] == nn:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _skip_ne(op, x, nn):
+    def h(emu, pc):
+        if emu.V[x] != nn:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _set(op, x, nn):
+    def h(emu, pc):
+        emu.V[x] = nn
+        return pc + 2
+    return h
+
+
+def _add(op, x, nn):
+    def h(emu, pc):
+        V = emu.V
+        V[x] = (V[x] + nn) & 0xff
+        return pc + 2
+    return h
+
+
+def _random(op, x, nn):
+    def h(emu, pc):
+        emu.V[x] = emu.random.byte() & nn
+        return pc + 2
+    return h
+
+# XYK
+
+
+def _skip_eq_reg(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        if V[x] == V[y]:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _skip_ne_reg(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        if V[x] != V[y]:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _assign(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        V[x] = V[y]
+        return pc + 2
+    return h
+
+
+def _or(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        V[x] = V[x] | V[y]
+        return pc + 2
+    return h
+
+
+def _and(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        V[x] = V[x] & V[y]
+        return pc + 2
+    return h
+
+
+def _xor(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        V[x] = V[x] ^ V[y]
+        return pc + 2
+    return h
+
+
+def _add_reg(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        if ((V[x] + V[y]) > 0xff):
+            V[0xF] = 1
+        else:
+            V[0xF] = 0
+        V[x] = (V[x] + V[y]) & 0xFF
+        return pc + 2
+    return h
+
+
+def _sub_reg(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        if V[x] > V[y]:
+            V[0xF] = 0
+            V[x] = V[x] - V[y]
+        else:
+            V[0xF] = 1
+            V[x] = V[x] - V[y] + 256
+        return pc + 2
+    return h
+
+
+def _shr(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        # Stores LSB in VF (for right shift)
+        V[0xF] = V[x] & 1
+        V[x] = V[x] >> 1
+        return pc + 2
+    return h
+
+
+def _subn_reg(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        if V[y] > V[x]:
+            V[0xF] = 0
+            V[x] = V[y] - V[x]
+        else:
+            V[0xF] = 1
+            V[x] = V[y] - V[x] + 256
+        return pc + 2
+    return h
+
+
+def _shl(op, x, y):
+    def h(emu, pc):
+        V = emu.V
+        # Stores MSB in VF
+        V[0xF] = (V[x] & 0b10000000) >> 7
+        # The result is masked with 0xFF (255) so that it remains within a byte.
+        V[x] = (V[x] << 1) & 0xFF
+        return pc + 2
+    return h
+
+# XYN
+
+
+def _draw(op, x, y, n):
+    # Opcode for drawing the sprite. DXYN
+    # Each sprite byte is shifted into place in its row, the row is XORed
+    # with it and any bit set in both means a collision.
+    def h(emu, pc):
+        V = emu.V
+        memory = emu.memory
+        framebuffer = emu.framebuffer
+        sx = V[x] % 64
+        sy = V[y]
+        I = emu.I
+        collision = 0
+        dirty = 0
+        V[0xF] = 0
+        for i in range(n):
+            line = memory[I + i] << 56
+            if line:
+                # Rotate right, so that the sprite wraps around the screen
+                bits = ((line >> sx) | (line << (64 - sx))) & _ROW_MASK
+                row = (sy + i) % 32
+                collision |= framebuffer[row] & bits
+                framebuffer[row] ^= bits
+                dirty |= 1 << row
+        emu.dirty_rows |= dirty
+        if collision:
+            V[0xF] = 1
+        draw = emu.ext_functions.get('draw')
+        if draw is not None:
+            draw(op)
+        return pc + 2
+    return h
+
+# XKK
+
+
+def _skip_key(op, x):
+    def h(emu, pc):
+        # if key() == V[x], then skip the block.
+        if emu.keys & KEY_BITS[emu.V[x]]:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _skip_not_key(op, x):
+    def h(emu, pc):
+        # if key() != V[x], then skip the block.
+        if not emu.keys & KEY_BITS[emu.V[x]]:
+            return pc + 4
+        return pc + 2
+    return h
+
+
+def _get_delay(op, x):
+    def h(emu, pc):
+        emu.V[x] = int(emu.delay_timer)
+        return pc + 2
+    return h
+
+
+def _wait_key(op, x):
+    def h(emu, pc):
+        # Halting operation, halt all operation until a key is pressed.
+        # If it is pressed store it in V[X]
+        emu.wait_for_key(x)
+        return pc + 2
+    return h
+
+
+def _set_delay(op, x):
+    def h(emu, pc):
+        emu.delay_timer = emu.V[x]
+        return pc + 2
+    return h
+
+
+def _add_i(op, x):
+    def h(emu, pc):
+        # Limit to 16 bits
+        emu.I = (emu.I + emu.V[x]) & 0xFFFF
+        return pc + 2
+    return h
+
+
+def _sprite_addr(op, x):
+    def h(emu, pc):
+        emu.I = 5*emu.V[x]
+        return pc + 2
+    return h
+
+
+def _bcd(op, x):
+    def h(emu, pc):
+        # Calculates BCD of value at register V[X]
+        # TODO: Check for edge cases, i.e when I = 4096
+        memory = emu.memory
+        I = emu.I
+        v = emu.V[x]
+        memory[I] = (v // 100) % 10
+        memory[I+1] = (v // 10) % 10
+        memory[I+2] = v % 10
+        if emu.memory_listeners:
+            emu.memory_written(I, I + 3)
+        return pc + 2
+    return h
+
+
+def _dump(op, x):
+    def h(emu, pc):
+        # Dumps V0 - VX to memory address I
+        memory = emu.memory
+        V = emu.V
+        I = emu.I
+        for i in range(0, x+1):
+            memory[I+i] = V[i]
+        if emu.memory_listeners:
+            emu.memory_written(I, I + x + 1)
+        return pc + 2
+    return h
+
+
+def _load(op, x):
+    def h(emu, pc):
+        # Loads V0 - VX from memory address I
+        memory = emu.memory
+        V = emu.V
+        I = emu.I
+        for i in range(0, x+1):
+            V[i] = memory[I+i]
+        return pc + 2
+    return h
+
+
+_NNN = {0x1: _jump, 0x2: _call, 0xA: _set_i, 0xB: _jump_v0}
+_XNN = {0x3: _skip_eq, 0x4: _skip_ne, 0x6: _set, 0x7: _add, 0xC: _random}
+_ALU = {
+    0x0: _assign, 0x1: _or, 0x2: _and, 0x3: _xor, 0x4: _add_reg,
+    0x5: _sub_reg, 0x6: _shr, 0x7: _subn_reg, 0xE: _shl,
+}
+_XKK = {
+    0xE09E: _skip_key, 0xE0A1: _skip_not_key,
+    0xF007: _get_delay, 0xF00A: _wait_key, 0xF00F: _set_delay,
+    0xF01E: _add_i, 0xF029: _sprite_addr, 0xF033: _bcd,
+    0xF055: _dump, 0xF065: _load,
+}
+
+
+def decode(op):
+    """
+    Decodes a single opcode into a handler, handler(emulator, pc) -> next pc
+    """
+    S = (op & 0xF000) >> 12
+    X = (op & 0x0F00) >> 8
+    Y = (op & 0x00F0) >> 4
+    K = (op & 0x000F)
+    NN = (op & 0x00FF)
+    NNN = (op & 0x0FFF)
+
+    if S == 0:
+        if op == 0x00E0:
+            return _clear(op)
+        if op == 0x00EE:
+            return _return(op)
+        if op == 0x0FFF:
+            return _halt(op)
+        if op == 0:
+            return _nop
+        return _unknown(op)
+    if S in _NNN:
+        return _NNN[S](op, NNN)
+    if S in _XNN:
+        return _XNN[S](op, X, NN)
+    if S == 5 and K == 0:
+        return _skip_eq_reg(op, X, Y)
+    if S == 9 and K == 0:
+        return _skip_ne_reg(op, X, Y)
+    if S == 8 and K in _ALU:
+        return _ALU[K](op, X, Y)
+    if S == 0xD:
+        return _draw(op, X, Y, K)
+    if (op & 0xF0FF) in _XKK:
+        return _XKK[op & 0xF0FF](op, X)
+    return _nop
+
+
+# Text of each instruction, used for tracing and disassembly.
+_MNEMONICS = {
+    0x1000: 'JUMP {nnn}',
+    0x2000: 'CALL {nnn}',
+    0x3000: 'IF V[{x}] == {nn} SKIP',
+    0x4000: 'IF V[{x}] != {nn} SKIP',
+    0x5000: 'IF V[{x}] == V[{y}] SKIP',
+    0x6000: 'V[{x}] = {nn}',
+    0x7000: 'V[{x}] = V[{x}] + {nn}',
+    0x8000: 'V[{x}] = V[{y}]',
+    0x8001: 'V[{x}] |= V[{y}]',
+    0x8002: 'V[{x}] &= V[{y}]',
+    0x8003: 'V[{x}] ^= V[{y}]',
+    0x8004: 'V[{x}] += V[{y}]',
+    0x8005: 'V[{x}] -= V[{y}]',
+    0x8006: 'V[{x}] >> 1',
+    0x8007: 'V[{x}] = V[{y}] - V[{x}]',
+    0x800E: 'V[{x}] << 1',
+    0x9000: 'IF V[{x}] != V[{y}] SKIP',
+    0xA000: 'I = {nnn}',
+    0xB000: 'PC = V0 + {nnn}',
+    0xC000: 'V[{x}] = random() & {nn}',
+    0xD000: 'DRAW V[{x}], V[{y}], {n}',
+    0xE09E: 'IF key(V[{x}]) SKIP',
+    0xE0A1: 'IF not key(V[{x}]) SKIP',
+    0xF007: 'V[{x}] = delay_timer',
+    0xF00A: 'V[{x}] = wait_key()',
+    0xF00F: 'delay_timer = V[{x}]',
+    0xF01E: 'I += V{x}',
+    0xF029: 'I = sprite_addr(V[{x}])',
+    0xF033: 'I, I+1, I+2 = BCD(V{x})',
+    0xF055: 'Dump registers V0-V{x} to I',
+    0xF065: 'Load registers V0-V{x} from I',
+}
+
+
+def describe(op):
+    """
+    Returns the text of an opcode, e.g 'V[3] = 5' for 0x6305
+    """
+    if op == 0x00E0:
+        return 'CLEAR'
+    if op == 0x00EE:
+        return 'Return'
+    if op == 0x0FFF:
+        return 'HALT'
+    if decode(op) is _nop:
+        return 'NOP'
+    S = op & 0xF000
+    if S == 0x8000:
+        key = op & 0xF00F
+    elif S in (0xE000, 0xF000):
+        key = op & 0xF0FF
+    else:
+        key = S
+    template = _MNEMONICS.get(key)
+    if template is None:
+        return 'UNKNOWN'
+    return template.format(x=(op & 0x0F00) >> 8, y=(op & 0x00F0) >> 4, n=op & 0x000F,
+                           nn=op & 0x00FF, nnn=hexrepr(op & 0x0FFF))
+
+
+def _traced(op, handler):
+    text = f'{hexrepr(op)} | {describe(op)}'
+
+    def h(emu, pc):
+        logger.debug(f'{hexrepr(pc)} | {text} | I = {emu.I}')
+        return handler(emu, pc)
+    return h
+
+
+_table = None
+_trace_table = None
+
+
+def dispatch_table():
+    """
+    Returns the table of decoded handlers for all 65536 opcodes.
+    The table is built on the first call and shared by every emulator.
+    """
+    global _table
+    if _table is None:
+        _table = tuple(decode(op) for op in range(0x10000))
+    return _table
+
+
+def trace_table():
+    """
+    Same as dispatch_table, but every instruction is logged with its address
+    and text, at the debug level.
+    """
+    global _trace_table
+    if _trace_table is None:
+        table = dispatch_table()
+        _trace_table = tuple(_traced(op, table[op]) for op in range(0x10000))
+    return _trace_table
@@ -1,23 +1,84 @@
 import random
 import sys
 from .log import create_logger
+from .decoder import dispatch_table, trace_table, hexrepr, notimpl
+from .prng import ByteRandom, SEED_MASK
+from .keypad import lowest_key
+from .profiler import Profiler, profile_table
+from .coverage import Coverage, coverage_table
+from .snapshot import pack, unpack, delta, apply_delta, check_header, memory_view, DELTA
 import base64
 
 logger = create_logger(__name__)
 
-
-def hexrepr(x): return f"{f'{x:#06x}': ^8}"
-
-
-def notimpl(op): return logger.warning(
-    f'{hexrepr(op)} | External function not implemented')
-
-
-def unknownop(op):
-    if op == 0:
-        return
-    return logger.warning(
-        f'{hexrepr(op)} | Not found in the table')
+DEFAULT_FONTSET = '8JCQkPAgYCAgcPAQ8IDw8BDwEPCQkPAQEPCA8BDw8IDwkPDwECBAQPCQ8JDw8JDwEPDwkPCQkOCQ4JDg8ICAgPDgkJCQ4PCA8IDw8IDwgIA='
+
+
+# Why Emulator.run_cycles returned
+BUDGET = 'budget'      # the n cycles ran
+DRAW = 'draw'          # after a DXYN, with DRAW in stop_on
+KEY_WAIT = 'key_wait'  # after FX0A, or waiting for a key already
+HALT = 'halt'          # after 0FFF, with HALT in stop_on
+FAULT = 'fault'        # an instruction failed, the emulator was quit
+END = 'end'            # the pc went past the end of memory
+
+# Kinds of the opcodes which end a batch of run_cycles, or need a check
+_JUMP = 1
+_STACK = 2
+_STOPS = {DRAW: 3, KEY_WAIT: 4, HALT: 5}
+_REASONS = {code: reason for reason, code in _STOPS.items()}
+# (stop_on tuple, idle loops) -> opcode -> kind
+_stop_tables = {}
+
+
+def _stop_table(stop_on, idle):
+    key = (stop_on, idle)
+    table = _stop_tables.get(key)
+    if table is None:
+        stop_on = set(stop_on)
+        table = bytearray(65536)
+        table[0x2000:0x3000] = bytes([_STACK])*0x1000
+        table[0x00EE] = _STACK
+        if idle:
+            table[0x1000:0x2000] = bytes([_JUMP])*0x1000
+        if DRAW in stop_on:
+            table[0xD000:0xE000] = bytes([_STOPS[DRAW]])*0x1000
+        # Nothing runs until the key of FX0A arrives, whatever stop_on
+        for x in range(16):
+            table[0xF00A | (x << 8)] = _STOPS[KEY_WAIT]
+        if HALT in stop_on:
+            table[0x0FFF] = _STOPS[HALT]
+        table = _stop_tables[key] = bytes(table)
+    return table
+
+
+class Stop:
+    def __init__(self, reason, cycles):
+        # One of BUDGET, DRAW, KEY_WAIT, HALT, FAULT and END
+        self.reason = reason
+        # Cycles run, idle loop iterations skipped included
+        self.cycles = cycles
+
+    def __repr__(self):
+        return f'Stop({self.reason}, {self.cycles})'
+
+
+def parse_seed(seed):
+    """
+    The seed of the random numbers of CXNN from a setting, an integer or a
+    string of one, a random one if None. Raises ValueError for anything else.
+    """
+    if seed is None:
+        return random.getrandbits(32)
+    try:
+        if isinstance(seed, str):
+            seed = int(seed, 0)
+        elif isinstance(seed, bool) or not isinstance(seed, int):
+            raise ValueError
+    except ValueError:
+        raise ValueError(f'The seed must be an integer, got {seed!r}') from None
+    # Recordings, snapshots and save states store it on 64 bits
+    return seed & SEED_MASK
 
 
 def debugop(op, msg):
@@ -41,14 +102,36 @@ class Emulator:
         self.fontset = None
         self.font = None
         self.delay_timer = 0
-        # Stores the time elapsed, in milliseconds
-        self.accumulator = 0
-
-        self.keyboard_snap = [0 for i in range(16)]
+        # Random numbers of CXNN, a session is reproducible from its seed
+        self.seed = parse_seed(settings.get('seed'))
+        self.random = ByteRandom(self.seed)
+
+        # Keys held, bit k for key k, see keypad.py
+        self.keys = 0
+        # Register which receives the next key pressed after FX0A, None when
+        # not waiting. The front end completes the wait with key_pressed().
+        self.key_wait = None
+
+        # 64x32 display, one integer per row, bit 63 is the leftmost pixel.
+        # DXYN and 00E0 update it in place.
+        self.framebuffer = [0]*32
+        # Bit y is set when row y has changed since the front end last drew it.
+        self.dirty_rows = (1 << 32) - 1
 
         # External functions, related to graphics, input, etc.
         self.ext_functions = {}
-        self.op_table = {}
+        self.op_table = []
+        self.trace = False
+        # Counters of the profile setting, see profiler.py
+        self.profiler = None
+        # Addresses executed with the coverage setting, see coverage.py
+        self.coverage = None
+        # Called with (start, end) whenever a program or an opcode writes to memory.
+        self.memory_listeners = []
+        # IdleLoops skipped by run_cycles after the jumps, see idle.py
+        self.idle = None
+        # Snapshot reset() goes back to, see save_baseline()
+        self.baseline = None
         logger.info("Running Emulator...")
 
     def init_optable(self):
@@ -57,39 +140,32 @@ class Emulator:
         """
         # self.ext_functions.get('clear', notimpl)
 
-        # NOTE: To prevent exceptions, I have increased the size of the bytearray.
-        # self.emulator.graphic_memory = bytearray(64*32)
-        self.graphic_memory = bytearray(70*40)
-
-        self.op_table = {
-            0x0000: self.OP_KKK,
-            0x1000: self.OP_NNN,
-            0x2000: self.OP_NNN,
-            0x3000: self.OP_XNN,
-            0x4000: self.OP_XNN,
-            0x5000: self.OP_XYK,
-            0x6000: self.OP_XNN,
-            0x7000: self.OP_XNN,
-            0x8000: self.OP_XYK,
-            0x9000: self.OP_XYK,
-            0xA000: self.OP_NNN,
-            0xB000: self.OP_NNN,
-            0xC000: self.OP_XNN,
-            0xD000: self.OP_XYN,
-            0xE000: self.OP_XKK,
-            0xF000: self.OP_XKK,
-        }
-
-        # For OP_KKK
-        self.op_table_const = {
-            0x00E0: self.ext_functions.get('clear', notimpl),
-            0x00EE: self.OP_RETURN,
-            # Simple halt function, for debugging purpose
-            0x0FFF: self.ext_functions.get('halt', notimpl)
-        }
-
-        default_fontset = '8JCQkPAgYCAgcPAQ8IDw8BDwEPCQkPAQEPCA8BDw8IDwkPDwECBAQPCQ8JDw8JDwEPDwkPCQkOCQ4JDg8ICAgPDgkJCQ4PCA8IDw8IDwgIA='
-        default_font = base64.b64decode(default_fontset)
+        # Pre-decoded handlers for all 65536 opcodes, indexed by the opcode.
+        # The trace table logs every instruction, it is much slower.
+        # The profile table counts every instruction in self.profiler.
+        # The coverage table marks every address executed in self.coverage.
+        self.trace = bool(self.settings.get('trace'))
+        if self.settings.get('profile'):
+            if self.trace:
+                logger.warning('Profiling, instructions are not traced')
+                self.trace = False
+            if self.settings.get('coverage'):
+                logger.warning('Profiling, the coverage is not recorded')
+            self.profiler = Profiler()
+            self.op_table = profile_table()
+        elif self.settings.get('coverage'):
+            if self.trace:
+                logger.warning('Recording the coverage, instructions are not traced')
+                self.trace = False
+            self.coverage = Coverage()
+            self.op_table = coverage_table()
+        elif self.trace:
+            logger.info('Tracing every instruction')
+            self.op_table = trace_table()
+        else:
+            self.op_table = dispatch_table()
+
+        default_font = base64.b64decode(DEFAULT_FONTSET)
 
         fontset = self.settings.get('fontset')
         if fontset is None:
@@ -112,33 +188,128 @@ class Emulator:
         # TODO: Add checks for out of bounds memory access, i.e >= 4096
         logger.debug(array_of_bytes)
         self.memory[offset: offset + len(array_of_bytes)] = array_of_bytes
+        self.memory_written(offset, offset + len(array_of_bytes))
+
+    def memory_written(self, start, end):
+        for listener in self.memory_listeners:
+            listener(start, end)
 
     def execute_opcode(self, opcode):
         # logger.debug(f'{hexrepr(opcode)} | ')
         if not self.is_init:
             logger.error('Emulator not initialized ! Call init_optable()')
             self.quit(-5)
+            return
 
         self.pc_increment = 2
         try:
-            self.op_table.get(opcode & 0xF000, unknownop)(opcode)
-            self.pc += self.pc_increment
+            pc = self.pc
+            self.pc = self.op_table[opcode](self, pc)
+            # Amount added after the opcode has set the pc, i.e 0 for jumps and calls.
+            if opcode == 0x00EE:
+                self.pc_increment = 2
+            elif (opcode & 0xF000) in (0x1000, 0x2000, 0xB000):
+                self.pc_increment = 0
+            else:
+                self.pc_increment = self.pc - pc
         except Exception as e:
             logger.exception(
                 f'{hexrepr(opcode)} | Exception while executing this opcode\n')
             self.variable_dump()
             self.quit(exitcode=-4)
 
-    def update_delay_timer(self):
-        if self.delay_timer <= 0:
-            self.delay_timer = 0
-        else:
-            if self.accumulator >= 16.66:
-                self.accumulator -= 16.66
-                self.delay_timer -= 1
+    def pixel(self, x, y):
+        return (self.framebuffer[y] >> (63 - x)) & 1
+
+    def framebuffer_bytes(self):
+        """
+        The framebuffer as 256 bytes, 8 bytes per row, 1 bit per pixel.
+        """
+        return b''.join(row.to_bytes(8, 'big') for row in self.framebuffer)
+
+    def snapshot(self, base=None):
+        """
+        Returns the whole machine state as bytes, see snapshot.py.
+        With a base snapshot (a full one), returns a delta snapshot against it.
+        """
+        data = pack(self)
+        if base is not None:
+            return delta(data, base)
+        return data
+
+    def restore(self, data, base=None):
+        """
+        Restores a snapshot, a delta snapshot needs the base it was taken against.
+        Raises ValueError if the data is not a snapshot.
+        """
+        if check_header(data) & DELTA:
+            data = apply_delta(data, base)
+        unpack(self, data)
+        # The front end has to draw the restored screen
+        self.dirty_rows = (1 << 32) - 1
+        if self.memory_listeners:
+            self.memory_written(0, len(self.memory))
+
+    def save_baseline(self):
+        """
+        Captures the state reset() goes back to, call it once the font and
+        the rom are loaded
+        """
+        self.baseline = self.snapshot()
+
+    def reset(self, seed=None):
+        """
+        Puts the machine back in the state of save_baseline(): memory,
+        registers, timers, stack, keys and framebuffer, for about the cost of
+        copying the memory. The op table, the external functions and the
+        memory listeners are kept, the listeners are only told about the
+        memory if a program changed it since. With a seed the random numbers
+        of CXNN start over from it, else from where they were in the baseline.
+        Raises ValueError if there is no baseline.
+        """
+        if self.baseline is None:
+            raise ValueError('No baseline to reset to, call save_baseline() first')
+        changed = self.memory != memory_view(self.baseline)
+        unpack(self, self.baseline)
+        if seed is not None:
+            self.seed = parse_seed(seed)
+            self.random.seed(self.seed)
+        self.dirty_rows = (1 << 32) - 1
+        if changed and self.memory_listeners:
+            self.memory_written(0, len(self.memory))
+
+    def wait_for_key(self, x):
+        """
+        FX0A, V[x] receives the next key pressed
+        """
+        self.key_wait = x
 
-    def add_time(self, time_in_ms):
-        self.accumulator += time_in_ms
+    def key_pressed(self, key):
+        """
+        Completes the wait of FX0A with a key, returns False when not waiting
+        """
+        if self.key_wait is None:
+            return False
+        self.V[self.key_wait] = key
+        self.key_wait = None
+        return True
+
+    def key_held(self):
+        """
+        Completes the wait of FX0A with the lowest key held in keys, if any,
+        returns True when it did
+        """
+        if self.key_wait is None or not self.keys:
+            return False
+        return self.key_pressed(lowest_key(self.keys))
+
+    def tick_timers(self):
+        """
+        One tick of the 60 Hz timers, driven by the Scheduler on its cycle
+        schedule rather than by the time elapsed
+        """
+        if self.delay_timer > 0:
+            self.delay_timer -= 1
 
     def external(self, func_name):
         # This just uses the decorator pattern to add the function to the table
@@ -161,236 +332,10 @@ class Emulator:
         logger.info('-'*50)
         logger.info('Graphic memory')
         logger.info('-'*50)
-        logger.info('\n'.join(['']+[' '.join(['%s' % self.graphic_memory[y*64 + x]
-                                              for x in range(64)]) for y in range(32)]))
+        logger.info('\n'.join(['']+[' '.join(f'{row:064b}')
+                                     for row in self.framebuffer]))
         logger.info('-'*50)
 
-    def OP_KKK(self, op):
-        self.op_table_const.get(op, unknownop)(op)
-
-    def OP_NNN(self, op):
-        K = (op & 0xF000) >> 12
-        NNN = op & 0x0FFF
-        if K == 1:
-            logger.debug(
-                f'{hexrepr(self.pc)} | {hexrepr(op)} | JUMP {hexrepr(NNN)}')
-            # Jump to address
-            self.pc = op & NNN
-            # Already we have jumped, so stay at that position.
-            self.pc_increment = 0
-        if K == 2:
-            # Calls subroutine
-            logger.debug(
-                f'{hexrepr(self.pc)} | {hexrepr(op)} | CALL {hexrepr(NNN)}')
-            self.stack_pointer += 1
-            if(self.stack_pointer >= self.MAX_STACK_SIZE):
-                logger.critical('Stack overflow ! Maximum stack size reached')
-                self.variable_dump()
-                self.quit(exitcode=-2)
-            self.stack.append(self.pc)
-            self.pc = NNN
-            self.pc_increment = 0
-        if K == 0xA:
-            # Sets the value of I = NNN
-            logger.debug(
-                f'{hexrepr(self.pc)} | {hexrepr(op)} | I = {hexrepr(NNN)}')
-            self.I = NNN
-        if K == 0xB:
-            # PC = V0 + NNN
-            logger.debug(
-                f'{hexrepr(self.pc)} | {hexrepr(op)} | PC = V0 + {hexrepr(NNN)}')
-            self.pc = self.V[0] + NNN
-            self.pc_increment = 0
-
-    def OP_XKK(self, op):
-        S = (op & 0xF000) >> 12
-        X = (op & 0x0F00) >> 8
-        KK = (op & 0x00FF)
-
-        if S == 0xE:
-            if KK == 0x9E:
-                # Operation if key() == V[x], then skip the block.
-                if self.keyboard_snap[self.V[X]] == 1:
-                    self.pc_increment = 4
-            if KK == 0xA1:
-                # Operation if key() != V[x], then skip the block.
-                if self.keyboard_snap[self.V[X]] != 1:
-                    self.pc_increment = 4
-
-        if S == 0xF:
-            if KK == 0x1E:
-                logger.debug(f'{hexrepr(self.pc)} | {hexrepr(op)} | I += V{X}')
-                # Limit to 16 bits
-                self.I = (self.I + self.V[X]) & 0xFFFF
-
-            if KK == 0x29:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | I = sprite_addr(V[{X}])')
-                self.I = 5*self.V[X]
-
-            if KK == 0x33:
-                # Calculates BCD of value at register V[X]
-                # TODO: Check for edge cases, i.e when I = 4096
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | I{self.I}, I+1, I+2 = BCD(V{X})')
-                self.memory[self.I] = (self.V[X] // 100) % 10
-                self.memory[self.I+1] = (self.V[X] // 10) % 10
-                self.memory[self.I+2] = (self.V[X]) % 10
-
-            if KK == 0x55:
-                # Dumps V0 - VX to memory address I
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | Dump registers V0-V{X} to {self.I}')
-                for i in range(0, X+1):
-                    self.memory[self.I+i] = self.V[i]
-            if KK == 0x65:
-                # Loads V0 - VX from memory address I
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | Load registers V0-V{X} from {self.I}')
-                for i in range(0, X+1):
-                    self.V[i] = self.memory[self.I+i]
-
-            if KK == 7:
-                # Sets the delay timer value to V[x]
-                self.V[X] = int(self.delay_timer)
-            if KK == 15:
-                # Sets delay timer value
-                print('Setting')
-                self.delay_timer = self.V[X]
-
-            if KK == 0x0a:
-                # Halting operation, halt all operation until a key is pressed.
-                # If it is pressed store it in V[X]
-                self.settings['is_paused'] = True
-                self.settings['temp'] = X
-
-    def OP_XNN(self, op):
-        S = (op & 0xF000) >> 12
-        X = (op & 0x0F00) >> 8
-        NN = (op & 0x00FF)
-
-        if S == 3:
-            if self.V[X] == NN:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | IF V[{X}] == {NN} SKIP')
-                self.pc_increment = 4
-        if S == 4:
-            if self.V[X] != NN:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | IF V[{X}] != {NN} SKIP')
-                self.pc_increment = 4
-        if S == 6:
-            logger.debug(f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] = {NN}')
-            self.V[X] = NN
-        if S == 7:
-            logger.debug(
-                f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] = V[{X}] + {NN}')
-            self.V[X] = (self.V[X] + NN) & 0xff
-        if S == 0xC:
-            self.V[X] = random.randint(0, 255) & NN
-
-    def OP_XYK(self, op):
-        S = (op & 0xF000) >> 12
-        X = (op & 0x0F00) >> 8
-        Y = (op & 0x00F0) >> 4
-        K = (op & 0x000F)
-
-        if S == 5 and K == 0:
-            if self.V[X] == self.V[Y]:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | IF V[{X}] == V[{Y}] SKIP')
-                self.pc_increment = 4
-        if S == 9 and K == 0:
-            if self.V[X] != self.V[Y]:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | IF V[{X}] != V[{Y}] SKIP')
-                self.pc_increment = 4
-
-        if S == 8:
-            if K == 0:
-                # Assignment
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] = V[{Y}]')
-                self.V[X] = self.V[Y]
-            if K == 1:
-                # self.Vx = self.Vx | self.Vy
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] |= V[{Y}]')
-                self.V[X] = self.V[X] | self.V[Y]
-            if K == 2:
-                # self.Vx = self.Vx & self.Vy
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] &= V[{Y}]')
-                self.V[X] = self.V[X] & self.V[Y]
-            if K == 3:
-                # self.Vx = self.Vx ^ self.Vy
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] ^= V[{Y}]')
-                self.V[X] = self.V[X] ^ self.V[Y]
-            if K == 4:
-                # self.Vx = self.Vx + self.Vy
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] += V[{Y}]')
-                if ((self.V[X] + self.V[Y]) > 0xff):
-                    self.V[0xF] = 1
-                else:
-                    self.V[0xF] = 0
-                self.V[X] = (self.V[X] + self.V[Y]) & 0xFF
-            if K == 5:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] -= V[{Y}]')
-                # self.Vx = self.Vx - self.Vy
-                # logger.debug(
-                #    f'{self.V[X]}, {self.V[Y]} = {self.V[X]-self.V[Y]}')
-                if self.V[X] > self.V[Y]:
-                    self.V[0xF] = 0
-                    self.V[X] = self.V[X] - self.V[Y]
-                else:
-                    self.V[0xF] = 1
-                    self.V[X] = self.V[X] - self.V[Y] + 256
-
-            if K == 6:
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] >> 1')
-                # self.Vx = self.Vx >> 1
-                # Stores LSB in VF (for right shift)
-                self.V[0xF] = self.V[X] & 1
-                self.V[X] = self.V[X] >> 1
-            if K == 7:
-                # self.Vx = self.Vy- self.Vx
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{Y}] - V[{X}]')
-                if self.V[Y] > self.V[X]:
-                    self.V[0xF] = 0
-                    self.V[X] = self.V[Y] - self.V[X]
-                else:
-                    self.V[0xF] = 1
-                    self.V[X] = self.V[Y] - self.V[X] + 256
-            if K == 0xE:
-                # self.Vx = self.Vx << 1
-                # Stores MSB in VF
-                logger.debug(
-                    f'{hexrepr(self.pc)} | {hexrepr(op)} | V[{X}] << 1')
-                self.V[0xF] = (self.V[X] & 0b10000000) >> 7
-                # The result is masked with 0xFF (255) so that it remains within a byte.
-                self.V[X] = (self.V[X] << 1) & 0xFF
-
-    def OP_XYN(self, op):
-        # Opcode for drawing the sprite. DXYN
-        self.ext_functions.get('draw', notimpl)(op)
-
-    # Sub functions
-    def OP_RETURN(self, op):
-        try:
-            logger.debug('Return')
-            logger.debug(f'{hexrepr(self.pc)} | {hexrepr(op)} | Return')
-            self.stack_pointer -= 1
-            self.pc = self.stack.pop()
-        except Exception as e:
-            logger.exception('Illegal return statement')
-            self.variable_dump()
-            self.quit(exitcode=-3)
-
     def quit(self, exitcode=0):
         logger.info('Stopping emulator...')
         self.ext_functions.get('close', notimpl)(exitcode)
@@ -402,6 +347,9 @@ class Emulator:
                 logger.info(
                     'No more instructions to execute! Halting emulator')
                 return False
+            if self.key_wait is not None:
+                # FX0A, nothing runs until the key arrives
+                return True
 
             self.execute_opcode(
                 (self.memory[self.pc] << 8) | self.memory[self.pc+1])
@@ -413,6 +361,85 @@ class Emulator:
             self.quit(exitcode=-6)
             return False
 
+    def run_cycles(self, n, stop_on=()):
+        """
+        Executes up to n instructions in one call and returns a Stop, with
+        why it returned and the cycles run. It stops early after a fault,
+        at the end of memory, after an FX0A (nothing runs until the front
+        end completes the wait with key_pressed) and after the instructions
+        of stop_on, a tuple of DRAW (DXYN) and HALT (0FFF).
+        The pc, memory and op table are kept in locals and the instructions
+        run under a single try, the opcodes which may end the batch are
+        found in a table rather than checked one by one.
+        """
+        if not self.is_init:
+            logger.error('Emulator not initialized ! Call init_optable()')
+            self.quit(-5)
+            return Stop(FAULT, 0)
+        if self.key_wait is not None:
+            return Stop(KEY_WAIT, 0)
+        memory = self.memory
+        table = self.op_table
+        idle = self.idle
+        stops = _stop_table(stop_on, idle is not None)
+        pc = self.pc
+        at = pc
+        op = None
+        done = 0
+        reason = BUDGET
+        try:
+            while done < n:
+                at = pc
+                op = (memory[pc] << 8) | memory[pc + 1]
+                pc = table[op](self, pc)
+                done += 1
+                kind = stops[op]
+                if kind:
+                    if kind == _JUMP:
+                        # Nothing changes before the end of the batch, idle
+                        # loops are skipped
+                        self.pc = pc
+                        done += idle.skip(n - done)
+                        pc = self.pc
+                    elif kind == _STACK:
+                        # A stack overflow or an illegal return quit the emulator
+                        if not -1 <= self.stack_pointer < self.MAX_STACK_SIZE:
+                            reason = FAULT
+                            break
+                    else:
+                        reason = _REASONS[kind]
+                        break
+        except Exception as e:
+            if at >= 4096:
+                self.pc = at
+                logger.info('No more instructions to execute! Halting emulator')
+                return Stop(END, done)
+            if at == pc:
+                # Failed while fetching or executing, the pc stays on the instruction
+                self.pc = at
+                self.pc_increment = 2
+                if at == 4095:
+                    logger.exception('An error occured while fetching and executing opcode')
+                    self.variable_dump()
+                    self.quit(exitcode=-6)
+                    return Stop(FAULT, done)
+                logger.exception(
+                    f'{hexrepr(op)} | Exception while executing this opcode\n')
+                self.variable_dump()
+                self.quit(exitcode=-4)
+                return Stop(FAULT, done + 1)
+            raise
+        self.pc = pc
+        if op is not None:
+            # As execute_opcode would have set it for the last instruction
+            if op == 0x00EE:
+                self.pc_increment = 2
+            elif (op & 0xF000) in (0x1000, 0x2000, 0xB000):
+                self.pc_increment = 0
+            else:
+                self.pc_increment = pc - at
+        return Stop(reason, done)
+
 
 if __name__ == '__main__':
     e = Emulator(
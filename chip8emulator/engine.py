@@ -1,3 +1,12 @@
+import os
+import sys
+import json
+import hashlib
+import random
+
+from .log import create_logger, enable_queue, disable_queue, queue_stats
+logger = create_logger(__name__)
+
 try:
     import pygame
     from pygame.locals import *
@@ -6,13 +15,17 @@ except Exception as e:
     logger.critical("pygame is required to run this game. Exiting now")
     sys.exit(1)
 
-from .emulator import Emulator
-import os
-import sys
-import json
-
-from .log import create_logger
-logger = create_logger(__name__)
+from .emulator import Emulator, END, FAULT, HALT
+from .translator import BlockTranslator
+from .renderer import Renderer
+from .rewind import RewindBuffer
+from .recording import Recorder, frame_schedule
+from .headless import framebuffer_hash, fast_forward, load_analysis
+from .idle import IdleLoops
+from .coverage import report as coverage_report
+from .keypad import Keypad, DEFAULT_KEYMAP
+from .savestate import slot_path, save as save_state, load as load_state
+from .scheduler import Scheduler, FramePacer, TIMER_HZ
 
 
 # TODO: Make the config file loading, case independent.
@@ -34,6 +47,22 @@ DEFAULT = '''{
 	"tile_x": 64,
 	"tile_y": 32,
 	"speed": 10,
+	"cpu_hz": 0,
+	"execution_engine": "interpreter",
+	"idle_loops": "skip",
+	"analysis_cache": "cache/analysis",
+	"trace": false,
+	"save_dir": "saves",
+	"keymap": {
+		"1": "1", "2": "2", "3": "3", "4": "c",
+		"q": "4", "w": "5", "e": "6", "r": "d",
+		"a": "7", "s": "8", "d": "9", "f": "e",
+		"z": "a", "x": "0", "c": "b", "v": "f"
+	},
+	"log_queue": false,
+	"log_queue_size": 10000,
+	"rewind_memory_mb": 16,
+	"rewind_keyframe_interval": 60,
 	"fontset": "8JCQkPAgYCAgcPAQ8IDw8BDwEPCQkPAQEPCA8BDw8IDwkPDwECBAQPCQ8JDw8JDwEPDwkPCQkOCQ4JDg8ICAgPDgkJCQ4PCA8IDw8IDwgIA="
 }
 '''
@@ -49,6 +78,9 @@ FLAGS = {
     "SCALED": pygame.SCALED,
 }
 
+# F1 to F8 load the save state slots 1 to 8, with shift they save them
+SLOT_KEYS = {getattr(pygame, f'K_F{slot}'): slot for slot in range(1, 9)}
+
 
 def get_path(*args):
     """
@@ -66,13 +98,10 @@ class Engine:
 
     def __init__(self):
         logger.info("creating engine")
-        kc = pygame.key.key_code
-        self.keyboard = {
-            kc('1'): 1, kc('2'): 2, kc('3'): 3, kc('4'): 0xc,
-            kc('q'): 4, kc('w'): 5, kc('e'): 6, kc('r'): 0xd,
-            kc('a'): 7, kc('s'): 8, kc('d'): 9, kc('f'): 0xe,
-            kc('z'): 0xa, kc('x'): 0, kc('c'): 0xb, kc('v'): 0xf,
-        }
+        # Keys of the keypad held, from the key events, see init()
+        self.keypad = None
+        # Backspace held, rewinds
+        self.rewind_held = False
 
     def load_settings(self):
         '''
@@ -128,6 +157,9 @@ class Engine:
         self.settings['flag'] = flg
 
     def init(self):
+        if self.settings.get('log_queue'):
+            # The emulation thread only enqueues log records
+            enable_queue(self.settings.get('log_queue_size'))
         try:
             logger.info("Engine details")
             logger.info("Loaded Settings -")
@@ -143,6 +175,7 @@ class Engine:
             logger.info("Initializing pygame")
             pygame.init()
             logger.info("Initialized pygame")
+            self.keypad = Keypad(self.settings.get('keymap', DEFAULT_KEYMAP), pygame.key.key_code)
 
             logger.info("Initializing graphics")
             logger.info("Creating screen")
@@ -162,10 +195,6 @@ class Engine:
             logger.info("-"*50)
             logger.info("Initialized graphics")
 
-            logger.info("Creating clock")
-            self.clock = pygame.time.Clock()
-            logger.info("Created clock")
-
             logger.info("Creating emulator")
             self.create_emulator()
             self.tile_size = self.settings['tile_size']
@@ -173,8 +202,14 @@ class Engine:
             logger.info(f'Emulator version:{self.emulator.version}')
             logger.info("Created emulator")
 
-            self.settings['is_paused'] = False
-            self.to_draw = False
+            self.renderer = Renderer(self.screen)
+            self.rewind = RewindBuffer(
+                int(self.settings['rewind_memory_mb']*1024*1024),
+                self.settings['rewind_keyframe_interval'])
+
+            self.recorder = None
+            # Cycles run since the rom was loaded, as counted by headless.run
+            self.cycle = 0
         except Exception as e:
             logger.exception("An error occured while Initializing")
             self.quit(-1)
@@ -182,73 +217,21 @@ class Engine:
     def create_emulator(self):
         self.emulator = Emulator(self.settings)
 
-        @self.emulator.external('clear')
-        def clear_display(opcode):
-            logger.info('Clearing screen')
-            # self.screen.fill(pygame.Color('black'))
-
-            self.emulator.graphic_memory = bytearray(64*32)
-
         @self.emulator.external('close')
         def close(opcode):
             self.quit(exit_code=opcode)
 
-        @self.emulator.external('draw')
-        def draw(opcode):
-            X = (opcode & 0x0F00) >> 8
-            Y = (opcode & 0x00F0) >> 4
-            x = self.emulator.V[X]
-            y = self.emulator.V[Y]
-            N = (opcode & 0x000F)
-
-            self.screen.fill(pygame.Color('black'))
-            self.emulator.V[0xF] = 0
-            # Draws N+1 lines
-            for i in range(N):
-                line = self.emulator.memory[self.emulator.I + i]
-                self.setPixel((x + 0) % 64, (y+i) % 32, (line & 0x80) >> 7)
-                self.setPixel((x + 1) % 64, (y+i) % 32, (line & 0x40) >> 6)
-                self.setPixel((x + 2) % 64, (y+i) % 32, (line & 0x20) >> 5)
-                self.setPixel((x + 3) % 64, (y+i) % 32, (line & 0x10) >> 4)
-                self.setPixel((x + 4) % 64, (y+i) % 32, (line & 0x08) >> 3)
-                self.setPixel((x + 5) % 64, (y+i) % 32, (line & 0x04) >> 2)
-                self.setPixel((x + 6) % 64, (y+i) % 32, (line & 0x02) >> 1)
-                self.setPixel((x + 7) % 64, (y+i) % 32, (line & 0x01))
-            self.to_draw = True
-
         self.emulator.init_optable()
 
-    def setPixel(self, x, y, val):
-        #old_val = self.emulator.graphic_memory[y*64 + x]
-        #self.emulator.graphic_memory[y*64 + x] ^= val
-        # if val == 0:
-        #    return None
-        # if old_val == 1 and val == 1:
-        #    self.emulator.graphic_memory[y*64 + x] = 0
-        #    self.emulator.V[0xF] = 1
-        #    logger.warning('Flipped')
-        # if old_val == 0 and val == 1:
-        #    self.emulator.graphic_memory[y*64 + x] = 1
-        if val != 0:
-            if self.emulator.graphic_memory[y*64 + x] == 1:
-                self.emulator.V[0xF] = 1
-            self.emulator.graphic_memory[y*64 + x] ^= 1
-
-        #new_val = self.emulator.graphic_memory[y*64 + x]
-        # If any pixel changes from 1 to 0, set V[F] to 1
-        # if (new_val != old_val) and old_val == 1:
-        #    logger.warning('Flipped!')
-        #    self.emulator.V[0xF] = 1
-
-    def render_tiles(self):
-        if not self.to_draw:
-            return None
-        for x in range(64):
-            for y in range(32):
-                if self.emulator.graphic_memory[y*64 + x] != 0:
-                    pygame.draw.rect(self.screen, pygame.Color(
-                        'white'), (x*self.tile_size, y*self.tile_size, self.tile_size, self.tile_size))
-        self.to_draw = False
+        if self.settings.get('execution_engine') == 'translator':
+            logger.info('Using the basic block translator')
+            self.translator = BlockTranslator(self.emulator)
+        else:
+            self.translator = None
+            if fast_forward(self.emulator):
+                # Nothing changes before the end of a batch of the
+                # scheduler, idle loops are skipped
+                self.emulator.idle = IdleLoops(self.emulator)
 
     def run(self, rompath):
         """
@@ -262,80 +245,239 @@ class Engine:
         byt = bytearray()
         with open(rompath, 'rb') as rom:
             byt = bytearray(rom.read())
+        self.rom = bytes(byt)
+        # Save states are of this rom only
+        self.rom_hash = hashlib.sha256(self.rom).digest()
         pygame.display.set_caption(f'CHIP-8 interpreter ({rompath})')
         self.emulator.load_to_memory(byt)
+        # The state the restart key goes back to
+        self.emulator.save_baseline()
+        if self.translator is not None:
+            self.translator.prebuild(load_analysis(bytes(byt), self.settings))
+        cpu_hz = self.settings.get('cpu_hz') or self.settings['speed'] * TIMER_HZ
+        self.scheduler = Scheduler(cpu_hz)
+        self.pacer = FramePacer(self.settings['fps'])
+        if self.settings.get('record'):
+            # The clock, fps, rewind and restart are locked while recording, and
+            # every frame runs speed cycles on the schedule of the recording,
+            # as headless.run does, so that the session can be replayed
+            self.settings['speed'], self.scheduler = frame_schedule(cpu_hz, self.settings['fps'])
+            logger.info(f'Recording the session to {self.settings["record"]}, '
+                        f'seed {self.emulator.seed}, speed {self.settings["speed"]}')
+            self.recorder = Recorder(self.settings['record'], bytes(byt), self.emulator.seed,
+                                     self.settings['speed'], self.scheduler.cpu_hz,
+                                     self.scheduler.timer_hz)
+        logger.info(f'CPU clock {self.scheduler.cpu_hz} Hz, timers {self.scheduler.timer_hz} Hz')
+
+        def execute(n):
+            if self.emulator.key_wait is not None:
+                # Waiting for a key, the cycles pass anyway
+                return True
+            if self.translator is not None:
+                stop = self.translator.run(n, stop_on=(HALT,))
+            else:
+                stop = self.emulator.run_cycles(n, stop_on=(HALT,))
+            if stop.reason == HALT:
+                logger.info('Halted by 0FFF')
+            # Otherwise the rest of the n cycles pass, e.g waiting for a key
+            return stop.reason not in (END, FAULT, HALT)
+
         try:
             logger.info("Starting emulator....")
-            success = False
             while True:
                 # logger.debug(f'{self.emulator.pc}')
-                keys = pygame.key.get_pressed()
-                if keys[K_ESCAPE]:
-                    self.quit()
-
-                if not self.settings['is_paused']:
-                    for i in range(self.settings['speed']):
-                        for k, v in self.keyboard.items():
-                            self.emulator.keyboard_snap[v] = keys[k]
-                        success = self.emulator.execute_opcode_from_memory()
-                        if not success:
-                            self.emulator.quit()
-                            self.quit()
+                if self.can_block() and not self.rewind_held:
+                    self.wait_for_key()
+
+                # Host time since the last frame, turned into cycles below
+                elapsed = self.pacer.elapsed()
+                # Hold backspace to go back in time, one frame per frame
+                rewinding = self.rewind_held and self.recorder is None
+                if rewinding:
+                    self.rewind.step_back(self.emulator)
+                else:
+                    # The keys held at the start of the frame
+                    self.emulator.keys = self.keypad.mask
+                    if self.recorder is not None:
+                        self.recorder.keys(self.cycle, self.keypad.mask)
+                        cycles = self.settings['speed']
+                    else:
+                        cycles = self.scheduler.advance(elapsed)
+                    self.cycle += cycles
+                    if not self.scheduler.run(cycles, execute, self.emulator.tick_timers):
+                        self.emulator.quit()
+                        self.quit()
 
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
                         self.quit()
-                    if event.type == pygame.KEYDOWN:
+                    if event.type == pygame.VIDEOEXPOSE:
+                        self.renderer.invalidate()
+                    self.key_event(event)
+                    if event.type == pygame.KEYDOWN and event.key in SLOT_KEYS:
+                        self.slot_key(event)
+                    if event.type == pygame.KEYDOWN and self.recorder is not None:
+                        if event.key in (pygame.K_o, pygame.K_p, pygame.K_i, pygame.K_u, pygame.K_l):
+                            logger.warning('Speed, fps and restart are disabled while recording')
+                    elif event.type == pygame.KEYDOWN:
+                        # The speed is the CPU clock, the fps only the display
                         if event.key == pygame.K_o:
-                            self.settings['speed'] += 1
+                            self.scheduler.set_cpu_hz(self.scheduler.cpu_hz + TIMER_HZ)
+                            self.settings['cpu_hz'] = self.scheduler.cpu_hz
                             logger.info(
-                                f'Increasing speed by 1, New speed: {self.settings["speed"]}')
+                                f'Increasing speed, New CPU clock: {self.scheduler.cpu_hz} Hz')
                         if event.key == pygame.K_p:
-                            self.settings['speed'] -= 1
+                            self.scheduler.set_cpu_hz(self.scheduler.cpu_hz - TIMER_HZ)
+                            self.settings['cpu_hz'] = self.scheduler.cpu_hz
                             logger.info(
-                                f'Decreasing speed by 1, New speed: {self.settings["speed"]}')
+                                f'Decreasing speed, New CPU clock: {self.scheduler.cpu_hz} Hz')
                         if event.key == pygame.K_i:
                             self.settings['fps'] += 1
+                            self.pacer.fps = self.settings['fps']
                             logger.info(
                                 f'Increasing fps by 1, New fps: {self.settings["fps"]}')
-                        if event.key == pygame.K_u:
+                        if event.key == pygame.K_u and self.settings['fps'] > 1:
                             self.settings['fps'] -= 1
+                            self.pacer.fps = self.settings['fps']
                             logger.info(
                                 f'Decreasing fps by 1, New fps: {self.settings["fps"]}')
                         if event.key == pygame.K_l:
                             logger.info('Restarting emulator...')
-                            self.create_emulator()
-                            byt = bytearray()
-                            with open(rompath, 'rb') as rom:
-                                byt = bytearray(rom.read())
-                            self.emulator.load_to_memory(byt)
-
-                if self.settings['is_paused']:
-                    for k, v in self.keyboard.items():
-                        self.emulator.keyboard_snap[v] = keys[k]
-                    for i, k in enumerate(self.emulator.keyboard_snap):
-                        if k == 1:
-                            if self.settings.get('temp') is not None:
-                                self.emulator.V[self.settings.get('temp')] = i
-                                self.settings['is_paused'] = False
-                            break
-                # self.screen.fill(pygame.Color('black'))
-                self.render_tiles()
-
-                pygame.display.flip()
-                dt = self.clock.tick(self.settings['fps'])
-                self.emulator.add_time(dt)
-                self.emulator.update_delay_timer()
+                            # A new seed, as a new emulator would get
+                            seed = self.settings.get('seed')
+                            self.emulator.reset(random.getrandbits(32) if seed is None else seed)
+                            self.cycle = 0
+                            self.state_replaced()
+
+                # A key held at the end of the frame completes FX0A
+                self.emulator.key_held()
+                if not rewinding:
+                    self.rewind.push(self.emulator)
+                # Only flip when a row of the framebuffer has changed, frames
+                # are skipped while the host is behind.
+                if self.pacer.present_due() and self.renderer.present(self.emulator):
+                    pygame.display.flip()
+                self.pacer.wait()
         except Exception as e:
             logger.exception(
                 f"An error occured while running the emulator!")
 
+    def state_replaced(self):
+        """
+        Call after the state of the emulator was replaced, by a restart or a
+        save state: redraws the screen and forgets the rewind history
+        """
+        self.renderer.invalidate()
+        self.rewind.clear()
+        if self.translator is not None:
+            # Compiles again the blocks the program overwrote, if any
+            self.translator.prebuild(load_analysis(self.rom, self.settings))
+
+    def slot_key(self, event):
+        """
+        Shift+F1 to F8 save the state to the slots 1 to 8, F1 to F8 load it
+        """
+        slot = SLOT_KEYS[event.key]
+        path = slot_path(self.settings['save_dir'], self.rom_hash, slot)
+        if event.mod & KMOD_SHIFT:
+            try:
+                save_state(path, self.emulator, self.rom_hash, slot, self.cycle)
+                logger.info(f'Saved the state to slot {slot} ({path})')
+            except OSError as e:
+                logger.warning(f'Unable to save the state to slot {slot}: {e}')
+        elif self.recorder is not None:
+            logger.warning('Loading a state is disabled while recording')
+        else:
+            try:
+                info = load_state(path, self.emulator, self.rom_hash)
+            except FileNotFoundError:
+                logger.info(f'Slot {slot} is empty')
+            except (OSError, ValueError) as e:
+                logger.warning(f'Unable to load the state of slot {slot}: {e}')
+            else:
+                self.cycle = info.cycle
+                self.state_replaced()
+                logger.info(f'Loaded the state of slot {slot}')
+
+    def can_block(self):
+        """
+        True when the emulator waits for a key (FX0A) and nothing it can see
+        changes until then, so that the engine can sleep until the key
+        """
+        return (self.emulator.key_wait is not None and not self.emulator.delay_timer
+                and self.recorder is None)
+
+    def wait_for_key(self):
+        """
+        Sleeps until a key of the keypad is pressed, which completes FX0A, or
+        until an event the main loop has to handle. Only redraws on expose.
+        """
+        logger.debug('Waiting for a key')
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                self.quit()
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.renderer.invalidate()
+                if self.renderer.present(self.emulator):
+                    pygame.display.flip()
+            elif event.type == pygame.KEYDOWN:
+                key = self.key_event(event)
+                if key is not None:
+                    self.emulator.keys = self.keypad.mask
+                    self.emulator.key_pressed(key)
+                else:
+                    # Speed, restart, ... for the main loop
+                    pygame.event.post(event)
+                break
+            else:
+                self.key_event(event)
+        # The time asleep is not emulated
+        self.pacer.reset()
+
+    def key_event(self, event):
+        """
+        Keeps the keypad, escape and backspace up to date from an event,
+        returns the keypad key pressed if any
+        """
+        if event.type == pygame.KEYDOWN:
+            if event.key == K_ESCAPE:
+                self.quit()
+            if event.key == K_BACKSPACE:
+                self.rewind_held = True
+            return self.keypad.key_down(event.key)
+        if event.type == pygame.KEYUP:
+            if event.key == K_BACKSPACE:
+                self.rewind_held = False
+            self.keypad.key_up(event.key)
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            self.keypad.release_all()
+            self.rewind_held = False
+        return None
+
     def quit(self, exit_code=0):
         logger.info(
             f"Exiting....")
         self.emulator.variable_dump()
         logger.info('Keyboard State')
-        logger.info(self.emulator.keyboard_snap)
+        logger.info(f'{self.emulator.keys:016b}')
+        if getattr(self, 'recorder', None) is not None:
+            self.recorder.close(self.cycle, framebuffer_hash(self.emulator))
+        if self.emulator.profiler is not None:
+            prefix = self.settings['profile']
+            self.emulator.profiler.write_json(f'{prefix}.json')
+            self.emulator.profiler.write_collapsed(f'{prefix}.folded')
+            logger.info(f'Profile written to {prefix}.json and {prefix}.folded')
+        if self.emulator.coverage is not None and getattr(self, 'rom', None) is not None:
+            path = self.settings['coverage']
+            with open(path, 'w') as f:
+                f.write(coverage_report(self.emulator.coverage, self.rom))
+            logger.info(f'Coverage written to {path}')
+        stats = queue_stats()
+        if stats is not None:
+            logger.info(f'Log queue: {stats["enqueued"]} records, {stats["dropped"]} dropped, '
+                        f'at most {stats["max_depth"]} waiting')
+            disable_queue()
 
         pygame.quit()
         sys.exit(exit_code)
@@ -0,0 +1,177 @@
+"""
+Coverage guided input exerciser, finds key presses which reach more of the
+code of a rom.
+
+    python -m chip8emulator.exerciser roms/PONG roms/BRIX --rounds 20 --out coverage
+
+Every rom starts from a corpus holding one input, no key at all. A round
+runs population mutants of inputs of the corpus on the farm (see farm.py)
+with the coverage setting, and adds to the corpus the inputs which executed
+an address, or took a skip a way, that no input of the corpus did. CXNN is
+seeded the same for every run, so a new address is due to the keys.
+
+An input is a list of key presses (first cycle, number of cycles, key), the
+mutations add, drop, move, stretch a press or change its key. At the end
+the coverage report of every rom is written to DIR/ROM.coverage.txt, and the
+inputs of its corpus to DIR/ROM.inputs/N.txt, scripts for the --input option
+of headless.py.
+"""
+import argparse
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from . import farm, headless
+from .coverage import Coverage, report
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+# A press lasts 1 to MAX_PRESS_FRAMES frames
+MAX_PRESS_FRAMES = 30
+
+
+def to_script(presses):
+    """
+    The (cycle, key mask) events of the input script of a list of presses
+    """
+    changes = set()
+    for start, length, key in presses:
+        changes.add(start)
+        changes.add(start + length)
+    script = []
+    mask = 0
+    for cycle in sorted(changes):
+        held = 0
+        for start, length, key in presses:
+            if start <= cycle < start + length:
+                held |= 1 << key
+        if held != mask:
+            script.append((cycle, held))
+            mask = held
+    return script
+
+
+def mutate(presses, rng, cycles, speed):
+    """
+    A copy of presses with one to three mutations
+    """
+    presses = list(presses)
+    for _ in range(rng.randint(1, 3)):
+        choice = rng.randrange(5) if presses else 0
+        if choice == 0:
+            presses.append((rng.randrange(cycles), rng.randint(1, MAX_PRESS_FRAMES) * speed,
+                            rng.randrange(16)))
+            continue
+        i = rng.randrange(len(presses))
+        start, length, key = presses[i]
+        if choice == 1:
+            del presses[i]
+        elif choice == 2:
+            start = min(max(0, start + rng.randint(-MAX_PRESS_FRAMES, MAX_PRESS_FRAMES) * speed),
+                        cycles - 1)
+            presses[i] = (start, length, key)
+        elif choice == 3:
+            presses[i] = (start, rng.randint(1, MAX_PRESS_FRAMES) * speed, key)
+        else:
+            presses[i] = (start, length, rng.randrange(16))
+    presses.sort()
+    return presses
+
+
+class Target:
+    def __init__(self, name, rom):
+        self.name = name
+        # The rom as bytes
+        self.rom = bytes(rom)
+        # Everything the inputs of the corpus ran
+        self.coverage = Coverage()
+        # Lists of presses, each of them ran something the others did not
+        self.corpus = []
+        self.runs = 0
+
+
+def exercise(targets, rounds=10, population=16, cycles=20000, settings=None,
+             workers=None, seed=0, on_round=None):
+    """
+    Grows the corpus and coverage of every Target. on_round(round, targets)
+    is called after each round, round 0 runs the empty input.
+    """
+    settings = dict(settings or {}, coverage=True)
+    speed = dict(headless.DEFAULT_SETTINGS, **settings)['speed']
+    rng = random.Random(seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for round in range(rounds + 1):
+            jobs = []
+            inputs = []
+            for target in targets:
+                for _ in range(population if round else 1):
+                    presses = mutate(rng.choice(target.corpus), rng, cycles, speed) if round else []
+                    jobs.append(farm.Job(target.rom, settings=settings, script=to_script(presses),
+                                         cycles=cycles, name=target.name, seed=seed))
+                    inputs.append((target, presses))
+            # In the order of the jobs, so the corpus does not depend on
+            # which worker finished first
+            results = sorted(farm.run_jobs(jobs, pool=pool), key=lambda result: result.index)
+            for result in results:
+                target, presses = inputs[result.index]
+                target.runs += 1
+                if result.coverage is None:
+                    logger.warning(f'{target.name}: {result.error}')
+                    continue
+                if target.coverage.merge(result.coverage) or not target.corpus:
+                    target.corpus.append(presses)
+            if on_round is not None:
+                on_round(round, targets)
+    return targets
+
+
+def write_results(target, directory):
+    name = os.path.join(directory, target.name)
+    with open(f'{name}.coverage.txt', 'w') as f:
+        f.write(report(target.coverage, target.rom))
+    os.makedirs(f'{name}.inputs', exist_ok=True)
+    for i, presses in enumerate(target.corpus):
+        with open(os.path.join(f'{name}.inputs', f'{i}.txt'), 'w') as f:
+            f.write(headless.format_input_script(to_script(presses)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.exerciser',
+        description='Searches for key presses which run more of the code of roms.')
+    parser.add_argument('roms', nargs='+', metavar='ROM')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--population', type=int, default=16,
+                        help='runs per rom and round')
+    parser.add_argument('--cycles', type=int, default=20000,
+                        help='cycles per run')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--settings', help='settings json file')
+    parser.add_argument('--out', metavar='DIR', default='coverage')
+    args = parser.parse_args(argv)
+
+    targets = []
+    for path in args.roms:
+        if not os.path.isfile(path):
+            logger.error(f'{path} is not a file, skipping')
+            continue
+        with open(path, 'rb') as rom:
+            targets.append(Target(os.path.basename(path), rom.read()))
+
+    def on_round(round, targets):
+        print(f'round {round}: ' + ', '.join(
+            f'{target.name} {target.coverage.counts()[0]} addresses, {len(target.corpus)} inputs'
+            for target in targets))
+
+    exercise(targets, args.rounds, args.population, args.cycles,
+             headless.load_settings(args.settings), args.workers, args.seed, on_round)
+    os.makedirs(args.out, exist_ok=True)
+    for target in targets:
+        write_results(target, args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Runs many roms (or rom variants) on headless emulators in a process pool.
+
+    for result in farm.run_jobs([farm.Job(rom_bytes, cycles=100000), ...]):
+        print(result.name, result.reason, result.framebuffer_hash)
+
+Results are yielded as soon as each job finishes. Every worker process keeps
+its initialized emulators and resets them between jobs, instead of building
+a new emulator (and decoding the font) for every job.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import headless
+from .coverage import Coverage
+from .profiler import Profiler
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+
+class Job:
+    def __init__(self, rom, settings=None, script=None, cycles=None, seconds=None,
+                 timer_hz=60, snapshots=(), name=None, seed=None):
+        # The rom as bytes
+        self.rom = bytes(rom)
+        self.settings = dict(headless.DEFAULT_SETTINGS, **(settings or {}))
+        # List of (cycle, key mask), see headless.load_input_script
+        self.script = list(script or [])
+        self.cycles = cycles
+        self.seconds = seconds
+        self.timer_hz = timer_hz
+        # Cycles after which a copy of the framebuffer (framebuffer_bytes) is taken
+        self.snapshots = sorted(snapshots)
+        self.name = name
+        # Seed for the random numbers of CXNN, the job is reproducible if set
+        self.seed = seed
+
+
+class JobResult:
+    def __init__(self, index, name, reason, instructions=0, cycles=0, frames=0,
+                 elapsed=0.0, framebuffer_hash=None, snapshots=None, error=None, pid=None,
+                 coverage=None, profiler=None):
+        # Position of the job in the list passed to run_jobs
+        self.index = index
+        self.name = name
+        # cycles, time, halt, close, end or error
+        self.reason = reason
+        self.instructions = instructions
+        self.cycles = cycles
+        self.frames = frames
+        self.elapsed = elapsed
+        self.framebuffer_hash = framebuffer_hash
+        # {cycle: framebuffer bytes}
+        self.snapshots = snapshots or {}
+        self.error = error
+        self.pid = pid
+        # Addresses executed with the coverage setting, see coverage.py
+        self.coverage = coverage
+        # Counters of the job with the profile setting, see profiler.py
+        self.profiler = profiler
+
+
+# Emulators of this worker process, by fontset and op table, with their
+# baseline right after the font was loaded.
+_emulators = {}
+
+
+def _get_emulator(settings, seed=None):
+    key = (settings.get('fontset'), bool(settings.get('trace')), bool(settings.get('profile')),
+           bool(settings.get('coverage')))
+    if key not in _emulators:
+        emulator = headless.create_emulator(dict(settings))
+        emulator.save_baseline()
+        _emulators[key] = emulator
+    emulator = _emulators[key]
+
+    # Reset the machine, keeping the op table, the font and the callbacks.
+    # The translator and idle loops of the last job are dropped first.
+    emulator.settings = dict(settings)
+    emulator.memory_listeners = []
+    emulator.idle = None
+    if seed is None:
+        seed = settings.get('seed')
+    emulator.reset(random.getrandbits(32) if seed is None else seed)
+    # Counters of this job only
+    if emulator.profiler is not None:
+        emulator.profiler = Profiler()
+    if emulator.coverage is not None:
+        emulator.coverage = Coverage()
+    emulator.exit_reason = None
+    emulator.exit_code = None
+    return emulator
+
+
+def run_job(index, job):
+    """
+    Runs a single job in the current process.
+    """
+    snapshots = {}
+    pending = list(job.snapshots)
+
+    def on_frame(emulator, cycle):
+        while pending and pending[0] <= cycle:
+            snapshots[pending.pop(0)] = emulator.framebuffer_bytes()
+
+    try:
+        emulator = _get_emulator(job.settings, job.seed)
+        emulator.load_to_memory(job.rom)
+        result = headless.run(emulator, cycles=job.cycles, seconds=job.seconds,
+                              timer_hz=job.timer_hz, script=job.script,
+                              rom=job.name, on_frame=on_frame if pending else None,
+                              analysis=headless.load_analysis(job.rom, job.settings))
+    except Exception as e:
+        logger.exception(f'Job {index} ({job.name}) failed')
+        return JobResult(index, job.name, 'error', error=repr(e), pid=os.getpid())
+    return JobResult(index, job.name, result.reason, result.instructions, result.cycles,
+                     result.frames, result.elapsed, result.framebuffer_hash,
+                     snapshots, pid=os.getpid(), coverage=result.coverage,
+                     profiler=result.profiler)
+
+
+def run_jobs(jobs, workers=None, pool=None):
+    """
+    Runs the jobs on a pool of worker processes (os.cpu_count() by default),
+    yields a JobResult for every job as soon as it finishes.
+    With a pool (a ProcessPoolExecutor) the jobs run on it instead, which
+    keeps its workers and their emulators from one call to the next.
+    """
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from run_jobs(jobs, pool=pool)
+        return
+    futures = [pool.submit(run_job, index, job)
+               for index, job in enumerate(jobs)]
+    for future in as_completed(futures):
+        yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.farm',
+        description='Runs every rom a number of times on a process pool.')
+    parser.add_argument('roms', nargs='+', metavar='ROM')
+    parser.add_argument('--cycles', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='number of jobs per rom')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for path in args.roms:
+        with open(path, 'rb') as rom:
+            data = rom.read()
+        for i in range(args.repeat):
+            jobs.append(Job(data, cycles=args.cycles,
+                            name=os.path.basename(path), seed=i))
+
+    start = time.perf_counter()
+    instructions = 0
+    for result in run_jobs(jobs, args.workers):
+        instructions += result.instructions
+        print(f'{result.name:<24}{result.reason:>7}{result.instructions:>12}'
+              f'  {result.framebuffer_hash}')
+    elapsed = time.perf_counter() - start
+    print(f'{len(jobs)} jobs, {instructions / elapsed:.0f} instructions/sec in total')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
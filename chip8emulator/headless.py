@@ -0,0 +1,324 @@
+"""
+Runs roms without pygame or a display.
+
+    python -m chip8emulator.headless [options] ROM [ROM ...]
+
+Every rom is run for a cycle budget (or a wall clock budget) and at the end
+the instructions/sec, the number of frames emulated and a hash of the final
+framebuffer are printed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from .emulator import Emulator, END, FAULT, HALT
+from .scheduler import Scheduler, TIMER_HZ
+from .translator import BlockTranslator
+from .idle import IdleLoops
+from .analysis import load as load_cached_analysis
+from .coverage import report as coverage_report
+from .log import create_logger, enable_queue
+
+logger = create_logger(__name__)
+
+DEFAULT_SETTINGS = {
+    'speed': 10,
+    'execution_engine': 'interpreter',
+}
+
+
+def create_emulator(settings):
+    """
+    Creates an emulator with the close and halt external functions recording
+    why the emulator stopped. The emulator draws into its own framebuffer.
+    """
+    emulator = Emulator(settings)
+    emulator.exit_reason = None
+    emulator.exit_code = None
+
+    @emulator.external('close')
+    def close(exitcode):
+        emulator.exit_reason = 'close'
+        emulator.exit_code = exitcode
+
+    @emulator.external('halt')
+    def halt(opcode):
+        emulator.exit_reason = 'halt'
+
+    emulator.init_optable()
+    return emulator
+
+
+def fast_forward(emulator):
+    """
+    True when the idle loops of the emulator can be skipped, which they are
+    unless the idle_loops setting is 'run', or every instruction is traced
+    or profiled
+    """
+    return (emulator.settings.get('idle_loops', 'skip') == 'skip' and
+            not emulator.trace and emulator.profiler is None)
+
+
+def framebuffer_hash(emulator):
+    """
+    SHA-1 of the 64x32 framebuffer, packed 1 bit per pixel.
+    """
+    return hashlib.sha1(emulator.framebuffer_bytes()).hexdigest()
+
+
+def load_input_script(path):
+    """
+    Loads a scripted input file.
+    Each line is "<cycle> <keys>", where keys are the hex digits of the keys
+    held from that cycle on, or "-" for no keys. Lines starting with # are
+    comments. Returns a sorted list of (cycle, 16 bit key mask).
+    """
+    events = []
+    with open(path) as script:
+        for number, line in enumerate(script, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                cycle, keys = line.split()
+                mask = 0
+                if keys != '-':
+                    for key in keys:
+                        mask |= 1 << int(key, 16)
+                events.append((int(cycle), mask))
+            except ValueError:
+                raise ValueError(f'{path}:{number}: invalid input "{line}"')
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def format_input_script(events):
+    """
+    The text of a scripted input file (see load_input_script) from a list of
+    (cycle, 16 bit key mask)
+    """
+    lines = []
+    for cycle, mask in events:
+        keys = ''.join(f'{key:x}' for key in range(16) if mask >> key & 1)
+        lines.append(f'{cycle} {keys or "-"}')
+    return '\n'.join(lines) + '\n'
+
+
+class Result:
+    def __init__(self, rom, reason, instructions, cycles, frames, elapsed, framebuffer_hash,
+                 profiler=None, coverage=None, skipped=0):
+        self.rom = rom
+        # Why the run stopped: cycles, time, halt, close or end
+        self.reason = reason
+        # Instructions of the program, the iterations of idle loops skipped
+        # (see idle.py) included, as if they had run
+        self.instructions = instructions
+        # Of those, the ones skipped instead of being run
+        self.skipped = skipped
+        # Cycles emulated, the ones waiting for a key included
+        self.cycles = cycles
+        self.frames = frames
+        self.elapsed = elapsed
+        self.framebuffer_hash = framebuffer_hash
+        # Counters of the run with the profile setting, see profiler.py
+        self.profiler = profiler
+        # Addresses executed with the coverage setting, see coverage.py
+        self.coverage = coverage
+
+    @property
+    def executed(self):
+        """
+        Instructions the host actually ran
+        """
+        return self.instructions - self.skipped
+
+    @property
+    def instructions_per_second(self):
+        """
+        Instructions actually run per second, the speed of the emulator
+        """
+        return self.executed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def emulated_per_second(self):
+        """
+        Instructions of the program per second, skipped ones included, the
+        speed the program sees
+        """
+        return self.instructions / self.elapsed if self.elapsed else 0.0
+
+
+def run(emulator, cycles=None, seconds=None, timer_hz=TIMER_HZ, script=None, rom='',
+        on_frame=None, analysis=None, cpu_hz=None):
+    """
+    Runs the emulator frame by frame like Engine.run, without pacing.
+    A frame is settings['speed'] cycles, the keys are sampled at the start of
+    each frame. The timers tick timer_hz times per second of a CPU at cpu_hz
+    (settings['cpu_hz'], else speed * 60), on the integer schedule of the
+    Engine (see scheduler.py).
+    Cycles also pass while the emulator waits for a key, so the cycle budget
+    and the input script are independent of the program.
+    on_frame(emulator, cycle) is called at the end of every frame.
+    With the translator, the static analysis of the rom (see analysis.py)
+    compiles its code before it starts.
+    """
+    settings = emulator.settings
+    speed = settings['speed']
+    translator = None
+    emulator.idle = None
+    if settings.get('execution_engine') == 'translator':
+        translator = BlockTranslator(emulator)
+        if analysis is not None:
+            translator.prebuild(analysis)
+    elif fast_forward(emulator):
+        emulator.idle = IdleLoops(emulator)
+    script = list(script or [])
+    next_event = 0
+    scheduler = Scheduler(cpu_hz or settings.get('cpu_hz') or speed * TIMER_HZ, timer_hz)
+
+    cycle = 0
+    instructions = 0
+    frames = 0
+    reason = None
+    # Set when the machine stopped in the current frame, its other cycles pass
+    stopped = False
+
+    def execute(n):
+        nonlocal instructions, reason, stopped
+        if emulator.key_wait is not None or stopped:
+            return True
+        if translator is not None:
+            stop = translator.run(n, stop_on=(HALT,))
+        else:
+            stop = emulator.run_cycles(n, stop_on=(HALT,))
+        instructions += stop.cycles
+        if stop.reason == END:
+            reason = 'end'
+        # A halt or a fault ends the frame early, exit_reason ends the run
+        stopped = stop.reason in (END, FAULT, HALT)
+        return True
+
+    start = time.perf_counter()
+    deadline = start + seconds if seconds is not None else None
+    while reason is None:
+        if cycles is not None and cycle >= cycles:
+            reason = 'cycles'
+            break
+        if deadline is not None and time.perf_counter() >= deadline:
+            reason = 'time'
+            break
+
+        while next_event < len(script) and script[next_event][0] <= cycle:
+            emulator.keys = script[next_event][1]
+            next_event += 1
+
+        budget = speed if cycles is None else min(speed, cycles - cycle)
+        stopped = False
+        scheduler.run(budget, execute, emulator.tick_timers)
+        cycle += budget
+
+        # A key held at the end of the frame completes FX0A
+        emulator.key_held()
+        frames += 1
+        if on_frame is not None:
+            on_frame(emulator, cycle)
+        if emulator.exit_reason is not None:
+            reason = emulator.exit_reason
+
+    elapsed = time.perf_counter() - start
+    skipped = emulator.idle.skipped if emulator.idle is not None else 0
+    return Result(rom, reason, instructions, cycle, frames, elapsed,
+                  framebuffer_hash(emulator), emulator.profiler, emulator.coverage, skipped)
+
+
+def load_settings(path=None):
+    settings = dict(DEFAULT_SETTINGS)
+    if path is not None:
+        with open(path) as settings_file:
+            settings.update(
+                {k: v for k, v in json.load(settings_file).items() if v})
+    return settings
+
+
+def load_analysis(rom, settings):
+    """
+    The static analysis of a rom when the translator can use it, cached in
+    the analysis_cache directory if set
+    """
+    if settings.get('execution_engine') != 'translator':
+        return None
+    return load_cached_analysis(rom, settings.get('analysis_cache') or None)
+
+
+def run_rom(path, settings, **kwargs):
+    with open(path, 'rb') as rom:
+        data = bytearray(rom.read())
+    emulator = create_emulator(dict(settings))
+    emulator.load_to_memory(data)
+    return run(emulator, rom=path, analysis=load_analysis(data, settings), **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.headless',
+        description='Runs CHIP-8 roms without a display.')
+    parser.add_argument('roms', nargs='+', metavar='ROM')
+    parser.add_argument('--cycles', type=int,
+                        help='number of cycles to run each rom for')
+    parser.add_argument('--seconds', type=float,
+                        help='wall clock time to run each rom for')
+    parser.add_argument('--cpu-hz', type=int,
+                        help='emulated instructions per second, default the cpu_hz setting or speed * 60')
+    parser.add_argument('--timer-hz', type=int, default=TIMER_HZ,
+                        help='delay timer ticks per emulated second, default 60')
+    parser.add_argument('--input', help='scripted input file')
+    parser.add_argument('--settings', help='settings json file')
+    parser.add_argument('--log-queue', action='store_true',
+                        help='format and write the logs on a background thread')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='write the profile of each rom to DIR/ROM.json and DIR/ROM.folded')
+    parser.add_argument('--coverage', metavar='DIR',
+                        help='write the disassembly of each rom with what ran to DIR/ROM.coverage.txt')
+    args = parser.parse_args(argv)
+
+    if args.cycles is None and args.seconds is None:
+        parser.error('specify a budget with --cycles and/or --seconds')
+
+    if args.log_queue:
+        enable_queue()
+    settings = load_settings(args.settings)
+    if args.profile:
+        settings['profile'] = True
+        os.makedirs(args.profile, exist_ok=True)
+    if args.coverage:
+        settings['coverage'] = True
+        os.makedirs(args.coverage, exist_ok=True)
+    script = load_input_script(args.input) if args.input else None
+
+    print(f'{"rom":<24}{"exit":>7}{"instructions":>14}{"executed":>12}{"inst/sec":>12}'
+          f'{"frames":>9}  framebuffer')
+    for path in args.roms:
+        if not os.path.isfile(path):
+            logger.error(f'{path} is not a file, skipping')
+            continue
+        result = run_rom(path, settings, cycles=args.cycles, seconds=args.seconds,
+                         timer_hz=args.timer_hz, cpu_hz=args.cpu_hz, script=script)
+        if args.profile:
+            name = os.path.join(args.profile, os.path.basename(path))
+            result.profiler.write_json(f'{name}.json')
+            result.profiler.write_collapsed(f'{name}.folded')
+        if args.coverage and result.coverage is not None:
+            with open(path, 'rb') as rom:
+                text = coverage_report(result.coverage, rom.read())
+            with open(os.path.join(args.coverage, f'{os.path.basename(path)}.coverage.txt'),
+                      'w') as report:
+                report.write(text)
+        print(f'{os.path.basename(path):<24}{result.reason:>7}{result.instructions:>14}'
+              f'{result.executed:>12}{result.instructions_per_second:>12.0f}{result.frames:>9}  {result.framebuffer_hash}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
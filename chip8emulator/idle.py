@@ -0,0 +1,123 @@
+"""
+Fast-forwards idle loops, e.g a jump to itself or a delay timer poll
+
+    0x300 FX07        V[X] = delay_timer
+    0x302 3X00        IF V[X] == 0 SKIP
+    0x304 1300        JUMP 0x300
+
+Nothing can change inside such a loop until the next event: a timer tick,
+the keys being sampled or the end of the frame, which are all at the end of
+the cycle budget the front end runs at once. So when the interpreter jumps
+back to the head of a short loop which only reads and writes registers
+(see loop_opcode), one iteration is run and if it left the registers as they
+were, the loop would do the same until the event: the whole iterations
+which fit in the budget are skipped instead of being run. The emulator ends
+up exactly where it would have been, only sooner.
+"""
+
+# Longest loop looked for, in instructions
+MAX_LOOP = 16
+
+
+def loop_opcode(op):
+    """
+    True for the opcodes which may be in an idle loop, the ones which only
+    change V, I and the pc. EX9E and EXA1 (with V[X] > 0xF) and FX65 (with I
+    near the end of memory) can fault, see IdleLoops.skip.
+    """
+    S = op >> 12
+    K = op & 0x000F
+    if S in (0x3, 0x4, 0x6, 0x7, 0xA):
+        return True
+    if S in (0x5, 0x9):
+        return K == 0
+    if S == 0x8:
+        # 8XY5 and 8XY7 can fault
+        return K in (0x0, 0x1, 0x2, 0x3, 0x4, 0x6, 0xE)
+    if S == 0xE:
+        return op & 0xFF in (0x9E, 0xA1)
+    if S == 0xF:
+        return op & 0xFF in (0x07, 0x1E, 0x29, 0x65)
+    return False
+
+
+class IdleLoops:
+    def __init__(self, emulator):
+        self.emulator = emulator
+        # Loop head -> (length in instructions, address of the closing jump),
+        # the length is 0 when there is no idle loop there, up to that address
+        self.loops = {}
+        self.skipped = 0
+        emulator.memory_listeners.append(self.memory_written)
+
+    def memory_written(self, start, end):
+        loops = self.loops
+        for head in [head for head, (length, last) in loops.items()
+                     if head < end and last + 2 > start]:
+            del loops[head]
+
+    def scan(self, head):
+        """
+        The loop starting at head, up to the first jump back to it, as
+        (length, address of the jump), or (0, last address read)
+        """
+        memory = self.emulator.memory
+        addr = head
+        for i in range(MAX_LOOP):
+            addr = head + 2 * i
+            if addr > 4094:
+                break
+            op = (memory[addr] << 8) | memory[addr + 1]
+            if op == 0x1000 | head:
+                return i + 1, addr
+            if not loop_opcode(op):
+                break
+        return 0, addr
+
+    def skip(self, budget):
+        """
+        Call after a jump, emu.pc being the target. When it is the head of an
+        idle loop, runs one iteration of it then skips the whole
+        iterations which fit in budget cycles. Returns the number of cycles
+        run and skipped, at most budget.
+        If an instruction of the iteration faults, returns right before it,
+        with emu.pc on it: the interpreter runs it again and reports the
+        fault, once, as if the loop had not been looked at. The instructions
+        which can fault do so before changing anything, or only load the
+        same registers again.
+        """
+        emu = self.emulator
+        head = emu.pc
+        loop = self.loops.get(head)
+        if loop is None:
+            loop = self.loops[head] = self.scan(head)
+        length, end = loop
+        if not length or budget < length:
+            return 0
+
+        memory = emu.memory
+        table = emu.op_table
+        V = bytes(emu.V)
+        I = emu.I
+        pc = head
+        run = 0
+        while run < length:
+            op = (memory[pc] << 8) | memory[pc + 1]
+            try:
+                pc = table[op](emu, pc)
+            except Exception:
+                emu.pc = pc
+                return run
+            run += 1
+            if pc == head:
+                break
+            if not head <= pc <= end:
+                # The loop exited
+                emu.pc = pc
+                return run
+        emu.pc = pc
+        if pc != head or emu.V != V or emu.I != I:
+            return run
+        skipped = (budget - run) // run * run
+        self.skipped += skipped
+        return run + skipped
@@ -0,0 +1,72 @@
+"""
+The 16 keys of the CHIP-8 keypad, as one integer: bit k is set while key k
+is held.
+
+The front end keeps the mask up to date from the key down and key up events
+of the host, through a table from the host key codes to the bits built once
+from the keymap setting (host key name -> hex digit of the keypad key), and
+hands it to the emulator once per frame. EX9E, EXA1 and FX0A test its bits.
+"""
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+# Bit of each key, V[X] > 15 raises IndexError in EX9E and EXA1
+KEY_BITS = tuple(1 << key for key in range(16))
+
+# Host key -> keypad key, the usual layout on the left of a QWERTY keyboard
+#   1 2 3 4     1 2 3 C
+#   Q W E R     4 5 6 D
+#   A S D F     7 8 9 E
+#   Z X C V     A 0 B F
+DEFAULT_KEYMAP = {
+    '1': '1', '2': '2', '3': '3', '4': 'c',
+    'q': '4', 'w': '5', 'e': '6', 'r': 'd',
+    'a': '7', 's': '8', 'd': '9', 'f': 'e',
+    'z': 'a', 'x': '0', 'c': 'b', 'v': 'f',
+}
+
+
+def lowest_key(mask):
+    """
+    The lowest key held in a mask, -1 if none
+    """
+    return (mask & -mask).bit_length() - 1
+
+
+class Keypad:
+    def __init__(self, keymap, key_code):
+        """
+        key_code(name) is the host key code of a key name, e.g
+        pygame.key.key_code, it raises ValueError for an unknown name
+        """
+        # Host key code -> bit of the keypad key
+        self.bits = {}
+        for name, key in keymap.items():
+            try:
+                key = int(key, 16)
+                if not 0 <= key <= 0xF:
+                    raise ValueError('not a key of the keypad')
+                self.bits[key_code(name)] = KEY_BITS[key]
+            except (ValueError, TypeError) as e:
+                logger.warning(f'Ignoring the mapping of {name!r} to {key!r}: {e}')
+        self.mask = 0
+
+    def key_down(self, code):
+        """
+        Returns the keypad key of a host key, None if it is not mapped
+        """
+        bit = self.bits.get(code)
+        if bit is None:
+            return None
+        self.mask |= bit
+        return bit.bit_length() - 1
+
+    def key_up(self, code):
+        bit = self.bits.get(code)
+        if bit is not None:
+            self.mask &= ~bit
+
+    def release_all(self):
+        # The key up events are lost when the window loses the focus
+        self.mask = 0
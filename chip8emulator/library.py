@@ -0,0 +1,251 @@
+"""
+Library of the roms of a directory, indexed once.
+
+    python -m chip8emulator.library [DIR]         # lists the roms
+    library = RomLibrary('roms')
+    library.scan()
+    rom = library.find('3f0c')                     # by SHA-256, or a prefix of it
+    data = library.read(rom)
+
+scan() walks the directory and keeps an index file (INDEX_NAME, inside it)
+with the path, size, mtime, SHA-256 and metadata of every rom. A later scan
+only reads the roms which were added or changed since, so listing a large
+library is a stat per file. The bytes of the roms are kept in an LRU of
+loaded images, bounded in bytes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from . import analysis
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+INDEX_NAME = '.chip8index.json'
+INDEX_VERSION = 1
+# Space for a rom, from 0x200 to the end of memory
+MAX_ROM_SIZE = 4096 - analysis.ORIGIN
+
+# Opcodes only the SCHIP has: scroll, exit, low/high resolution, big font
+# and the RPL flags
+_SCHIP = {0x00FB, 0x00FC, 0x00FD, 0x00FE, 0x00FF}
+
+
+class Rom:
+    def __init__(self, path, size, mtime, sha256, metadata):
+        # Path relative to the library directory, with / separators
+        self.path = path
+        self.size = size
+        # os.stat st_mtime_ns
+        self.mtime = mtime
+        # Hex SHA-256 of the bytes
+        self.sha256 = sha256
+        self.metadata = metadata
+
+    @property
+    def name(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def to_json(self):
+        return {'size': self.size, 'mtime': self.mtime, 'sha256': self.sha256,
+                'metadata': self.metadata}
+
+
+def detect(data):
+    """
+    Metadata of a rom from its static analysis
+    """
+    result = analysis.analyze(data)
+    code = result.code()
+    ops = [(data[pc - analysis.ORIGIN] << 8) | data[pc - analysis.ORIGIN + 1]
+           for pc in code]
+    schip = any(op in _SCHIP or op & 0xFFF0 == 0x00C0 or
+                (op & 0xF000 == 0xF000 and op & 0xFF in (0x30, 0x75, 0x85))
+                for op in ops)
+    return {
+        'platform': 'schip' if schip else 'chip-8',
+        'instructions': len(code),
+        'subroutines': len(result.functions) - 1,
+        'random': any(op >> 12 == 0xC for op in ops),
+        'key_wait': any(op & 0xF0FF == 0xF00A for op in ops),
+        'dynamic_jumps': len(result.dynamic_jumps),
+    }
+
+
+class RomLibrary:
+    def __init__(self, directory, index_path=None, cache_bytes=4*1024*1024):
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, INDEX_NAME)
+        # Path -> Rom
+        self.roms = {}
+        # SHA-256 -> Rom
+        self.hashes = {}
+        # SHA-256 -> bytes, least recently used first
+        self.images = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as index:
+                data = json.load(index)
+            if data.get('version') != INDEX_VERSION:
+                raise ValueError(f'unsupported version {data.get("version")}')
+            for path, rom in data['roms'].items():
+                self._add(Rom(path, rom['size'], rom['mtime'], rom['sha256'], rom['metadata']))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Ignoring the rom index {self.index_path}: {e}')
+            self.roms = {}
+            self.hashes = {}
+
+    def _add(self, rom):
+        self.roms[rom.path] = rom
+        self.hashes[rom.sha256] = rom
+
+    def save(self):
+        data = {'version': INDEX_VERSION,
+                'roms': {path: rom.to_json() for path, rom in sorted(self.roms.items())}}
+        # Written to a temporary file then renamed, never left half written
+        temp = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temp, 'w') as index:
+            json.dump(data, index, separators=(',', ':'))
+        os.replace(temp, self.index_path)
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+            for name in sorted(files):
+                if name.startswith(('.', '_')):
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.directory).replace(os.sep, '/'), path
+
+    def scan(self):
+        """
+        Updates the index with the roms added, changed or removed since the
+        last scan. Returns (added or changed, removed) counts.
+        """
+        seen = set()
+        changed = 0
+        for relpath, path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not 0 < stat.st_size <= MAX_ROM_SIZE:
+                continue
+            seen.add(relpath)
+            rom = self.roms.get(relpath)
+            if rom is not None and rom.size == stat.st_size and rom.mtime == stat.st_mtime_ns:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if rom is not None:
+                self._forget(rom)
+            self._add(Rom(relpath, len(data), stat.st_mtime_ns,
+                          hashlib.sha256(data).hexdigest(), detect(data)))
+            changed += 1
+
+        removed = [rom for path, rom in self.roms.items() if path not in seen]
+        for rom in removed:
+            self._forget(rom)
+        if changed or removed or not os.path.exists(self.index_path):
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f'Unable to save the rom index {self.index_path}: {e}')
+        return changed, len(removed)
+
+    def _forget(self, rom):
+        del self.roms[rom.path]
+        if self.hashes.get(rom.sha256) is rom:
+            del self.hashes[rom.sha256]
+            # Another copy of the same rom may remain
+            for other in self.roms.values():
+                if other.sha256 == rom.sha256:
+                    self.hashes[rom.sha256] = other
+                    break
+
+    def __len__(self):
+        return len(self.roms)
+
+    def list(self):
+        """
+        The roms sorted by path
+        """
+        return [self.roms[path] for path in sorted(self.roms)]
+
+    def find(self, sha256):
+        """
+        The rom with a SHA-256 (hex), or a unique prefix of it.
+        Raises KeyError if there is none, or more than one.
+        """
+        sha256 = sha256.lower()
+        rom = self.hashes.get(sha256)
+        if rom is not None:
+            return rom
+        matches = [rom for digest, rom in self.hashes.items() if digest.startswith(sha256)]
+        if len(matches) != 1:
+            raise KeyError(f'{len(matches)} roms with a hash starting with {sha256}')
+        return matches[0]
+
+    def path(self, rom):
+        return os.path.join(self.directory, *rom.path.split('/'))
+
+    def read(self, rom):
+        """
+        The bytes of a rom (a Rom or its SHA-256), from the cache of loaded
+        images when possible. Raises ValueError if the file changed since it
+        was indexed.
+        """
+        if isinstance(rom, str):
+            rom = self.find(rom)
+        data = self.images.get(rom.sha256)
+        if data is not None:
+            self.images.move_to_end(rom.sha256)
+            return data
+        with open(self.path(rom), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != rom.sha256:
+            raise ValueError(f'{rom.path} changed since it was indexed, scan again')
+        self.images[rom.sha256] = data
+        self.cached_bytes += len(data)
+        while self.cached_bytes > self.cache_bytes and len(self.images) > 1:
+            digest, image = self.images.popitem(last=False)
+            self.cached_bytes -= len(image)
+        return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.library',
+        description='Indexes and lists the roms of a directory.')
+    parser.add_argument('directory', nargs='?', default='roms')
+    parser.add_argument('--find', metavar='SHA256', help='prints the path of a rom from its hash')
+    args = parser.parse_args(argv)
+
+    library = RomLibrary(args.directory)
+    changed, removed = library.scan()
+    if args.find:
+        try:
+            print(library.path(library.find(args.find)))
+        except KeyError as e:
+            print(e.args[0])
+            return 1
+        return 0
+    print(f'{"rom":<24}{"size":>6}  {"platform":<8}{"instructions":>13}  sha256')
+    for rom in library.list():
+        print(f'{rom.path:<24}{rom.size:>6}  {rom.metadata["platform"]:<8}'
+              f'{rom.metadata["instructions"]:>13}  {rom.sha256[:16]}')
+    print(f'{len(library)} roms, {changed} indexed now, {removed} removed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
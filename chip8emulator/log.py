@@ -1,7 +1,9 @@
+import atexit
 import builtins
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
+import queue
 
 try:
     import coloredlogs
@@ -21,6 +23,17 @@ class Conf:
     PRINT_ENABLED = True
     INPUT_ENABLED = True
 
+    # Records waiting for the background writer, see enable_queue()
+    QUEUE_SIZE = 10000
+
+
+# Every logger made by create_logger, by name
+_loggers = {}
+# The handler which replaces the handlers of every logger once enable_queue()
+# is called, None before
+_queue_handler = None
+_listener = None
+
 
 def create_logger(nm) -> logging.Logger:
     """
@@ -55,9 +68,118 @@ def create_logger(nm) -> logging.Logger:
     allFileHandler.setFormatter(Conf.LOG_FORMATTER)
     logger.addHandler(allFileHandler)
 
+    _loggers[nm] = logger
+    if _queue_handler is not None:
+        _route(logger)
     return logger
 
 
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records in a bounded queue without ever waiting, the records which
+    do not fit are dropped and counted.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def prepare(self, record):
+        # Only the message is formatted here, with the objects it refers to
+        # as they are now. The rest, e.g the traceback, on the writer thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.enqueued += 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+
+class _Router(logging.Handler):
+    """
+    Runs on the writer thread, hands every record to the handlers its
+    logger had before enable_queue()
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.routes = {}
+
+    def emit(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room when the queue is full, the writer is emptying it
+        self.queue.put(self._sentinel)
+
+
+def _route(logger):
+    _listener.handlers[0].routes[logger.name] = logger.handlers
+    logger.handlers = [_queue_handler]
+
+
+def enable_queue(size=None):
+    """
+    Logs from a background thread: from now on logging calls only put the
+    record in a queue of size records (Conf.QUEUE_SIZE by default), and a
+    single thread formats it and writes it to the console and the files.
+    When the queue is full records are dropped, logging never waits.
+    """
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        return
+    records = queue.Queue(size or Conf.QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(records)
+    _listener = _Listener(records, _Router())
+    for logger in _loggers.values():
+        _route(logger)
+    _listener.start()
+    atexit.register(disable_queue)
+
+
+def disable_queue():
+    """
+    Writes the records still queued, then logs from the calling thread again
+    """
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        return
+    _listener.stop()
+    routes = _listener.handlers[0].routes
+    for name, handlers in routes.items():
+        _loggers[name].handlers = handlers
+    _queue_handler = _listener = None
+
+
+def queue_stats():
+    """
+    Counters of the queue: records enqueued, dropped, waiting (depth) and the
+    highest depth seen, None when enable_queue() was not called
+    """
+    if _queue_handler is None:
+        return None
+    return {
+        'enqueued': _queue_handler.enqueued,
+        'dropped': _queue_handler.dropped,
+        'depth': _queue_handler.queue.qsize(),
+        'max_depth': _queue_handler.max_depth,
+    }
+
+
 def print(*args, **kwargs):
     if PRINT_ENABLED:
         return builtins.print(*args, **kwargs)
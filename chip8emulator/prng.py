@@ -0,0 +1,52 @@
+"""
+Seedable generator of the random bytes of CXNN, one per emulator.
+
+The bytes come in blocks of BLOCK_SIZE, block k being SHAKE-128 of the seed
+and k, which hashlib produces in bulk, so CXNN is only an index into a bytes
+object. The state is just (seed, block, position), small enough to be part
+of a snapshot, and any machine with the same seed gets the same bytes.
+"""
+import hashlib
+import struct
+
+BLOCK_SIZE = 1024
+SEED_MASK = (1 << 64) - 1
+
+_BLOCK_KEY = struct.Struct('<QQ')
+
+
+def block(seed, k):
+    """
+    Block k of the bytes of a seed
+    """
+    return hashlib.shake_128(_BLOCK_KEY.pack(seed, k)).digest(BLOCK_SIZE)
+
+
+class ByteRandom:
+    def __init__(self, seed=0):
+        self.seed(seed)
+
+    def seed(self, seed):
+        self.setstate((seed, -1, BLOCK_SIZE))
+
+    def getstate(self):
+        return self._seed, self.block, self.position
+
+    def setstate(self, state):
+        seed, k, position = state
+        seed = int(seed) & SEED_MASK
+        if k >= 0 and (seed, k) != (getattr(self, '_seed', None), getattr(self, 'block', None)):
+            self.buffer = block(seed, k)
+        self._seed = seed
+        # The first byte() fills block 0
+        self.block = k
+        self.position = position
+
+    def byte(self):
+        position = self.position
+        if position == BLOCK_SIZE:
+            self.block += 1
+            self.buffer = block(self._seed, self.block)
+            position = 0
+        self.position = position + 1
+        return self.buffer[position]
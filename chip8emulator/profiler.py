@@ -0,0 +1,202 @@
+"""
+Opt-in profiler, counts where the cycles of a rom go.
+
+    emulator = Emulator({'profile': True, ...})
+    emulator.init_optable()
+    ... run ...
+    emulator.profiler.write_json('profile.json')
+    emulator.profiler.write_collapsed('profile.folded')  # flamegraph.pl input
+
+With the profile setting the emulator runs from profile_table(), where every
+handler of the dispatch table is wrapped to update the counters of
+emu.profiler, so a disabled profiler costs nothing. The counters are arrays:
+executions per opcode and per address, nanoseconds per opcode family, plus
+the number of draws and collisions and the deepest call stack.
+
+The call stacks are resolved through 2NNN and 00EE: a frame is the address
+of a subroutine, the bottom frame is the entry point 0x200, and every
+instruction is counted in the stack it executes in.
+"""
+import json
+import time
+from array import array
+from .decoder import dispatch_table, describe
+
+# Families of the decoder, as in decode()
+FAMILIES = ('NNN', 'XNN', 'XYK', 'XKK', 'draw', 'clear', 'flow')
+
+_NNN, _XNN, _XYK, _XKK, _DRAW, _CLEAR, _FLOW = range(len(FAMILIES))
+_FAMILY = {0x1: _NNN, 0x2: _NNN, 0xA: _NNN, 0xB: _NNN,
+           0x3: _XNN, 0x4: _XNN, 0x6: _XNN, 0x7: _XNN, 0xC: _XNN,
+           0x5: _XYK, 0x8: _XYK, 0x9: _XYK, 0xD: _DRAW, 0xE: _XKK, 0xF: _XKK}
+
+
+def family(op):
+    """
+    Index in FAMILIES of the family of an opcode, 0NNN opcodes other than
+    00E0 are 'flow' (return, halt, nop)
+    """
+    if op == 0x00E0:
+        return _CLEAR
+    return _FAMILY.get(op >> 12, _FLOW)
+
+
+def pattern(op):
+    """
+    The opcode with its operands masked out, e.g '8XY4' for 0x8354
+    """
+    S = op >> 12
+    if S == 0:
+        return f'{op:04X}'
+    if S in (0x1, 0x2, 0xA, 0xB):
+        return f'{S:X}NNN'
+    if S in (0x3, 0x4, 0x6, 0x7, 0xC):
+        return f'{S:X}XNN'
+    if S == 0xD:
+        return 'DXYN'
+    if S in (0x5, 0x8, 0x9):
+        return f'{S:X}XY{op & 0xF:X}'
+    return f'{S:X}X{op & 0xFF:02X}'
+
+
+class Profiler:
+    def __init__(self):
+        # Executions of each opcode
+        self.opcodes = array('Q', bytes(8 * 0x10000))
+        # Executions of the instruction at each address
+        self.addresses = array('Q', bytes(8 * 4096))
+        # Nanoseconds spent in the handlers of each family
+        self.family_time = array('Q', bytes(8 * len(FAMILIES)))
+        self.draws = 0
+        self.collisions = 0
+        self.max_depth = 0
+        # Subroutines of the current call stack, the rom entry point first
+        self.frames = [0x200]
+        # Instructions executed in each call stack
+        self.stacks = {}
+        self.instructions = 0
+        # Value of instructions when the current call stack was entered
+        self._entered = 0
+
+    def clear(self):
+        self.__init__()
+
+    def _enter(self, depth, address=None):
+        # The call stack changes, the instructions since the last change
+        # belong to the previous one
+        key = tuple(self.frames)
+        self.stacks[key] = self.stacks.get(key, 0) + self.instructions - self._entered
+        self._entered = self.instructions
+        # Synchronised with the depth of the emulator stack, which a restored
+        # snapshot or a fault can change behind our back
+        if address is None:
+            del self.frames[depth + 1:]
+        else:
+            del self.frames[depth:]
+            self.frames.append(address)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def collapsed_stacks(self):
+        """
+        Lines 'frame;frame;... count' of the call stacks, the input format of
+        flamegraph.pl and speedscope
+        """
+        self._enter(len(self.frames) - 1)
+        return [';'.join(f'{frame:#05x}' for frame in stack) + f' {count}'
+                for stack, count in sorted(self.stacks.items()) if count]
+
+    def to_json(self):
+        """
+        The counters as a dict of plain values, zero counts are left out
+        """
+        patterns = {}
+        for op, count in enumerate(self.opcodes):
+            if count:
+                key = pattern(op)
+                patterns[key] = patterns.get(key, 0) + count
+        return {
+            'instructions': self.instructions,
+            'opcodes': {f'{op:04X}': count for op, count in enumerate(self.opcodes) if count},
+            'patterns': dict(sorted(patterns.items(), key=lambda item: -item[1])),
+            'addresses': {f'{addr:#05x}': count
+                          for addr, count in enumerate(self.addresses) if count},
+            'family_ns': dict(zip(FAMILIES, self.family_time)),
+            'draws': self.draws,
+            'collisions': self.collisions,
+            'max_call_depth': self.max_depth,
+        }
+
+    def hot_addresses(self, n=10, memory=None):
+        """
+        The n most executed addresses, as (address, count, text), text is the
+        instruction at that address in memory, if given
+        """
+        top = sorted(range(4096), key=self.addresses.__getitem__, reverse=True)[:n]
+        return [(addr, self.addresses[addr],
+                 describe((memory[addr] << 8) | memory[addr + 1])
+                 if memory is not None and addr < 4095 else '')
+                for addr in top if self.addresses[addr]]
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=4)
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.collapsed_stacks()) + '\n')
+
+
+def _profiled(op, handler):
+    index = family(op)
+    clock = time.perf_counter_ns
+
+    def h(emu, pc):
+        profiler = emu.profiler
+        profiler.instructions += 1
+        profiler.opcodes[op] += 1
+        profiler.addresses[pc & 0xFFF] += 1
+        start = clock()
+        pc = handler(emu, pc)
+        profiler.family_time[index] += clock() - start
+        return pc
+
+    if index == _DRAW:
+        def draw(emu, pc):
+            pc = h(emu, pc)
+            emu.profiler.draws += 1
+            emu.profiler.collisions += emu.V[0xF]
+            return pc
+        return draw
+
+    if op >> 12 == 0x2:
+        nnn = op & 0x0FFF
+
+        def call(emu, pc):
+            # Counted in the caller
+            pc = h(emu, pc)
+            emu.profiler._enter(len(emu.stack), nnn)
+            return pc
+        return call
+
+    if op == 0x00EE:
+        def ret(emu, pc):
+            pc = h(emu, pc)
+            emu.profiler._enter(len(emu.stack))
+            return pc
+        return ret
+    return h
+
+
+_profile_table = None
+
+
+def profile_table():
+    """
+    Same as dispatch_table, but every instruction updates emu.profiler
+    """
+    global _profile_table
+    if _profile_table is None:
+        table = dispatch_table()
+        _profile_table = tuple(_profiled(op, table[op]) for op in range(0x10000))
+    return _profile_table
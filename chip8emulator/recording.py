@@ -0,0 +1,205 @@
+"""
+Records play sessions and replays them headless, as fast as possible.
+
+    python -m chip8emulator.recording SESSION ROM
+
+A recording holds everything which makes a session differ from another one
+on the same rom: the seed of the random numbers (Emulator.seed), the cycles
+per frame, the CPU clock and timer frequency of the Scheduler the Engine ran
+(see frame_schedule), and the keys. The keys are only stored when they change, as
+(cycle, 16 bit key mask), which is also the input script of headless.run, so
+the replay samples them at the same frames as the Engine did. When the
+session ends properly the recording is closed with the final cycle and the
+hash of the framebuffer, which the replay is checked against.
+
+File layout: a header (HEADER), then records, each one a tag byte, the
+cycles since the previous record (LEB128) and
+    b'K' the new key mask, 2 bytes
+    b'E' the SHA-1 of the framebuffer (headless.framebuffer_hash), 20 bytes
+"""
+import argparse
+import hashlib
+import struct
+import sys
+from . import headless
+from .log import create_logger
+from .scheduler import Scheduler, TIMER_HZ
+
+logger = create_logger(__name__)
+
+MAGIC = b'C8RC'
+VERSION = 2
+
+# magic, version, seed, speed, cpu_hz, timer_hz, SHA-1 of the rom
+HEADER = struct.Struct('<4sBQHII20s')
+# Version 1: frames per second instead of cpu_hz and timer_hz
+HEADER_V1 = struct.Struct('<4sBQHd20s')
+KEYS = b'K'
+END = b'E'
+# Size of the payload of each record
+_SIZES = {KEYS: 2, END: 20}
+
+
+def _varint(value):
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def frame_schedule(cpu_hz, fps):
+    """
+    The cycles per frame and the Scheduler of a recorded session: every frame
+    runs the same number of cycles, so the clock is rounded to a multiple of
+    fps, and the timers stay at TIMER_HZ whatever fps is.
+    """
+    speed = max(1, round(cpu_hz / fps))
+    return speed, Scheduler(speed * fps, TIMER_HZ)
+
+
+class Recorder:
+    """
+    Writes a recording, call keys() at the start of every frame and close()
+    at the end of the session.
+    """
+
+    def __init__(self, path, rom, seed, speed, cpu_hz, timer_hz=TIMER_HZ):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, speed, cpu_hz, timer_hz,
+                                    hashlib.sha1(rom).digest()))
+        self.mask = 0
+        self.cycle = 0
+        self.records = 0
+
+    def _write(self, tag, cycle, payload):
+        self.file.write(tag + _varint(cycle - self.cycle) + payload)
+        self.cycle = cycle
+        self.records += 1
+
+    def keys(self, cycle, mask):
+        if mask != self.mask:
+            self._write(KEYS, cycle, mask.to_bytes(2, 'little'))
+            self.mask = mask
+
+    def close(self, cycle, framebuffer_hash):
+        if self.file.closed:
+            return
+        self._write(END, cycle, bytes.fromhex(framebuffer_hash))
+        self.file.close()
+        logger.info(f'Recorded {cycle} cycles, {self.records} records to {self.path}')
+
+
+class Recording:
+    def __init__(self, seed, speed, cpu_hz, timer_hz, rom_hash, script, cycles,
+                 framebuffer_hash):
+        self.seed = seed
+        # Cycles per frame
+        self.speed = speed
+        # Clock of the CPU and of the timers, see scheduler.Scheduler
+        self.cpu_hz = cpu_hz
+        self.timer_hz = timer_hz
+        # SHA-1 of the rom, bytes
+        self.rom_hash = rom_hash
+        # List of (cycle, key mask)
+        self.script = script
+        # Length of the session, the cycle of the last record
+        self.cycles = cycles
+        # None when the session did not end properly
+        self.framebuffer_hash = framebuffer_hash
+
+
+def load(path):
+    with open(path, 'rb') as recording:
+        data = recording.read()
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        raise ValueError(f'{path}: not a recording')
+    version = data[4]
+    if version == VERSION:
+        magic, version, seed, speed, cpu_hz, timer_hz, rom_hash = HEADER.unpack_from(data)
+        position = HEADER.size
+    elif version == 1:
+        # The timers ticked once per frame
+        magic, version, seed, speed, fps, rom_hash = HEADER_V1.unpack_from(data)
+        cpu_hz, timer_hz = round(speed * fps), round(fps)
+        position = HEADER_V1.size
+    else:
+        raise ValueError(f'{path}: unsupported recording version {version}')
+
+    script = []
+    cycle = 0
+    framebuffer_hash = None
+    try:
+        while position < len(data):
+            tag = data[position:position + 1]
+            position += 1
+            delta = shift = 0
+            while True:
+                byte = data[position]
+                position += 1
+                delta |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            size = _SIZES.get(tag)
+            if size is None:
+                raise ValueError(f'{path}: invalid record at byte {position - 1}')
+            payload = data[position:position + size]
+            if len(payload) < size:
+                raise IndexError
+            position += size
+            cycle += delta
+            if tag == KEYS:
+                script.append((cycle, int.from_bytes(payload, 'little')))
+            else:
+                framebuffer_hash = payload.hex()
+    except IndexError:
+        # A session which crashed, the last record is cut
+        logger.warning(f'{path}: truncated recording')
+    return Recording(seed, speed, cpu_hz, timer_hz, rom_hash, script, cycle, framebuffer_hash)
+
+
+def replay(recording, rom, settings=None):
+    """
+    Runs the recorded session on a headless emulator, without pacing.
+    Returns the headless.Result.
+    """
+    if hashlib.sha1(rom).digest() != recording.rom_hash:
+        logger.warning('The rom is not the one the session was recorded with')
+    settings = dict(headless.DEFAULT_SETTINGS, **(settings or {}))
+    settings.update(seed=recording.seed, speed=recording.speed)
+    emulator = headless.create_emulator(settings)
+    emulator.load_to_memory(bytearray(rom))
+    return headless.run(emulator, cycles=recording.cycles, cpu_hz=recording.cpu_hz,
+                        timer_hz=recording.timer_hz, script=recording.script)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.recording',
+        description='Replays a recorded session without a display.')
+    parser.add_argument('recording')
+    parser.add_argument('rom')
+    parser.add_argument('--settings', help='settings json file')
+    args = parser.parse_args(argv)
+
+    recording = load(args.recording)
+    with open(args.rom, 'rb') as rom:
+        data = rom.read()
+    result = replay(recording, data, headless.load_settings(args.settings))
+    print(f'{result.cycles} cycles, {result.frames} frames in {result.elapsed:.2f}s, '
+          f'{result.reason}, framebuffer {result.framebuffer_hash}')
+    if recording.framebuffer_hash is None:
+        print('The recording has no final framebuffer to compare with')
+        return 0
+    if result.framebuffer_hash != recording.framebuffer_hash:
+        print(f'MISMATCH, recorded framebuffer {recording.framebuffer_hash}')
+        return 1
+    print('The framebuffer matches the recording')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
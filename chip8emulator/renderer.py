@@ -0,0 +1,70 @@
+import pygame
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+# The 8 pixels (one byte each, 0 or 1) of every possible framebuffer byte.
+_PIXELS = [bytes((b >> (7 - i)) & 1 for i in range(8)) for b in range(256)]
+
+
+class Renderer:
+    """
+    Draws the emulator's framebuffer on the screen.
+    The framebuffer is kept in a 64x32 8 bit surface, where only the rows
+    marked dirty by the emulator are updated, and the band of dirty rows
+    reaches the window size with a single scaled blit.
+    """
+
+    def __init__(self, screen, foreground='white', background='black'):
+        self.screen = screen
+        self.width, self.height = screen.get_size()
+        self.surface = pygame.Surface((64, 32), depth=8)
+        self.surface.set_palette(
+            [pygame.Color(background), pygame.Color(foreground)])
+        # Same format as the screen, so that it can be scaled straight into it
+        self.converted = pygame.Surface((64, 32)).convert(screen)
+        self.pitch = self.surface.get_pitch()
+        self.full_redraw = True
+
+    def invalidate(self):
+        """
+        Redraws everything on the next present, e.g after the window was exposed
+        """
+        self.full_redraw = True
+
+    def present(self, emulator):
+        """
+        Copies the dirty rows of the framebuffer to the screen.
+        Returns False if nothing had to be drawn.
+        """
+        dirty = emulator.dirty_rows
+        if self.full_redraw:
+            dirty = (1 << 32) - 1
+            self.full_redraw = False
+        if not dirty:
+            return False
+        emulator.dirty_rows = 0
+
+        framebuffer = emulator.framebuffer
+        pixels = _PIXELS
+        # First and last dirty rows
+        top = (dirty & -dirty).bit_length() - 1
+        bottom = dirty.bit_length() - 1
+        buffer = self.surface.get_buffer()
+        y = top
+        dirty >>= top
+        while dirty:
+            if dirty & 1:
+                row = framebuffer[y].to_bytes(8, 'big')
+                buffer.write(b''.join([pixels[b] for b in row]), y*self.pitch)
+            dirty >>= 1
+            y += 1
+        del buffer
+
+        band = pygame.Rect(0, top, 64, bottom - top + 1)
+        self.converted.blit(self.surface, band, band)
+        y1 = top*self.height // 32
+        y2 = (bottom + 1)*self.height // 32
+        pygame.transform.scale(self.converted.subsurface(band), (self.width, y2 - y1),
+                               self.screen.subsurface((0, y1, self.width, y2 - y1)))
+        return True
@@ -0,0 +1,113 @@
+"""
+Ring buffer of per frame machine states, to scrub backwards through play.
+
+    rewind = RewindBuffer(memory_cap=16*1024*1024)
+    rewind.push(emulator)       # at the end of every frame
+    rewind.step_back(emulator)  # restores the frame before the last one
+
+The states are kept in groups: a keyframe (a full snapshot compressed with
+zlib) followed by delta snapshots (see Emulator.snapshot) against it, so any
+state is restored from its keyframe in one step. When the buffer grows past
+its memory cap the oldest group is dropped.
+"""
+import time
+import zlib
+from collections import deque
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+
+class RewindBuffer:
+    def __init__(self, memory_cap=16*1024*1024, keyframe_interval=60, report_interval=600):
+        # Maximum number of bytes of stored states
+        self.memory_cap = memory_cap
+        # Number of frames from one keyframe to the next
+        self.keyframe_interval = keyframe_interval
+        # Frames between two reports of the memory use and latencies, 0 to disable
+        self.report_interval = report_interval
+        # Groups of [compressed keyframe, [deltas]], oldest first
+        self.groups = deque()
+        # Full snapshot of the newest keyframe, the base of new deltas
+        self.base = None
+        self.size = 0
+        self.frames = 0
+
+        self.pushes = 0
+        self.capture_time = 0.0
+        self.restores = 0
+        self.restore_time = 0.0
+
+    def __len__(self):
+        return self.frames
+
+    def clear(self):
+        self.groups.clear()
+        self.base = None
+        self.size = 0
+        self.frames = 0
+
+    def push(self, emulator):
+        """
+        Stores the current state of the emulator
+        """
+        start = time.perf_counter()
+        if self.base is None or len(self.groups[-1][1]) + 1 >= self.keyframe_interval:
+            self.base = emulator.snapshot()
+            keyframe = zlib.compress(self.base, 1)
+            self.groups.append([keyframe, []])
+            self.size += len(keyframe)
+        else:
+            delta = emulator.snapshot(self.base)
+            self.groups[-1][1].append(delta)
+            self.size += len(delta)
+        self.frames += 1
+
+        while self.size > self.memory_cap and len(self.groups) > 1:
+            keyframe, deltas = self.groups.popleft()
+            self.size -= len(keyframe) + sum(len(delta) for delta in deltas)
+            self.frames -= 1 + len(deltas)
+
+        self.capture_time += time.perf_counter() - start
+        self.pushes += 1
+        if self.report_interval and self.pushes % self.report_interval == 0:
+            self.report()
+
+    def step_back(self, emulator):
+        """
+        Drops the newest state and restores the one before it.
+        Returns False, without changing the emulator, if there is none.
+        """
+        if self.frames < 2:
+            return False
+        start = time.perf_counter()
+        keyframe, deltas = self.groups[-1]
+        if deltas:
+            size = len(deltas.pop())
+        else:
+            self.groups.pop()
+            size = len(keyframe)
+            keyframe, deltas = self.groups[-1]
+        self.size -= size
+        self.frames -= 1
+
+        base = zlib.decompress(keyframe)
+        if deltas:
+            emulator.restore(deltas[-1], base)
+        else:
+            emulator.restore(base)
+        # The next push starts a new keyframe
+        self.base = None
+
+        self.restore_time += time.perf_counter() - start
+        self.restores += 1
+        return True
+
+    def report(self):
+        capture = self.capture_time / self.pushes * 1e6 if self.pushes else 0
+        restore = self.restore_time / self.restores * 1e6 if self.restores else 0
+        logger.info(f'Rewind buffer: {self.frames} frames, {self.size / 1024:.0f} KiB '
+                    f'of {self.memory_cap / 1024:.0f} KiB, capture {capture:.0f} us, '
+                    f'restore {restore:.0f} us')
+        self.pushes = self.capture_time = 0
+        self.restores = self.restore_time = 0
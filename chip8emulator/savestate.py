@@ -0,0 +1,173 @@
+"""
+Numbered save state slots on disk.
+
+    python -m chip8emulator.savestate [DIR]       # lists the slots
+    path = slot_path('saves', rom_hash, 1)
+    save(path, emulator, rom_hash, 1)
+    load(path, emulator, rom_hash)
+
+A slot file has a fixed size: a header (HEADER) with the SHA-256 of the rom,
+the slot number and when it was saved, then a thumbnail of the screen (the
+256 bytes of Emulator.framebuffer_bytes) and a full snapshot of the machine
+(see snapshot.py). Listing the slots only reads the header and thumbnail of
+every file. Loading maps the file with mmap and unpacks the snapshot from it
+into the emulator, without reading the file into a bytes object first, it
+takes well under a frame.
+
+Files are written to a temporary file then renamed, a slot is never left
+half written.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from .decoder import hexrepr
+from .log import create_logger
+from .snapshot import SNAPSHOT
+
+logger = create_logger(__name__)
+
+MAGIC = b'C8SV'
+VERSION = 2
+
+# magic, version, slot, SHA-256 of the rom, time saved (time.time()),
+# cycles run since the rom was loaded, pc
+HEADER = struct.Struct('<4sBB32sdQH')
+THUMBNAIL_SIZE = 256
+FILE_SIZE = HEADER.size + THUMBNAIL_SIZE + SNAPSHOT.size
+EXTENSION = '.c8s'
+
+
+class SlotInfo:
+    def __init__(self, path, slot, rom_hash, saved_at, cycle, pc, thumbnail):
+        self.path = path
+        self.slot = slot
+        # SHA-256 of the rom, bytes
+        self.rom_hash = rom_hash
+        self.saved_at = saved_at
+        self.cycle = cycle
+        self.pc = pc
+        # 64x32 pixels, 8 bytes per row, 1 bit per pixel
+        self.thumbnail = thumbnail
+
+    def thumbnail_text(self):
+        """
+        The thumbnail as 16 lines of text, two rows of pixels per character
+        """
+        rows = [int.from_bytes(self.thumbnail[8*y:8*y + 8], 'big') for y in range(32)]
+        lines = []
+        for y in range(0, 32, 2):
+            line = ''
+            for x in range(63, -1, -1):
+                top = (rows[y] >> x) & 1
+                bottom = (rows[y + 1] >> x) & 1
+                line += ' ▀▄█'[top | (bottom << 1)]
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def slot_path(directory, rom_hash, slot):
+    return os.path.join(directory, f'{rom_hash.hex()[:16]}-{slot}{EXTENSION}')
+
+
+def _info(path, data):
+    if len(data) < HEADER.size + THUMBNAIL_SIZE:
+        raise ValueError('Not a save state, too short')
+    magic, version, slot, rom_hash, saved_at, cycle, pc = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a save state')
+    if version != VERSION:
+        raise ValueError(f'Unsupported save state version {version}')
+    thumbnail = bytes(data[HEADER.size:HEADER.size + THUMBNAIL_SIZE])
+    return SlotInfo(path, slot, rom_hash, saved_at, cycle, pc, thumbnail)
+
+
+def read_info(path):
+    """
+    The metadata of a slot file, without its snapshot. Raises ValueError if
+    it is not a save state.
+    """
+    with open(path, 'rb') as f:
+        return _info(path, f.read(HEADER.size + THUMBNAIL_SIZE))
+
+
+def list_slots(directory, rom_hash=None):
+    """
+    The SlotInfo of every save state in a directory, of a rom if rom_hash
+    is given, sorted by slot
+    """
+    slots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return slots
+    for name in names:
+        if not name.endswith(EXTENSION):
+            continue
+        try:
+            info = read_info(os.path.join(directory, name))
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring {name}: {e}')
+            continue
+        if rom_hash is None or info.rom_hash == rom_hash:
+            slots.append(info)
+    slots.sort(key=lambda info: (info.rom_hash, info.slot))
+    return slots
+
+
+def save(path, emulator, rom_hash, slot, cycle=0):
+    """
+    Saves the state of the emulator running the rom with the SHA-256
+    rom_hash to a slot file
+    """
+    data = (HEADER.pack(MAGIC, VERSION, slot, rom_hash, time.time(), cycle, emulator.pc) +
+            emulator.framebuffer_bytes() + emulator.snapshot())
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def load(path, emulator, rom_hash=None):
+    """
+    Restores the state of a slot file into the emulator, returns its
+    SlotInfo. Raises ValueError if it is not a save state, or the state of
+    another rom than the one with the SHA-256 rom_hash.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if len(data) != FILE_SIZE:
+            raise ValueError(f'Save state of {len(data)} bytes, expected {FILE_SIZE}')
+        info = _info(path, data)
+        if rom_hash is not None and info.rom_hash != rom_hash:
+            raise ValueError('Save state of another rom')
+        with memoryview(data)[HEADER.size + THUMBNAIL_SIZE:] as state:
+            emulator.restore(state)
+    return info
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8emulator.savestate',
+        description='Lists the save states of a directory.')
+    parser.add_argument('directory', nargs='?', default='saves')
+    parser.add_argument('--thumbnails', action='store_true', help='prints the screens')
+    args = parser.parse_args(argv)
+
+    slots = list_slots(args.directory)
+    for info in slots:
+        saved_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info.saved_at))
+        print(f'{info.rom_hash.hex()[:16]}  slot {info.slot:<3}  {saved_at}  '
+              f'cycle {info.cycle:<10}  pc {hexrepr(info.pc).strip()}')
+        if args.thumbnails:
+            print(info.thumbnail_text())
+    print(f'{len(slots)} save states')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
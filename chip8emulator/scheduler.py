@@ -0,0 +1,134 @@
+"""
+Keeps the emulated machine on time, independently of the display.
+
+    scheduler = Scheduler(cpu_hz=600)
+    pacer = FramePacer(fps=60)
+    while True:
+        scheduler.run(scheduler.advance(pacer.elapsed()), execute, emulator.tick_timers)
+        if pacer.present_due():
+            ... draw ...
+        pacer.wait()
+
+The Scheduler turns host time into CPU cycles, at cpu_hz, and ticks the
+timers at timer_hz on an exact integer schedule: tick k happens after cycle
+ceil(k * cpu_hz / timer_hz), whatever the frame rate of the display. The
+FramePacer paces the display at fps, sleeping in between so that a slow CPU
+does not spin the host, and skips presenting frames when the host falls
+behind.
+"""
+import time
+
+TIMER_HZ = 60
+
+
+class Scheduler:
+    def __init__(self, cpu_hz, timer_hz=TIMER_HZ, max_lag=0.25):
+        self.timer_hz = timer_hz
+        # Host time which is not caught up with, in seconds, e.g after the
+        # window was dragged. Beyond it the machine slows down.
+        self.max_lag = max_lag
+        # Cycles run so far
+        self.cycle = 0
+        # Timer ticks so far
+        self.ticks = 0
+        # Host time not converted to cycles yet, in cycles * 1e9 / cpu_hz ns
+        self._remainder = 0
+        self.set_cpu_hz(cpu_hz)
+
+    def set_cpu_hz(self, cpu_hz):
+        """
+        Changes the clock, from the current cycle on
+        """
+        self.cpu_hz = max(1, int(cpu_hz))
+        self._remainder = 0
+        # The tick schedule starts over from the last tick
+        self._origin_cycle = self.cycle
+        self._origin_tick = self.ticks
+        self.next_tick = self._tick_cycle(self.ticks + 1)
+
+    def _tick_cycle(self, tick):
+        # Ceiling of the cycle of a tick, in integers so that it never drifts
+        return self._origin_cycle - (-(tick - self._origin_tick) * self.cpu_hz // self.timer_hz)
+
+    def advance(self, seconds):
+        """
+        Returns the number of cycles in seconds of host time
+        """
+        if seconds > self.max_lag:
+            seconds = self.max_lag
+        self._remainder += round(seconds * 1e9) * self.cpu_hz
+        cycles, self._remainder = divmod(self._remainder, 1000000000)
+        return cycles
+
+    def run(self, cycles, execute, tick):
+        """
+        Runs cycles cycles, execute(n) runs n cycles of the CPU and returns
+        False when the emulator should stop, tick() advances the timers.
+        Returns False when execute did.
+        """
+        while cycles > 0:
+            n = min(cycles, self.next_tick - self.cycle)
+            if not execute(n):
+                return False
+            self.cycle += n
+            cycles -= n
+            if self.cycle == self.next_tick:
+                tick()
+                self.ticks += 1
+                self.next_tick = self._tick_cycle(self.ticks + 1)
+        return True
+
+
+class FramePacer:
+    def __init__(self, fps, max_skip=4, clock=time.perf_counter, sleep=time.sleep):
+        self.fps = fps
+        # Frames which may be skipped in a row before one is presented anyway
+        self.max_skip = max_skip
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.deadline = self.last
+        self.skipped = 0
+        self.frames_skipped = 0
+
+    def reset(self):
+        """
+        Starts over from now, e.g after the host slept
+        """
+        self.last = self.deadline = self.clock()
+        self.skipped = 0
+
+    def elapsed(self):
+        """
+        Seconds since the last call
+        """
+        now = self.clock()
+        elapsed = now - self.last
+        self.last = now
+        return elapsed
+
+    def present_due(self):
+        """
+        Returns False when the frame should not be presented, because the host
+        is more than a frame behind
+        """
+        period = 1 / self.fps
+        if self.clock() > self.deadline + period and self.skipped < self.max_skip:
+            self.skipped += 1
+            self.frames_skipped += 1
+            return False
+        self.skipped = 0
+        return True
+
+    def wait(self):
+        """
+        Sleeps until the next frame
+        """
+        period = 1 / self.fps
+        self.deadline += period
+        now = self.clock()
+        if self.deadline > now:
+            self.sleep(self.deadline - now)
+        elif now - self.deadline > self.max_skip * period:
+            # Too far behind to catch up, start over from now
+            self.deadline = now
@@ -0,0 +1,118 @@
+"""
+Binary snapshots of the whole machine state, see Emulator.snapshot and
+Emulator.restore.
+
+A snapshot has a fixed layout (SNAPSHOT below), so that taking and restoring
+it is a single struct pack/unpack plus a few slice assignments. A delta
+snapshot is the XOR of a full snapshot with a base snapshot, compressed with
+zlib, it is much smaller when only a few bytes changed since the base.
+"""
+import struct
+import zlib
+
+MAGIC = b'C8SS'
+VERSION = 3
+
+# Flags
+DELTA = 1
+
+HEADER = struct.Struct('<4sBB')
+# Delta snapshots: header, CRC-32 of the base, the compressed XOR
+DELTA_HEADER = struct.Struct('<4sBBI')
+
+# Room for MAX_STACK_SIZE + 1 return addresses, the call which overflows the
+# stack is still made.
+STACK_SIZE = 33
+
+SNAPSHOT = struct.Struct(
+    '<4sBB'                 # magic, version, flags
+    'HHhBHBbb'              # I, pc, stack_pointer, stack size, delay_timer,
+                            # waiting for a key, register of the key
+                            # (-1 if none), pc_increment
+    'QiH'                   # seed, block and position of the random bytes
+    f'16s16s{STACK_SIZE}H'  # V, keys (one byte per key), stack
+    '32Q4096s'              # framebuffer, memory
+)
+# Index of the first value after the registers in SNAPSHOT.unpack
+_V = 14
+
+
+def check_header(data):
+    """
+    Returns the flags of the snapshot, raises ValueError if it is not one
+    """
+    if len(data) < HEADER.size:
+        raise ValueError('Not a snapshot, too short')
+    magic, version, flags = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a snapshot')
+    if version != VERSION:
+        raise ValueError(f'Unsupported snapshot version {version}')
+    return flags
+
+
+def pack(emulator):
+    stack = emulator.stack
+    if len(stack) > STACK_SIZE:
+        raise ValueError(f'Stack too deep to be saved ({len(stack)} entries)')
+    key_wait = emulator.key_wait
+    return SNAPSHOT.pack(
+        MAGIC, VERSION, 0,
+        emulator.I, emulator.pc, emulator.stack_pointer, len(stack),
+        emulator.delay_timer,
+        key_wait is not None, -1 if key_wait is None else key_wait,
+        emulator.pc_increment, *emulator.random.getstate(),
+        bytes(emulator.V), bytes((emulator.keys >> k) & 1 for k in range(16)),
+        *stack, *(0,)*(STACK_SIZE - len(stack)),
+        *emulator.framebuffer, bytes(emulator.memory))
+
+
+def unpack(emulator, data):
+    if len(data) != SNAPSHOT.size:
+        raise ValueError(f'Snapshot of {len(data)} bytes, expected {SNAPSHOT.size}')
+    values = SNAPSHOT.unpack(data)
+    (emulator.I, emulator.pc, emulator.stack_pointer, size, emulator.delay_timer,
+     waiting, key_wait, emulator.pc_increment,
+     seed, block, position) = values[3:_V]
+    emulator.key_wait = key_wait if waiting and key_wait >= 0 else None
+    emulator.seed = seed
+    emulator.random.setstate((seed, block, position))
+
+    emulator.V[:] = values[_V]
+    emulator.keys = sum(held << k for k, held in enumerate(values[_V + 1]))
+    stack = _V + 2
+    emulator.stack[:] = values[stack: stack + size]
+    framebuffer = stack + STACK_SIZE
+    emulator.framebuffer[:] = values[framebuffer: framebuffer + 32]
+    emulator.memory[:] = values[-1]
+
+
+def memory_view(data):
+    """
+    The memory in a full snapshot, without copying it
+    """
+    return memoryview(data)[SNAPSHOT.size - 4096:]
+
+
+def xor(a, b):
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+def delta(snapshot, base):
+    """
+    Delta snapshot of a full snapshot against a full base snapshot
+    """
+    return (DELTA_HEADER.pack(MAGIC, VERSION, DELTA, zlib.crc32(base)) +
+            zlib.compress(xor(snapshot, base), 1))
+
+
+def apply_delta(data, base):
+    """
+    The full snapshot of a delta snapshot taken against base
+    """
+    if base is None:
+        raise ValueError('A delta snapshot needs its base snapshot')
+    magic, version, flags, crc = DELTA_HEADER.unpack_from(data)
+    if crc != zlib.crc32(base):
+        raise ValueError('The delta snapshot was not taken against this base')
+    return xor(zlib.decompress(data[DELTA_HEADER.size:]), base)
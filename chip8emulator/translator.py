@@ -0,0 +1,274 @@
+from .log import create_logger
+from .decoder import hexrepr
+from .emulator import Stop, BUDGET, DRAW, KEY_WAIT, HALT, FAULT
+
+logger = create_logger(__name__)
+
+# Basic block translator.
+# Straight line CHIP-8 code starting at an address is turned into python
+# source, compiled once and cached by the start address. A block ends at the
+# first jump, skip, call, return, DXYN, FX0A or memory write (FX33/FX55), and
+# the instruction which ends it is executed with the interpreter's own handler
+# (or an inlined equivalent for jumps and skips), so both execution engines
+# behave the same, instruction for instruction.
+
+MAX_BLOCK_SIZE = 32
+
+# Statements for opcodes which are inlined, keyed by (opcode & mask).
+_INLINE = {
+    0x6000: 'V[{x}] = {nn}',
+    0x7000: 'V[{x}] = (V[{x}] + {nn}) & 0xff',
+    0x8000: 'V[{x}] = V[{y}]',
+    0x8001: 'V[{x}] = V[{x}] | V[{y}]',
+    0x8002: 'V[{x}] = V[{x}] & V[{y}]',
+    0x8003: 'V[{x}] = V[{x}] ^ V[{y}]',
+    0x8004: ('if ((V[{x}] + V[{y}]) > 0xff):\n'
+             '    V[0xF] = 1\n'
+             'else:\n'
+             '    V[0xF] = 0\n'
+             'V[{x}] = (V[{x}] + V[{y}]) & 0xFF'),
+    0x8005: ('if V[{x}] > V[{y}]:\n'
+             '    V[0xF] = 0\n'
+             '    V[{x}] = V[{x}] - V[{y}]\n'
+             'else:\n'
+             '    V[0xF] = 1\n'
+             '    V[{x}] = V[{x}] - V[{y}] + 256'),
+    0x8006: ('V[0xF] = V[{x}] & 1\n'
+             'V[{x}] = V[{x}] >> 1'),
+    0x8007: ('if V[{y}] > V[{x}]:\n'
+             '    V[0xF] = 0\n'
+             '    V[{x}] = V[{y}] - V[{x}]\n'
+             'else:\n'
+             '    V[0xF] = 1\n'
+             '    V[{x}] = V[{y}] - V[{x}] + 256'),
+    0x800E: ('V[0xF] = (V[{x}] & 0b10000000) >> 7\n'
+             'V[{x}] = (V[{x}] << 1) & 0xFF'),
+    0xA000: 'emu.I = {nnn}',
+    0xC000: 'V[{x}] = emu.random.byte() & {nn}',
+    0xF007: 'V[{x}] = int(emu.delay_timer)',
+    0xF01E: 'emu.I = (emu.I + V[{x}]) & 0xFFFF',
+    0xF029: 'emu.I = 5*V[{x}]',
+}
+
+# Skips which are inlined as the last statement of a block.
+_SKIPS = {
+    0x3000: 'V[{x}] == {nn}',
+    0x4000: 'V[{x}] != {nn}',
+    0x5000: 'V[{x}] == V[{y}]',
+    0x9000: 'V[{x}] != V[{y}]',
+}
+
+
+def _inline_key(op):
+    S = op & 0xF000
+    if S in (0x6000, 0x7000, 0xA000, 0xC000):
+        return S
+    if S == 0x8000:
+        return op & 0xF00F
+    if S == 0xF000:
+        return op & 0xF0FF
+    return None
+
+
+def _skip_key(op):
+    S = op & 0xF000
+    if S in (0x3000, 0x4000) or (S in (0x5000, 0x9000) and op & 0xF == 0):
+        return S
+    return None
+
+
+def ends_block(op):
+    """
+    Returns True if the opcode changes the control flow, waits for input,
+    draws or writes to memory.
+    """
+    S = op & 0xF000
+    if S in (0x1000, 0x2000, 0xB000, 0xD000) or op in (0x00EE, 0x0FFF):
+        return True
+    if _skip_key(op) is not None:
+        return True
+    return (op & 0xF0FF) in (0xE09E, 0xE0A1, 0xF00A, 0xF033, 0xF055)
+
+
+def stop_reason(op):
+    """
+    The reason of Emulator.run_cycles an opcode may stop at, None if none
+    """
+    if op & 0xF000 == 0xD000:
+        return DRAW
+    if op & 0xF0FF == 0xF00A:
+        return KEY_WAIT
+    if op == 0x0FFF:
+        return HALT
+    if op & 0xF000 == 0x2000 or op == 0x00EE:
+        # Not a reason, the stack is checked for an overflow or an illegal return
+        return FAULT
+    return None
+
+
+class Block:
+    def __init__(self, start, end, length, function, source, stop=None):
+        self.start = start
+        # Address after the last instruction of the block
+        self.end = end
+        # Number of instructions in the block
+        self.length = length
+        # function(emulator) -> next pc
+        self.function = function
+        self.source = source
+        # Reason of run_cycles the last instruction may stop at, see stop_reason
+        self.stop = stop
+
+
+class BlockTranslator:
+    """
+    Execution engine which runs CHIP-8 code as compiled basic blocks.
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.blocks = {}
+        # Number of cached blocks covering each address
+        self.code = bytearray(4096)
+        emulator.memory_listeners.append(self.invalidate)
+
+    def translate(self, start):
+        memory = self.emulator.memory
+        table = self.emulator.op_table
+        namespace = {}
+        lines = []
+        pc = start
+        length = 0
+        stop = None
+        while pc <= 4094 and length < MAX_BLOCK_SIZE:
+            op = (memory[pc] << 8) | memory[pc+1]
+            x = (op & 0x0F00) >> 8
+            y = (op & 0x00F0) >> 4
+            nn = op & 0x00FF
+            nnn = op & 0x0FFF
+            length += 1
+            lines.append(f'# {hexrepr(pc)} | {hexrepr(op)}')
+            if op == 0 or table[op] is table[0]:
+                # No operation
+                pc += 2
+                continue
+            # The address of the instruction being executed, used to report
+            # the right pc if an instruction raises.
+            lines.append(f'at = {pc}')
+            if ends_block(op):
+                if op & 0xF000 == 0x1000:
+                    lines.append(f'return {nnn}')
+                elif _skip_key(op) is not None:
+                    cond = _SKIPS[_skip_key(op)].format(x=x, y=y, nn=nn)
+                    lines.append(f'return {pc + 4} if {cond} else {pc + 2}')
+                else:
+                    namespace[f'h{pc}'] = table[op]
+                    lines.append(f'return h{pc}(emu, {pc})')
+                stop = stop_reason(op)
+                pc += 2
+                break
+
+            key = _inline_key(op)
+            if key in _INLINE:
+                lines.extend(_INLINE[key].format(
+                    x=x, y=y, nn=nn, nnn=nnn).split('\n'))
+            else:
+                # Anything else (clear, FX65, ...) goes through the interpreter.
+                namespace[f'h{pc}'] = table[op]
+                lines.append(f'h{pc}(emu, {pc})')
+            pc += 2
+        else:
+            lines.append(f'return {pc}')
+
+        body = '\n'.join('        ' + line for line in lines)
+        source = (f'def block_{start:03x}(emu):\n'
+                  f'    V = emu.V\n'
+                  f'    at = {start}\n'
+                  f'    try:\n'
+                  f'{body}\n'
+                  f'    except Exception:\n'
+                  f'        emu.pc = at\n'
+                  f'        raise\n')
+        exec(compile(source, f'<block {hexrepr(start).strip()}>', 'exec'),
+             namespace)
+        block = Block(start, pc, length,
+                      namespace[f'block_{start:03x}'], source, stop)
+        self.blocks[start] = block
+        for i in range(start, pc):
+            self.code[i] += 1
+        return block
+
+    def prebuild(self, analysis):
+        """
+        Compiles the code of a rom before it runs, from its static analysis
+        (see analysis.py), call it after the rom is loaded
+        """
+        for start, code in analysis.blocks.items():
+            pc = start
+            while pc < code.end:
+                block = self.blocks.get(pc) or self.translate(pc)
+                pc = block.end
+        logger.info(f'Prebuilt {len(self.blocks)} blocks')
+
+    def invalidate(self, start, end):
+        """
+        Drops every cached block which covers an address in [start, end)
+        """
+        if not any(self.code[start:end]):
+            return
+        for addr, block in list(self.blocks.items()):
+            if block.start < end and start < block.end:
+                logger.debug(
+                    f'Invalidating block {hexrepr(block.start)} - {hexrepr(block.end)}')
+                del self.blocks[addr]
+                for i in range(block.start, block.end):
+                    self.code[i] -= 1
+
+    def _interpret(self, budget, stop_on, done):
+        stop = self.emulator.run_cycles(budget - done, stop_on)
+        return Stop(stop.reason, done + stop.cycles)
+
+    def run(self, budget, stop_on=()):
+        """
+        Executes up to budget instructions and returns a Stop, as
+        Emulator.run_cycles does with the same stop_on
+        """
+        emu = self.emulator
+        blocks = self.blocks
+        if emu.key_wait is not None:
+            return Stop(KEY_WAIT, 0)
+        if emu.trace or emu.profiler is not None or emu.coverage is not None:
+            # Compiled blocks are not traced, profiled or covered, interpret instead.
+            return emu.run_cycles(budget, stop_on)
+        done = 0
+        while done < budget:
+            pc = emu.pc
+            block = blocks.get(pc)
+            if block is None:
+                if pc > 4094:
+                    # Let the interpreter report the end of memory.
+                    return self._interpret(budget, stop_on, done)
+                block = self.translate(pc)
+            if block.length > budget - done:
+                # Not enough budget left for the whole block
+                return self._interpret(budget, stop_on, done)
+            try:
+                emu.pc = block.function(emu)
+            except Exception as e:
+                logger.exception(
+                    f'{hexrepr(emu.pc)} | Exception while executing this block\n')
+                emu.variable_dump()
+                emu.quit(exitcode=-4)
+                # Stopped on the faulting instruction, as the interpreter,
+                # counting the instructions up to and including it
+                emu.pc_increment = 2
+                return Stop(FAULT, done + (emu.pc - block.start) // 2 + 1)
+            done += block.length
+            if block.stop is not None:
+                if block.stop == FAULT:
+                    # A stack overflow or an illegal return quit the emulator
+                    if not -1 <= emu.stack_pointer < emu.MAX_STACK_SIZE:
+                        return Stop(FAULT, done)
+                elif block.stop in stop_on or block.stop == KEY_WAIT:
+                    return Stop(block.stop, done)
+        return Stop(BUDGET, done)
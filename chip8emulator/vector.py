@@ -0,0 +1,467 @@
+"""
+Runs N CHIP-8 machines in lockstep, with their state kept in NumPy arrays.
+
+    machines = VectorEmulator(1024)
+    machines.load_to_memory(rom)
+    machines.run(cycles=100000)
+
+The state is a struct of arrays, one row per machine: memory (N, 4096),
+V (N, 16), stack (N, 33), framebuffer (N, 32) rows of 64 bits, and I, pc,
+timers, keys, ... (N,). Every cycle fetches the opcode of each machine,
+groups the machines by opcode family and executes every family on its whole
+group with masked array operations.
+
+The semantics are those of Emulator run by headless.run, quirks included
+(FX0F sets the delay timer, 8XY5 and 8XY7 fault when the result would be 256,
+FX0A stops the machine until a key is held at the end of a frame, ...). A machine stops on the events
+which stop a headless run, see status and exit_code.
+Machine i gets the random bytes (prng.py) of settings['seed'] + i.
+
+NumPy is only needed by this module.
+"""
+import base64
+import hashlib
+import random
+import numpy as np
+from .emulator import DEFAULT_FONTSET
+from .prng import BLOCK_SIZE, SEED_MASK, block
+from .scheduler import Scheduler, TIMER_HZ
+from .log import create_logger
+
+logger = create_logger(__name__)
+
+MAX_STACK_SIZE = 32
+
+# status of a machine
+RUNNING = 0
+HALT = 1
+CLOSE = 2
+END = 3
+# Same names as headless.Result.reason, a running machine ran out of cycles
+REASONS = ('cycles', 'halt', 'close', 'end')
+
+_ALL_ROWS = (1 << 32) - 1
+_ONE = np.uint64(1)
+
+
+class VectorEmulator:
+    def __init__(self, n, settings=None):
+        self.n = n
+        self.settings = dict(settings or {})
+        self.memory = np.zeros((n, 4096), np.uint8)
+        self.V = np.zeros((n, 16), np.int64)
+        self.I = np.zeros(n, np.int64)
+        self.pc = np.full(n, 0x200, np.int64)
+        # Like Emulator, the call which overflows the stack is still made
+        # before the machine stops, hence the extra entry.
+        self.stack = np.zeros((n, MAX_STACK_SIZE + 1), np.int64)
+        self.stack_pointer = np.full(n, -1, np.int64)
+        self.delay_timer = np.zeros(n, np.int64)
+        # Bit k is set while key k is held
+        self.keys = np.zeros(n, np.int64)
+        # Register which receives the key after FX0A, -1 when not waiting
+        self.waiting = np.full(n, -1, np.int64)
+        # Same layout as Emulator.framebuffer, bit 63 is the leftmost pixel
+        self.framebuffer = np.zeros((n, 32), np.uint64)
+        self.dirty_rows = np.full(n, _ALL_ROWS, np.int64)
+        self.status = np.zeros(n, np.int8)
+        self.exit_code = np.zeros(n, np.int64)
+        self.instructions = np.zeros(n, np.int64)
+        seed = self.settings.get('seed')
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seeds = [(seed + i) & SEED_MASK for i in range(n)]
+        # State of the random bytes of each machine, see prng.ByteRandom
+        self.random_block = np.full(n, -1, np.int64)
+        self.random_position = np.full(n, BLOCK_SIZE, np.int64)
+        self.random_bytes = np.zeros((n, BLOCK_SIZE), np.uint8)
+
+        fontset = self.settings.get('fontset') or DEFAULT_FONTSET
+        try:
+            font = base64.b64decode(fontset)
+        except Exception as e:
+            logger.warning(
+                'Error while reading fontset from settings, using default one')
+            font = base64.b64decode(DEFAULT_FONTSET)
+        self.load_to_memory(font, offset=0)
+
+        self._families = (
+            self._family_0, self._jump, self._call, self._skip_eq,
+            self._skip_ne, self._skip_eq_reg, self._set, self._add,
+            self._alu, self._skip_ne_reg, self._set_i, self._jump_v0,
+            self._random, self._draw, self._family_e, self._family_f,
+        )
+
+    def load_to_memory(self, array_of_bytes, offset=0x200, machines=slice(None)):
+        """
+        Copies the bytes to the memory of the machines (all of them by default)
+        """
+        data = np.frombuffer(bytes(array_of_bytes), np.uint8)
+        self.memory[machines, offset: offset + len(data)] = data
+
+    def framebuffer_bytes(self, machine):
+        """
+        Same as Emulator.framebuffer_bytes, for one machine.
+        """
+        return self.framebuffer[machine].astype('>u8').tobytes()
+
+    def framebuffer_hash(self, machine):
+        return hashlib.sha1(self.framebuffer_bytes(machine)).hexdigest()
+
+    def reason(self, machine):
+        """
+        Why the machine stopped, as in headless.Result.reason
+        """
+        return REASONS[self.status[machine]]
+
+    def tick_timers(self, machines=slice(None)):
+        """
+        Same as Emulator.tick_timers, for the machines
+        """
+        timer = self.delay_timer[machines]
+        self.delay_timer[machines] = np.where(timer > 0, timer - 1, timer)
+
+    def run(self, cycles, timer_hz=TIMER_HZ, script=None, on_frame=None, cpu_hz=None):
+        """
+        Runs every machine frame by frame like headless.run, for a cycle budget,
+        with the timers on the schedule of a Scheduler.
+        The script is a list of (cycle, key mask), the mask is an int for all
+        the machines or an array with one mask per machine.
+        on_frame(vector_emulator, cycle) is called at the end of every frame.
+        Returns the number of cycles run.
+        """
+        speed = self.settings.get('speed', 10)
+        scheduler = Scheduler(cpu_hz or self.settings.get('cpu_hz') or speed * TIMER_HZ, timer_hz)
+        script = list(script or [])
+        next_event = 0
+        # Machines running in the current frame, and the ones the timers tick
+        machines = alive = None
+
+        def execute(n):
+            nonlocal machines
+            for i in range(n):
+                if not len(machines):
+                    break
+                if self.step(machines):
+                    machines = machines[(self.status[machines] == RUNNING) &
+                                        (self.waiting[machines] < 0)]
+            return True
+
+        def tick():
+            self.tick_timers(alive)
+
+        cycle = 0
+        while cycle < cycles:
+            while next_event < len(script) and script[next_event][0] <= cycle:
+                self.keys[:] = script[next_event][1]
+                next_event += 1
+
+            alive = np.flatnonzero(self.status == RUNNING)
+            if not len(alive):
+                break
+            budget = min(speed, cycles - cycle)
+            machines = alive[self.waiting[alive] < 0]
+            scheduler.run(budget, execute, tick)
+            cycle += budget
+
+            # FX0A, the first key held goes to the register
+            waiting = alive[(self.waiting[alive] >= 0) & (self.keys[alive] != 0)]
+            if len(waiting):
+                keys = self.keys[waiting]
+                first = np.zeros(len(waiting), np.int64)
+                for k in range(15, -1, -1):
+                    first[(keys >> k) & 1 == 1] = k
+                self.V[waiting, self.waiting[waiting]] = first
+                self.waiting[waiting] = -1
+
+            if on_frame is not None:
+                on_frame(self, cycle)
+        return cycle
+
+    def step(self, machines):
+        """
+        Executes one instruction on each of the machines (an array of indices).
+        Returns True if any of them stopped, or started waiting for a key.
+        """
+        status = self.status
+        pc = self.pc[machines]
+        # Running off the end of the memory, pc 4095 faults while fetching.
+        past = pc >= 4095
+        if past.any():
+            end = machines[pc >= 4096]
+            status[end] = END
+            fetch = machines[pc == 4095]
+            status[fetch] = CLOSE
+            self.exit_code[fetch] = -6
+            machines = machines[~past]
+            pc = pc[~past]
+            if not len(machines):
+                return True
+        stopped = past.any()
+
+        # Both bytes of the opcode with one gather, unless a pc is odd
+        address = machines*4096 + pc
+        memory = self.memory.reshape(-1)
+        if (address & 1).any():
+            op = (memory[address].astype(np.int64) << 8) | memory[address + 1]
+        else:
+            op = memory.view('>u2')[address >> 1].astype(np.int64)
+        self.instructions[machines] += 1
+
+        family = (op >> 12).astype(np.uint8)
+        first = family[0]
+        if (family == first).all():
+            # Typically every machine runs the same code
+            return self._families[first](machines, op, pc) or stopped
+        # A radix sort, as the keys are bytes
+        order = np.argsort(family, kind='stable')
+        bounds = np.cumsum(np.bincount(family, minlength=16))
+        start = 0
+        for f in range(16):
+            end = bounds[f]
+            if end > start:
+                group = order[start:end]
+                if self._families[f](machines[group], op[group], pc[group]):
+                    stopped = True
+            start = end
+        return stopped
+
+    def _fault(self, machines, exitcode):
+        # An exception in Emulator.execute_opcode, quit(exitcode)
+        self.status[machines] = CLOSE
+        self.exit_code[machines] = exitcode
+        return True
+
+    # The families get the machines, their opcodes and pcs, set the next pcs
+    # and return True if any machine stopped.
+
+    def _family_0(self, m, op, pc):
+        self.pc[m] = pc + 2
+        stopped = False
+        clear = op == 0x00E0
+        if clear.any():
+            self.framebuffer[m[clear]] = 0
+            self.dirty_rows[m[clear]] = _ALL_ROWS
+        ret = op == 0x00EE
+        if ret.any():
+            r = m[ret]
+            sp = self.stack_pointer[r]
+            self.stack_pointer[r] = sp - 1
+            ok = sp >= 0
+            self.pc[r[ok]] = self.stack[r[ok], sp[ok]] + 2
+            if not ok.all():
+                # Illegal return statement
+                stopped = self._fault(r[~ok], -3)
+        halt = op == 0x0FFF
+        if halt.any():
+            self.status[m[halt]] = HALT
+            stopped = True
+        return stopped
+
+    def _jump(self, m, op, pc):
+        self.pc[m] = op & 0xFFF
+
+    def _call(self, m, op, pc):
+        sp = self.stack_pointer[m] + 1
+        self.stack_pointer[m] = sp
+        self.stack[m, sp] = pc
+        self.pc[m] = op & 0xFFF
+        overflow = sp >= MAX_STACK_SIZE
+        if overflow.any():
+            return self._fault(m[overflow], -2)
+
+    def _skip_eq(self, m, op, pc):
+        self.pc[m] = pc + np.where(self.V[m, (op >> 8) & 0xF] == op & 0xFF, 4, 2)
+
+    def _skip_ne(self, m, op, pc):
+        self.pc[m] = pc + np.where(self.V[m, (op >> 8) & 0xF] != op & 0xFF, 4, 2)
+
+    def _skip_eq_reg(self, m, op, pc):
+        V = self.V
+        skip = (op & 0xF == 0) & (V[m, (op >> 8) & 0xF] == V[m, (op >> 4) & 0xF])
+        self.pc[m] = pc + np.where(skip, 4, 2)
+
+    def _skip_ne_reg(self, m, op, pc):
+        V = self.V
+        skip = (op & 0xF == 0) & (V[m, (op >> 8) & 0xF] != V[m, (op >> 4) & 0xF])
+        self.pc[m] = pc + np.where(skip, 4, 2)
+
+    def _set(self, m, op, pc):
+        self.V[m, (op >> 8) & 0xF] = op & 0xFF
+        self.pc[m] = pc + 2
+
+    def _add(self, m, op, pc):
+        x = (op >> 8) & 0xF
+        self.V[m, x] = (self.V[m, x] + (op & 0xFF)) & 0xFF
+        self.pc[m] = pc + 2
+
+    def _set_i(self, m, op, pc):
+        self.I[m] = op & 0xFFF
+        self.pc[m] = pc + 2
+
+    def _jump_v0(self, m, op, pc):
+        self.pc[m] = self.V[m, 0] + (op & 0xFFF)
+
+    def _random(self, m, op, pc):
+        position = self.random_position[m]
+        used = position == BLOCK_SIZE
+        if used.any():
+            for machine in m[used]:
+                k = self.random_block[machine] + 1
+                self.random_block[machine] = k
+                self.random_bytes[machine] = np.frombuffer(
+                    block(self.seeds[machine], int(k)), np.uint8)
+            position = np.where(used, 0, position)
+        self.V[m, (op >> 8) & 0xF] = self.random_bytes[m, position] & op & 0xFF
+        self.random_position[m] = position + 1
+        self.pc[m] = pc + 2
+
+    def _alu(self, m, op, pc):
+        # VF is written before VX, like Emulator, which matters when X is F.
+        V = self.V
+        self.pc[m] = pc + 2
+        stopped = False
+        kind = op & 0xF
+        for k in np.unique(kind):
+            sel = kind == k
+            r = m[sel]
+            x = (op[sel] >> 8) & 0xF
+            y = (op[sel] >> 4) & 0xF
+            if k == 0x0:
+                V[r, x] = V[r, y]
+            elif k == 0x1:
+                V[r, x] = V[r, x] | V[r, y]
+            elif k == 0x2:
+                V[r, x] = V[r, x] & V[r, y]
+            elif k == 0x3:
+                V[r, x] = V[r, x] ^ V[r, y]
+            elif k == 0x4:
+                V[r, 0xF] = V[r, x] + V[r, y] > 0xFF
+                V[r, x] = (V[r, x] + V[r, y]) & 0xFF
+            elif k == 0x6:
+                V[r, 0xF] = V[r, x] & 1
+                V[r, x] = V[r, x] >> 1
+            elif k == 0xE:
+                V[r, 0xF] = (V[r, x] & 0x80) >> 7
+                V[r, x] = (V[r, x] << 1) & 0xFF
+            elif k in (0x5, 0x7):
+                if k == 0x5:
+                    borrow = ~(V[r, x] > V[r, y])
+                    V[r, 0xF] = borrow
+                    result = V[r, x] - V[r, y] + 256*borrow
+                else:
+                    borrow = ~(V[r, y] > V[r, x])
+                    V[r, 0xF] = borrow
+                    result = V[r, y] - V[r, x] + 256*borrow
+                # The result does not fit in a byte, e.g 0 - 0 + 256
+                bad = (result < 0) | (result > 0xFF)
+                V[r[~bad], x[~bad]] = result[~bad]
+                if bad.any():
+                    self.pc[r[bad]] = pc[sel][bad]
+                    stopped = self._fault(r[bad], -4)
+        return stopped
+
+    def _draw(self, m, op, pc):
+        # All the rows of the sprites at once, one row of the arrays per machine
+        V = self.V
+        sx = (V[m, (op >> 8) & 0xF] % 64).astype(np.uint64)
+        sy = V[m, (op >> 4) & 0xF]
+        n = op & 0xF
+        V[m, 0xF] = 0
+        i = np.arange(n.max())
+        address = self.I[m, None] + i
+        active = i < n[:, None]
+        # Reading past the end of the memory faults, with the rows before
+        # it already drawn
+        outside = active & (address >= 4096)
+        ok = ~outside.any(axis=1)
+        if not ok.all():
+            active &= i < np.where(ok, 16, outside.argmax(axis=1))[:, None]
+        address = np.where(active, address, 0)
+        line = self.memory.reshape(-1)[m[:, None]*4096 + address].astype(np.uint64)
+        line[~active] = 0
+        line <<= np.uint64(56)
+        # Rotate right, so that the sprite wraps around the screen
+        s = sx[:, None]
+        bits = (line >> s) | ((line << (np.uint64(63) - s)) << _ONE)
+        row = (sy[:, None] + i) % 32
+        drawn = line != 0
+        framebuffer = self.framebuffer.reshape(-1)
+        index = (m[:, None]*32 + row)[drawn]
+        bits = bits[drawn]
+        pixels = framebuffer[index]
+        framebuffer[index] = pixels ^ bits
+        collision = np.zeros(line.shape, bool)
+        collision[drawn] = (pixels & bits) != 0
+        dirty = np.bitwise_or.reduce(np.where(drawn, 1 << row, 0), axis=1)
+
+        self.dirty_rows[m[ok]] |= dirty[ok]
+        V[m[ok], 0xF] = collision[ok].any(axis=1)
+        self.pc[m[ok]] = pc[ok] + 2
+        if not ok.all():
+            return self._fault(m[~ok], -4)
+
+    def _family_e(self, m, op, pc):
+        low = op & 0xFF
+        key = self.V[m, (op >> 8) & 0xF]
+        # KEY_BITS[V[X]] faults for V[X] > 15
+        bad = ((low == 0x9E) | (low == 0xA1)) & (key > 15)
+        held = (self.keys[m] >> np.minimum(key, 15)) & 1 == 1
+        skip = ((low == 0x9E) & held) | ((low == 0xA1) & ~held)
+        self.pc[m] = np.where(bad, pc, pc + np.where(skip, 4, 2))
+        if bad.any():
+            return self._fault(m[bad], -4)
+
+    def _family_f(self, m, op, pc):
+        V = self.V
+        self.pc[m] = pc + 2
+        stopped = False
+        low = op & 0xFF
+        for k in np.unique(low):
+            sel = low == k
+            r = m[sel]
+            x = (op[sel] >> 8) & 0xF
+            if k == 0x07:
+                V[r, x] = self.delay_timer[r]
+            elif k == 0x0A:
+                # Halting operation, the machine waits for a key
+                self.waiting[r] = x
+                stopped = True
+            elif k == 0x0F:
+                self.delay_timer[r] = V[r, x]
+            elif k == 0x1E:
+                self.I[r] = (self.I[r] + V[r, x]) & 0xFFFF
+            elif k == 0x29:
+                self.I[r] = 5*V[r, x]
+            elif k in (0x33, 0x55, 0x65):
+                if self._transfer(k, r, x, pc[sel]):
+                    stopped = True
+        return stopped
+
+    def _transfer(self, k, m, x, pc):
+        # FX33, FX55 and FX65, byte by byte, a byte past the end of the
+        # memory faults with the bytes before it already copied.
+        V = self.V
+        memory = self.memory
+        I = self.I[m]
+        if k == 0x33:
+            v = V[m, x]
+            values = (v // 100 % 10, v // 10 % 10, v % 10)
+            count = np.full(len(m), 3)
+        else:
+            count = x + 1
+        ok = np.ones(len(m), bool)
+        for i in range(count.max()):
+            active = ok & (i < count)
+            address = I + i
+            ok &= ~(active & (address >= 4096))
+            a = np.flatnonzero(active & ok)
+            if k == 0x33:
+                memory[m[a], address[a]] = values[i][a]
+            elif k == 0x55:
+                memory[m[a], address[a]] = V[m[a], i]
+            else:
+                V[m[a], i] = memory[m[a], address[a]]
+        if not ok.all():
+            self.pc[m[~ok]] = pc[~ok]
+            return self._fault(m[~ok], -4)
@@ -2,16 +2,26 @@ import os
 import sys
 from chip8emulator import Engine
 from chip8emulator import log
+from chip8emulator.library import RomLibrary
 logger = log.create_logger(__name__)
 if __name__ == '__main__':
     if len(sys.argv) > 1:
-        if os.path.isfile(sys.argv[1]):
+        rompath = sys.argv[1]
+        if not os.path.isfile(rompath):
+            # The SHA-256 of a rom of the library, or the start of it
+            library = RomLibrary('roms')
+            library.scan()
+            try:
+                rompath = library.path(library.find(rompath))
+            except KeyError:
+                rompath = None
+        if rompath is not None:
             engine = Engine()
             engine.load_settings()
             engine.init()
-            engine.run(rompath=sys.argv[1])
+            engine.run(rompath=rompath)
         else:
-            logger.info('Please specify a valid rom file name.')
+            logger.info('Please specify a valid rom file name or hash.')
     else:
         engine = Engine()
         engine.load_settings()
@@ -0,0 +1,87 @@
+import os
+from chip8emulator import analysis, headless
+from chip8emulator.translator import BlockTranslator
+
+ROM = bytes([
+    0x22, 0x0C,  # 0x200 CALL 0x20C
+    0x30, 0x01,  # 0x202 IF V0 == 1 SKIP
+    0x12, 0x0A,  # 0x204 JUMP 0x20A
+    0xA2, 0x16,  # 0x206 I = 0x216
+    0xD0, 0x13,  # 0x208 DRAW V0, V1, 3
+    0x12, 0x00,  # 0x20A JUMP 0x200
+    0xA2, 0x19,  # 0x20C I = 0x219
+    0xF1, 0x65,  # 0x20E Load V0-V1 from I
+    0x00, 0xEE,  # 0x210 RETURN
+    0xB3, 0x00,  # 0x212 PC = V0 + 0x300, never reached
+    0x00, 0x00,
+    0xF0, 0x90, 0xF0,  # 0x216 sprite
+    0x01, 0x00,  # 0x219 data
+])
+
+
+def test_blocks():
+    result = analysis.analyze(ROM)
+    blocks = {start: (block.end, block.successors) for start, block in result.blocks.items()}
+    assert blocks == {
+        0x200: (0x202, (0x202,)),
+        0x202: (0x204, (0x204, 0x206)),
+        0x204: (0x206, (0x20A,)),
+        0x206: (0x20A, (0x20A,)),
+        0x20A: (0x20C, (0x200,)),
+        0x20C: (0x212, ()),
+    }
+    assert result.functions == {0x200: (0x20C,), 0x20C: ()}
+    # The sprite and the bytes loaded into V0-V1, next to each other
+    assert result.data == [(0x216, 0x21B)]
+    # Not reachable
+    assert result.dynamic_jumps == []
+    assert 0x212 not in result.code()
+
+
+def test_dynamic_jumps():
+    result = analysis.analyze(bytes([0x60, 0x02, 0xB2, 0x04]))
+    assert result.dynamic_jumps == [0x202]
+    assert result.blocks[0x200].successors == ()
+
+
+def test_bytes_roundtrip():
+    result = analysis.analyze(ROM)
+    loaded = analysis.Analysis.from_bytes(result.to_bytes())
+    assert loaded.rom_hash == result.rom_hash
+    assert ({s: (b.end, b.successors) for s, b in loaded.blocks.items()} ==
+            {s: (b.end, b.successors) for s, b in result.blocks.items()})
+    assert loaded.functions == result.functions
+    assert loaded.data == result.data
+
+
+def test_cache(tmp_path, monkeypatch):
+    first = analysis.load(ROM, str(tmp_path))
+    files = os.listdir(tmp_path)
+    assert files == [first.rom_hash.hex() + '.c8a']
+
+    def fail(rom):
+        raise AssertionError('analysed again')
+    monkeypatch.setattr(analysis, 'analyze', fail)
+    assert analysis.load(ROM, str(tmp_path)).functions == first.functions
+
+    # A damaged file is analysed again
+    (tmp_path / files[0]).write_bytes(b'C8AN')
+    monkeypatch.undo()
+    assert analysis.load(ROM, str(tmp_path)).functions == first.functions
+    assert len((tmp_path / files[0]).read_bytes()) > 4
+
+
+def test_prebuild():
+    with open('roms/BRIX', 'rb') as rom:
+        data = rom.read()
+    settings = dict(headless.DEFAULT_SETTINGS, execution_engine='translator', seed=0)
+    emulator = headless.create_emulator(dict(settings))
+    emulator.load_to_memory(bytearray(data))
+    translator = BlockTranslator(emulator)
+    translator.prebuild(analysis.analyze(data))
+    assert 0x200 in translator.blocks
+    assert len(translator.blocks) >= len(analysis.analyze(data).blocks)
+
+    results = [headless.run_rom('roms/BRIX', dict(settings, execution_engine=engine), cycles=5000)
+               for engine in ('interpreter', 'translator')]
+    assert results[0].framebuffer_hash == results[1].framebuffer_hash
@@ -0,0 +1,87 @@
+import os
+from chip8emulator import exerciser, headless
+from chip8emulator.coverage import Coverage, report
+
+# V0 = 5, loops on 0x202 until key 5 is held, then V1 = 1 at 0x206
+KEY_GATE = bytearray([0x60, 0x05, 0xE0, 0x9E, 0x12, 0x02, 0x61, 0x01, 0x12, 0x08])
+
+
+def run(rom, cycles=1000, script=None, **settings):
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=3, **settings))
+    emulator.load_to_memory(rom)
+    return emulator, headless.run(emulator, cycles=cycles, script=script)
+
+
+def read_rom(name):
+    with open(os.path.join('roms', name), 'rb') as rom:
+        return rom.read()
+
+
+def test_disabled_by_default():
+    emulator, result = run(KEY_GATE)
+    assert emulator.coverage is None
+    assert result.coverage is None
+
+
+def test_executed_and_skips():
+    _, result = run(KEY_GATE, coverage=True)
+    executed, taken, not_taken = result.coverage.maps()
+    assert [pc for pc in range(4096) if executed[pc]] == [0x200, 0x202, 0x204]
+    assert not taken[0x202] and not_taken[0x202]
+
+    _, result = run(KEY_GATE, coverage=True, script=[(300, 1 << 5)])
+    executed, taken, not_taken = result.coverage.maps()
+    assert [pc for pc in range(4096) if executed[pc]] == [0x200, 0x202, 0x204, 0x206, 0x208]
+    assert taken[0x202] and not_taken[0x202]
+    assert result.coverage.counts() == (5, 1, 1)
+
+
+def test_same_run_with_coverage():
+    rom = read_rom('BRIX')
+    _, plain = run(rom, cycles=5000)
+    _, covered = run(rom, cycles=5000, coverage=True)
+    assert covered.framebuffer_hash == plain.framebuffer_hash
+    assert covered.instructions == plain.instructions
+
+
+def test_bitmap_and_merge():
+    _, result = run(KEY_GATE, coverage=True, script=[(300, 1 << 5)])
+    coverage = result.coverage
+    bitmap = coverage.bitmap()
+    assert len(bitmap) == 3 * 512
+    # Bit 7 of byte 0x40 is address 0x200
+    assert bitmap[0x40:0x42] == bytes([0b10101010, 0b10000000])
+    assert Coverage.from_bitmap(bitmap).maps() == coverage.maps()
+
+    total = Coverage()
+    assert total.merge(coverage) == 7
+    assert total.merge(coverage) == 0
+    assert total.maps() == coverage.maps()
+
+
+def test_report():
+    _, result = run(KEY_GATE, coverage=True)
+    text = report(result.coverage, bytes(KEY_GATE))
+    assert text.startswith('3/5 instructions executed (60.0%), 0/1 skips taken both ways')
+    assert '+  0x0202  |  0xe09e' in text
+    assert '[skip not taken]' in text
+    assert '   0x0206  |  0x6101' in text
+
+
+def test_to_script():
+    presses = [(10, 20, 5), (20, 20, 1), (100, 10, 5)]
+    assert exerciser.to_script(presses) == [
+        (10, 1 << 5), (20, 1 << 5 | 1 << 1), (30, 1 << 1), (40, 0), (100, 1 << 5), (110, 0)]
+    assert headless.format_input_script(exerciser.to_script(presses[:1])) == '10 5\n30 -\n'
+
+
+def test_exerciser_finds_new_code():
+    target = exerciser.Target('KEY_GATE', KEY_GATE)
+    exerciser.exercise([target], rounds=4, population=16, cycles=2000, workers=1)
+    assert target.runs == 1 + 4 * 16
+    assert target.coverage.maps()[0][0x206]
+    assert target.corpus[0] == []
+    # The input found replays the same from a script
+    found = next(presses for presses in target.corpus if presses)
+    _, result = run(KEY_GATE, cycles=2000, coverage=True, script=exerciser.to_script(found))
+    assert result.coverage.maps()[0][0x206]
@@ -0,0 +1,66 @@
+from chip8emulator import Emulator
+
+
+def lit(emu: Emulator):
+    return {(x, y) for y in range(32) for x in range(64) if emu.pixel(x, y)}
+
+
+def test_draw_font_sprite(emu: Emulator):
+    # Draws the sprite of 0 (F0 90 90 90 F0) at V3, V5 = 211, 181, i.e 19, 21
+    emu.I = 0
+    emu.execute_opcode(0xD355)
+    assert emu.V[0xF] == 0
+    assert emu.framebuffer[21] == 0xF0 << (56 - 19)
+    assert emu.framebuffer[22] == 0x90 << (56 - 19)
+    assert len(lit(emu)) == 4 + 2 + 2 + 2 + 4
+
+
+def test_draw_wraps_around(emu: Emulator):
+    emu.I = 0
+    emu.V[1] = 62
+    emu.V[2] = 31
+    emu.execute_opcode(0xD122)
+    # Top row of 0 (F0) at x = 62, 63, 0, 1 on the last line
+    assert lit(emu) >= {(62, 31), (63, 31), (0, 31), (1, 31)}
+    # Second row (90) wraps to the first line
+    assert emu.pixel(62, 0) == 1
+    assert emu.pixel(1, 0) == 1
+    assert emu.pixel(63, 0) == 0
+
+
+def test_draw_collision(emu: Emulator):
+    emu.I = 0
+    emu.V[1] = 8
+    emu.V[2] = 4
+    emu.execute_opcode(0xD125)
+    assert emu.V[0xF] == 0
+    # Drawing the same sprite again erases it and reports a collision
+    emu.execute_opcode(0xD125)
+    assert emu.V[0xF] == 1
+    assert lit(emu) == set()
+
+    # Only touching, no overlap
+    emu.execute_opcode(0xD125)
+    emu.V[1] = 12
+    emu.execute_opcode(0xD125)
+    assert emu.V[0xF] == 0
+
+
+def test_clear_is_in_place(emu: Emulator):
+    framebuffer = emu.framebuffer
+    emu.I = 0
+    emu.execute_opcode(0xD355)
+    emu.execute_opcode(0x00E0)
+    assert emu.framebuffer is framebuffer
+    assert framebuffer == [0]*32
+
+
+def test_framebuffer_bytes(emu: Emulator):
+    emu.I = 0
+    emu.V[1] = 0
+    emu.V[2] = 0
+    emu.execute_opcode(0xD121)
+    data = emu.framebuffer_bytes()
+    assert len(data) == 256
+    assert data[0] == 0xF0
+    assert data[1:] == bytes(255)
@@ -0,0 +1,48 @@
+import os
+from chip8emulator import farm, headless
+
+
+def read_rom(name):
+    with open(os.path.join('roms', name), 'rb') as rom:
+        return rom.read()
+
+
+def test_results_match_headless_runs():
+    names = ['PONG', 'MAZE', 'BRIX', 'TEST_ROM_DISPLAY_A']
+    jobs = [farm.Job(read_rom(name), cycles=2000, name=name, seed=7)
+            for name in names]
+    results = list(farm.run_jobs(jobs, workers=2))
+
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    for result in results:
+        expected = headless.run_rom(os.path.join('roms', result.name),
+                                    dict(headless.load_settings(), seed=7), cycles=2000)
+        assert result.reason == expected.reason
+        assert result.instructions == expected.instructions
+        assert result.framebuffer_hash == expected.framebuffer_hash
+
+
+def test_worker_emulator_is_reused_between_jobs():
+    rom = read_rom('MAZE')
+    first = farm.run_job(0, farm.Job(rom, cycles=500, seed=1))
+    emulator = farm._get_emulator(farm.Job(rom).settings)
+    second = farm.run_job(1, farm.Job(rom, cycles=500, seed=1))
+    assert farm._get_emulator(farm.Job(rom).settings) is emulator
+    assert first.framebuffer_hash == second.framebuffer_hash
+
+
+def test_snapshots():
+    job = farm.Job(read_rom('MAZE'), cycles=1000, snapshots=[0, 500, 1000])
+    result = farm.run_job(0, job)
+    assert sorted(result.snapshots) == [0, 500, 1000]
+    assert all(len(snapshot) == 256 for snapshot in result.snapshots.values())
+    assert result.snapshots[500] != result.snapshots[1000]
+
+
+def test_profile_of_each_job():
+    job = farm.Job(read_rom('MAZE'), settings={'profile': True}, cycles=500, seed=1)
+    first = farm.run_job(0, job)
+    second = farm.run_job(1, job)
+    assert first.profiler is not second.profiler
+    assert first.profiler.instructions == second.profiler.instructions == 500
+    assert first.profiler.opcodes == second.profiler.opcodes
@@ -107,3 +107,22 @@ def test_jump_to_V0_plus_NNN(emu: Emulator):
     emu.execute_opcode(0xB320)
     assert emu.pc_increment == 0
     assert emu.pc == 121 + 0x320
+
+
+def test_wait_key(emu: Emulator):
+    # FX0A, the front end completes the wait with a key
+    assert emu.key_wait is None
+    assert not emu.key_pressed(7)
+    emu.execute_opcode(0xF40A)
+    assert emu.key_wait == 4
+    assert not emu.key_held()
+    emu.keys |= 1 << 9
+    emu.keys |= 1 << 0xC
+    assert emu.key_held()
+    assert emu.V[4] == 9
+    assert emu.key_wait is None
+
+    emu.execute_opcode(0xF20A)
+    assert emu.key_pressed(0xE)
+    assert emu.V[2] == 0xE
+    assert emu.key_wait is None
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+from chip8emulator import headless
+
+
+def test_headless_does_not_import_pygame():
+    code = ('import sys, chip8emulator.headless; '
+            'sys.exit(1 if "pygame" in sys.modules else 0)')
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0
+
+
+def test_run_until_halt():
+    result = headless.run_rom(os.path.join('roms', 'TEST_ROM_DISPLAY_A'),
+                              headless.load_settings(), cycles=1000)
+    assert result.reason == 'halt'
+    assert result.instructions == 7
+    assert result.frames == 1
+    # The rom draws the letter A
+    emulator = headless.create_emulator(headless.load_settings())
+    assert result.framebuffer_hash != headless.framebuffer_hash(emulator)
+
+
+def test_cycle_budget():
+    settings = headless.load_settings()
+    result = headless.run_rom(os.path.join('roms', 'MAZE'), settings, cycles=1005)
+    assert result.reason == 'cycles'
+    assert result.cycles == 1005
+    assert result.frames == 101
+
+
+# V0 = FF, delay timer = V0, then V1 = delay timer forever
+DELAY_TIMER = bytes([0x60, 0xFF, 0xF0, 0x0F, 0xF1, 0x07, 0x12, 0x04])
+
+
+def test_timer_schedule():
+    for cpu_hz, timer_hz, cycles, ticks in ((600, 60, 600, 60), (600, 120, 600, 120),
+                                            (700, 60, 700, 60), (600, 60, 1000, 100)):
+        emulator = headless.create_emulator(headless.load_settings())
+        emulator.load_to_memory(DELAY_TIMER)
+        headless.run(emulator, cycles=cycles, cpu_hz=cpu_hz, timer_hz=timer_hz)
+        # The timer is set on the second cycle, the ticks before it are lost
+        assert emulator.delay_timer == 0xFF - ticks
+
+
+def test_translator_gives_the_same_framebuffer():
+    interpreter = headless.load_settings()
+    translator = dict(interpreter, execution_engine='translator')
+    path = os.path.join('roms', 'BLITZ')
+    assert (headless.run_rom(path, interpreter, cycles=5000).framebuffer_hash ==
+            headless.run_rom(path, translator, cycles=5000).framebuffer_hash)
+
+
+def test_input_script(tmp_path):
+    script = tmp_path / 'keys.txt'
+    script.write_text('# cycle keys\n0 -\n20 5a\n40 -\n')
+    events = headless.load_input_script(str(script))
+    assert events == [(0, 0), (20, (1 << 5) | (1 << 0xa)), (40, 0)]
+
+    emulator = headless.create_emulator(headless.load_settings())
+    # FX0A waits for a key, V[3] = key
+    emulator.load_to_memory(bytearray([0xF3, 0x0A, 0x12, 0x02]))
+    headless.run(emulator, cycles=30, script=events)
+    assert emulator.V[3] == 5
+
+
+def test_main(capsys):
+    assert headless.main(['--cycles', '100', os.path.join('roms', 'PONG')]) == 0
+    assert 'PONG' in capsys.readouterr().out
@@ -0,0 +1,104 @@
+import pytest
+from chip8emulator import headless
+from chip8emulator.idle import IdleLoops
+
+# 0x200 V0 = 3; DT = V0; 0x204 V1 = DT; IF V1 == 0 SKIP; JUMP 0x204;
+# 0x20A V2 += 1; JUMP 0x20A
+TIMER_POLL = bytearray([0x60, 0x03, 0xF0, 0x0F, 0xF1, 0x07, 0x31, 0x00, 0x12, 0x04,
+                        0x72, 0x01, 0x12, 0x0A])
+# 0x200 V0 = 5; IF not key(V0) SKIP; JUMP 0x208; JUMP 0x202; 0x208 JUMP 0x208
+KEY_POLL = bytearray([0x60, 0x05, 0xE0, 0xA1, 0x12, 0x08, 0x12, 0x02, 0x12, 0x08])
+# 0x200 V0 = 0x20; JUMP 0x204; 0x204 IF not key(V0) SKIP (faults); JUMP 0x204
+BAD_KEY_POLL = bytearray([0x60, 0x20, 0x12, 0x04, 0xE0, 0xA1, 0x12, 0x04])
+# 0x200 I = 0xFFF; JUMP 0x204; 0x204 V0 = 1; V0-V1 = memory[I] (faults); JUMP 0x204
+BAD_LOAD_LOOP = bytearray([0xAF, 0xFF, 0x12, 0x04, 0x60, 0x01, 0xF1, 0x65, 0x12, 0x04])
+
+
+def run(rom, mode, cycles=1000, script=None):
+    emulator = headless.create_emulator(
+        dict(headless.DEFAULT_SETTINGS, seed=0, idle_loops=mode))
+    emulator.load_to_memory(rom)
+    result = headless.run(emulator, cycles=cycles, script=script)
+    return emulator, result
+
+
+@pytest.mark.parametrize('rom', [TIMER_POLL, KEY_POLL])
+def test_same_state_as_running(rom):
+    script = [(300, 1 << 5)]
+    ran, ran_result = run(rom, 'run', script=script)
+    skipped, skipped_result = run(rom, 'skip', script=script)
+    assert skipped.V == ran.V
+    assert skipped.pc == ran.pc
+    assert skipped.delay_timer == ran.delay_timer
+    assert skipped_result.instructions == ran_result.instructions == 1000
+    # Only the instructions actually run count towards the speed
+    assert ran_result.executed == 1000
+    assert skipped_result.skipped > 0
+    assert skipped_result.executed == 1000 - skipped_result.skipped
+
+
+def test_timer_poll_is_skipped():
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+    emulator.load_to_memory(TIMER_POLL)
+    idle = IdleLoops(emulator)
+    for i in range(5):
+        emulator.execute_opcode_from_memory()
+    assert emulator.pc == 0x204
+    # One iteration of 3 instructions is run, the next 99 are skipped
+    assert idle.skip(300) == 300
+    assert idle.skipped == 297
+    assert emulator.pc == 0x204
+    emulator.delay_timer = 0
+    assert idle.skip(300) == 2
+    assert emulator.pc == 0x20A
+
+
+def test_counting_loop_is_not_skipped():
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+    emulator.load_to_memory(TIMER_POLL)
+    idle = IdleLoops(emulator)
+    emulator.pc = 0x20A
+    assert idle.skip(100) == 2
+    assert emulator.V[2] == 1
+    assert idle.skipped == 0
+
+
+def test_memory_write_forgets_the_loop():
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+    emulator.load_to_memory(KEY_POLL)
+    idle = IdleLoops(emulator)
+    emulator.pc = 0x208
+    assert idle.skip(10) == 10
+    # JUMP 0x208 becomes V1 += 1; JUMP 0x208
+    emulator.load_to_memory(bytearray([0x71, 0x01, 0x12, 0x08]), 0x208)
+    emulator.pc = 0x208
+    assert idle.skip(10) == 2
+    assert emulator.V[1] == 1
+
+
+def test_roms_unchanged():
+    script = [(cycle, 1 << (cycle // 1000 % 16)) for cycle in range(0, 20000, 500)]
+    for name in ('MAZE', 'BRIX', 'TETRIS'):
+        with open(f'roms/{name}', 'rb') as rom:
+            data = bytearray(rom.read())
+        ran, ran_result = run(data, 'run', 20000, script)
+        skipped, skipped_result = run(data, 'skip', 20000, script)
+        assert skipped_result.framebuffer_hash == ran_result.framebuffer_hash
+        assert (skipped.V, skipped.I, skipped.pc) == (ran.V, ran.I, ran.pc)
+
+
+@pytest.mark.parametrize('rom', [BAD_KEY_POLL, BAD_LOAD_LOOP])
+def test_fault_in_loop(rom):
+    states = []
+    for mode in ('run', 'skip'):
+        emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+        closed = []
+        emulator.ext_functions['close'] = closed.append
+        emulator.load_to_memory(rom)
+        if mode == 'skip':
+            emulator.idle = IdleLoops(emulator)
+        stop = emulator.run_cycles(1000)
+        # Reported once, by the interpreter
+        assert closed == [-4]
+        states.append((stop.reason, stop.cycles, emulator.snapshot()))
+    assert states[0] == states[1]
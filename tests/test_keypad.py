@@ -0,0 +1,44 @@
+import pytest
+from chip8emulator import headless
+from chip8emulator.keypad import Keypad, DEFAULT_KEYMAP, lowest_key
+
+
+def key_code(name):
+    if len(name) != 1:
+        raise ValueError(f'unknown key name {name}')
+    return ord(name)
+
+
+def test_events():
+    keypad = Keypad(DEFAULT_KEYMAP, key_code)
+    assert len(keypad.bits) == 16
+    assert keypad.key_down(ord('x')) == 0
+    assert keypad.key_down(ord('v')) == 0xF
+    assert keypad.key_down(ord('p')) is None
+    assert keypad.mask == 0x8001
+    keypad.key_up(ord('x'))
+    keypad.key_up(ord('p'))
+    assert keypad.mask == 0x8000
+    keypad.release_all()
+    assert keypad.mask == 0
+
+
+def test_bad_mappings():
+    keypad = Keypad({'x': '10', 'y': 'g', 'escape': '1', 'z': 'A'}, key_code)
+    assert keypad.bits == {ord('z'): 1 << 0xA}
+
+
+def test_lowest_key():
+    assert lowest_key(0) == -1
+    assert lowest_key(0b1010_0000) == 5
+
+
+@pytest.mark.parametrize('op,skipped', [(0xE09E, True), (0xE0A1, False),
+                                        (0xE19E, False), (0xE1A1, True)])
+def test_skip_key(op, skipped):
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+    emulator.V[0] = 0xB
+    emulator.V[1] = 0xC
+    emulator.keys = 1 << 0xB
+    emulator.execute_opcode(op)
+    assert emulator.pc == (0x204 if skipped else 0x202)
@@ -0,0 +1,74 @@
+import os
+import shutil
+import pytest
+from chip8emulator import library
+from chip8emulator.library import RomLibrary
+
+
+@pytest.fixture
+def roms(tmp_path):
+    for name in ('PONG', 'MAZE', '___README___'):
+        shutil.copy(os.path.join('roms', name), tmp_path / name)
+    (tmp_path / 'sub').mkdir()
+    shutil.copy(os.path.join('roms', 'BRIX'), tmp_path / 'sub' / 'BRIX')
+    return tmp_path
+
+
+def test_scan(roms):
+    lib = RomLibrary(str(roms))
+    assert lib.scan() == (3, 0)
+    assert [rom.path for rom in lib.list()] == ['MAZE', 'PONG', 'sub/BRIX']
+    pong = lib.roms['PONG']
+    assert pong.size == 246
+    assert pong.metadata['platform'] == 'chip-8'
+    assert pong.metadata['random']
+    assert os.path.exists(roms / library.INDEX_NAME)
+
+
+def test_incremental_scan(roms, monkeypatch):
+    RomLibrary(str(roms)).scan()
+    detected = []
+    monkeypatch.setattr(library, 'detect', lambda data: detected.append(data) or {})
+
+    lib = RomLibrary(str(roms))
+    assert len(lib) == 3
+    assert lib.scan() == (0, 0)
+    assert detected == []
+
+    (roms / 'MAZE').write_bytes(b'\x12\x00\x00')
+    os.remove(roms / 'PONG')
+    assert lib.scan() == (1, 1)
+    assert detected == [b'\x12\x00\x00']
+    assert RomLibrary(str(roms)).roms.keys() == {'MAZE', 'sub/BRIX'}
+
+
+def test_find_and_read(roms):
+    lib = RomLibrary(str(roms), cache_bytes=300)
+    lib.scan()
+    brix = lib.roms['sub/BRIX']
+    assert lib.find(brix.sha256[:8].upper()) is brix
+    with pytest.raises(KeyError):
+        lib.find('')
+    with open(roms / 'sub' / 'BRIX', 'rb') as f:
+        assert lib.read(brix.sha256) == f.read()
+    # Served from the cache from now on
+    os.remove(roms / 'sub' / 'BRIX')
+    assert len(lib.read(brix)) == 280
+    # PONG does not fit with BRIX in 300 bytes
+    lib.read(lib.roms['PONG'])
+    assert list(lib.images) == [lib.roms['PONG'].sha256]
+
+
+def test_changed_file(roms):
+    lib = RomLibrary(str(roms))
+    lib.scan()
+    (roms / 'MAZE').write_bytes(b'\x12\x00')
+    with pytest.raises(ValueError):
+        lib.read(lib.roms['MAZE'])
+
+
+def test_damaged_index(roms):
+    (roms / library.INDEX_NAME).write_text('{')
+    lib = RomLibrary(str(roms))
+    assert len(lib) == 0
+    assert lib.scan() == (3, 0)
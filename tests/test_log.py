@@ -0,0 +1,61 @@
+import logging
+import threading
+from chip8emulator import log
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        self.threads.add(threading.get_ident())
+
+
+def test_queue():
+    logger = log.create_logger('test_log.queue')
+    records = Records()
+    logger.addHandler(records)
+    assert log.queue_stats() is None
+    log.enable_queue()
+    try:
+        values = [1]
+        logger.info('values %s', values)
+        # Formatted when logged, not when written
+        values.append(2)
+        logger.debug('below the level')
+    finally:
+        log.disable_queue()
+    assert records.messages == ['values [1]']
+    assert records.threads != {threading.get_ident()}
+    assert logger.handlers[-1] is records
+    assert log.queue_stats() is None
+
+
+def test_dropped():
+    logger = log.create_logger('test_log.dropped')
+    writing = threading.Event()
+    release = threading.Event()
+
+    class Slow(Records):
+        def emit(self, record):
+            writing.set()
+            release.wait()
+            super().emit(record)
+    records = Slow()
+    logger.addHandler(records)
+    log.enable_queue(2)
+    try:
+        logger.warning('first')
+        # The writer is busy with the first record, two more fit in the queue
+        writing.wait()
+        for i in range(5):
+            logger.warning(f'record {i}')
+        stats = log.queue_stats()
+        assert (stats['enqueued'], stats['dropped'], stats['depth']) == (3, 3, 2)
+    finally:
+        release.set()
+        log.disable_queue()
+    assert records.messages == ['first', 'record 0', 'record 1']
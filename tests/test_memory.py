@@ -14,7 +14,7 @@ def test_initialization():
     assert len(emu.V) == 16
     assert emu.V == bytearray(16)
     assert emu.memory == bytearray(4096)
-    assert emu.op_table == {}
+    assert emu.op_table == []
     assert emu.ext_functions == {}
 
     @emu.external('clear')
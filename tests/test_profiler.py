@@ -0,0 +1,84 @@
+import json
+from chip8emulator import headless
+from chip8emulator.decoder import dispatch_table
+from chip8emulator.profiler import FAMILIES, pattern
+
+# 0x200 CALL 0x206; 0x202 DRAW twice; 0x206 V1 = 5, CALL 0x20C, RETURN;
+# 0x20C V1 += 1, RETURN
+ROM = bytearray([0x22, 0x06, 0xD1, 0x15, 0x12, 0x08,
+                 0x61, 0x05, 0x22, 0x0C, 0x00, 0xEE,
+                 0x71, 0x01, 0x00, 0xEE])
+
+
+def profiled(rom=ROM):
+    emulator = headless.create_emulator({'profile': True, 'seed': 0, 'speed': 10})
+    emulator.load_to_memory(rom)
+    return emulator
+
+
+def test_disabled_by_default(create_emulator):
+    assert create_emulator.profiler is None
+    assert create_emulator.op_table is dispatch_table()
+
+
+def test_counters():
+    emulator = profiled()
+    for i in range(6):
+        emulator.execute_opcode_from_memory()
+    emulator.I = 0x202
+    emulator.execute_opcode_from_memory()
+    emulator.pc = 0x202
+    emulator.execute_opcode_from_memory()
+    profiler = emulator.profiler
+    assert emulator.V[1] == 6
+    assert profiler.instructions == 8
+    assert profiler.opcodes[0x00EE] == 2
+    assert profiler.addresses[0x202] == 2
+    assert profiler.draws == 2
+    # The second draw erases the first one
+    assert profiler.collisions == 1
+    assert profiler.max_depth == 2
+    assert profiler.family_time[FAMILIES.index('draw')] > 0
+
+
+def test_collapsed_stacks():
+    emulator = profiled()
+    for i in range(7):
+        emulator.execute_opcode_from_memory()
+    assert emulator.profiler.collapsed_stacks() == [
+        '0x200 2', '0x200;0x206 3', '0x200;0x206;0x20c 2']
+
+
+def test_json(tmp_path):
+    emulator = profiled()
+    for i in range(7):
+        emulator.execute_opcode_from_memory()
+    path = tmp_path / 'profile.json'
+    emulator.profiler.write_json(path)
+    data = json.loads(path.read_text())
+    assert data['instructions'] == 7
+    assert data['patterns']['2NNN'] == 2
+    assert data['patterns']['00EE'] == 2
+    assert data['addresses']['0x20c'] == 1
+    assert data['max_call_depth'] == 2
+    assert set(data['family_ns']) == set(FAMILIES)
+
+
+def test_pattern():
+    assert pattern(0x8354) == '8XY4'
+    assert pattern(0xF233) == 'FX33'
+    assert pattern(0xD125) == 'DXYN'
+    assert pattern(0x00E0) == '00E0'
+
+
+def test_same_result_as_dispatch_table():
+    with open('roms/BRIX', 'rb') as rom:
+        data = bytearray(rom.read())
+    results = []
+    for profile in (False, True):
+        emulator = headless.create_emulator({'profile': profile, 'seed': 1, 'speed': 10})
+        emulator.load_to_memory(data)
+        results.append(headless.run(emulator, cycles=20000))
+    assert results[0].framebuffer_hash == results[1].framebuffer_hash
+    assert results[1].profiler.instructions == 20000
+    assert results[0].profiler is None
@@ -0,0 +1,123 @@
+import os
+import pytest
+from chip8emulator import headless, recording
+from chip8emulator.emulator import END, FAULT, HALT
+
+SCRIPT = [(0, 0), (500, 1 << 4), (530, 1 << 4), (800, 0), (1200, 1 << 6), (2000, 0)]
+
+# V0 = FF, delay timer = V0, then draws the low digit of the delay timer
+# forever, so that the framebuffer shows when the timers ran differently
+DELAY_TIMER = bytes([0x60, 0xFF, 0xF0, 0x0F, 0xF1, 0x07, 0x6F, 0x0F, 0x81, 0xF2,
+                     0xF1, 0x29, 0x00, 0xE0, 0xD2, 0x25, 0x12, 0x04])
+
+
+def read_rom(name):
+    with open(os.path.join('roms', name), 'rb') as rom:
+        return rom.read()
+
+
+def record(path, rom, frames, fps=60, cpu_hz=600, seed=1234):
+    # What Engine does while recording: the keys at the start of every frame,
+    # speed cycles on the Scheduler of the recording, a key held at the end
+    # of the frame completes FX0A, the hash at the end of the session
+    speed, scheduler = recording.frame_schedule(cpu_hz, fps)
+    recorder = recording.Recorder(path, rom, seed, speed, scheduler.cpu_hz, scheduler.timer_hz)
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=seed))
+    emulator.load_to_memory(bytearray(rom))
+
+    def execute(n):
+        if emulator.key_wait is not None:
+            return True
+        return emulator.run_cycles(n, stop_on=(HALT,)).reason not in (END, FAULT, HALT)
+
+    cycle = 0
+    for frame in range(frames):
+        emulator.keys = [mask for start, mask in SCRIPT if start <= cycle][-1]
+        recorder.keys(cycle, emulator.keys)
+        cycle += speed
+        assert scheduler.run(speed, execute, emulator.tick_timers)
+        emulator.key_held()
+    recorder.close(cycle, headless.framebuffer_hash(emulator))
+    return emulator
+
+
+def test_replay_matches_the_session(tmp_path):
+    # BRIX uses random numbers
+    path = str(tmp_path / 'session.c8r')
+    rom = read_rom('BRIX')
+    emulator = record(path, rom, 500)
+
+    loaded = recording.load(path)
+    assert (loaded.seed, loaded.speed, loaded.cpu_hz, loaded.timer_hz) == (1234, 10, 600, 60)
+    # Only the changes are stored
+    assert loaded.script == [(500, 1 << 4), (800, 0), (1200, 1 << 6), (2000, 0)]
+    assert loaded.cycles == 5000
+    assert loaded.framebuffer_hash == headless.framebuffer_hash(emulator)
+    replayed = recording.replay(loaded, rom)
+    assert replayed.framebuffer_hash == loaded.framebuffer_hash
+    assert recording.main([path, os.path.join('roms', 'BRIX')]) == 0
+
+
+@pytest.mark.parametrize('fps', [60, 120, 50, 144])
+def test_replay_at_any_fps(tmp_path, fps):
+    path = str(tmp_path / 'session.c8r')
+    for rom in (read_rom('BRIX'), DELAY_TIMER):
+        # One emulated second, the timers tick 60 times whatever the fps
+        emulator = record(path, rom, fps, fps=fps, cpu_hz=600)
+        if rom == DELAY_TIMER:
+            assert emulator.delay_timer == 0xFF - 60
+        loaded = recording.load(path)
+        assert loaded.timer_hz == 60
+        assert recording.replay(loaded, rom).framebuffer_hash == loaded.framebuffer_hash
+
+
+def test_truncated_recording(tmp_path):
+    path = str(tmp_path / 'session.c8r')
+    record(path, read_rom('BRIX'), 500)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-10])
+    loaded = recording.load(path)
+    assert loaded.framebuffer_hash is None
+    assert loaded.cycles == 2000
+
+    with open(path, 'wb') as f:
+        f.write(b'XXXX' + data[4:])
+    with pytest.raises(ValueError):
+        recording.load(path)
+
+
+def test_version_1(tmp_path):
+    # The timers of version 1 ticked once per frame of fps frames per second
+    path = tmp_path / 'session.c8r'
+    path.write_bytes(recording.HEADER_V1.pack(b'C8RC', 1, 7, 5, 120.0, bytes(20)) +
+                     recording.KEYS + bytes([100]) + (1 << 3).to_bytes(2, 'little'))
+    loaded = recording.load(str(path))
+    assert (loaded.seed, loaded.speed, loaded.cpu_hz, loaded.timer_hz) == (7, 5, 600, 120)
+    assert loaded.script == [(100, 1 << 3)]
+    assert loaded.framebuffer_hash is None
+
+
+def test_emulator_seed():
+    settings = headless.DEFAULT_SETTINGS
+    a = headless.create_emulator(dict(settings, seed=5))
+    b = headless.create_emulator(dict(settings, seed=5))
+    assert [a.random.byte() for i in range(8)] == [b.random.byte() for i in range(8)]
+    # A seed is chosen when there is none, so that the session can be recorded
+    assert isinstance(headless.create_emulator(dict(settings)).seed, int)
+
+
+def test_seed_from_settings(tmp_path):
+    settings_path = tmp_path / 'settings.json'
+    settings_path.write_text('{"seed": "42"}')
+    emulator = headless.create_emulator(headless.load_settings(str(settings_path)))
+    assert emulator.seed == 42
+    path = str(tmp_path / 'session.c8r')
+    recorder = recording.Recorder(path, read_rom('MAZE'), emulator.seed, 10, 600)
+    recorder.close(0, headless.framebuffer_hash(emulator))
+    assert recording.load(path).seed == 42
+
+    for seed in ('forty two', 4.2, [42]):
+        with pytest.raises(ValueError):
+            headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=seed))
@@ -0,0 +1,38 @@
+import os
+import pytest
+from chip8emulator import Emulator
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+pygame = pytest.importorskip('pygame')
+from chip8emulator.renderer import Renderer  # noqa: E402
+
+
+@pytest.fixture
+def screen():
+    pygame.display.init()
+    yield pygame.display.set_mode((640, 320))
+    pygame.display.quit()
+
+
+def lit(screen):
+    white = pygame.Color('white')
+    return {(x, y) for y in range(32) for x in range(64)
+            if screen.get_at((x*10 + 5, y*10 + 5)) == white}
+
+
+def test_present_draws_dirty_rows(emu: Emulator, screen):
+    renderer = Renderer(screen)
+    emu.I = 0
+    emu.V[1] = 62
+    emu.V[2] = 30
+    emu.execute_opcode(0xD125)
+    assert renderer.present(emu)
+    assert emu.dirty_rows == 0
+    assert lit(screen) == {(x, y) for y in range(32) for x in range(64)
+                           if emu.pixel(x, y)}
+    # Nothing changed since
+    assert not renderer.present(emu)
+
+    emu.execute_opcode(0x00E0)
+    assert renderer.present(emu)
+    assert lit(screen) == set()
@@ -0,0 +1,53 @@
+import os
+import pytest
+from chip8emulator import headless
+from chip8emulator.translator import BlockTranslator
+
+
+def load(name):
+    emulator = headless.create_emulator(headless.load_settings())
+    with open(os.path.join('roms', name), 'rb') as rom:
+        emulator.load_to_memory(rom.read())
+    return emulator
+
+
+def test_reset_needs_a_baseline():
+    emulator = load('BRIX')
+    with pytest.raises(ValueError):
+        emulator.reset()
+
+
+def test_reset_runs_the_same():
+    emulator = load('BRIX')
+    emulator.save_baseline()
+    translator = BlockTranslator(emulator)
+    translator.run(3000)
+    first = emulator.snapshot()
+    blocks = dict(translator.blocks)
+    assert blocks
+
+    # BRIX does not write over its code, the translated blocks are kept
+    emulator.reset()
+    assert emulator.snapshot() == emulator.baseline
+    assert emulator.dirty_rows == (1 << 32) - 1
+    assert translator.blocks == blocks
+    translator.run(3000)
+    assert emulator.snapshot() == first
+
+
+def test_reset_after_memory_changed():
+    emulator = load('BRIX')
+    emulator.save_baseline()
+    translator = BlockTranslator(emulator)
+    translator.run(100)
+    assert translator.blocks
+
+    emulator.memory[0x200] ^= 0xFF
+    emulator.V[3] = 9
+    emulator.stack.append(0x300)
+    emulator.stack_pointer = 0
+    emulator.reset(seed=5)
+    assert not translator.blocks
+    assert emulator.memory == load('BRIX').memory
+    assert (emulator.V[3], emulator.stack, emulator.stack_pointer) == (0, [], -1)
+    assert emulator.random.getstate() == (5, -1, 1024)
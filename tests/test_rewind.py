@@ -0,0 +1,45 @@
+import os
+from chip8emulator import headless
+from chip8emulator.rewind import RewindBuffer
+
+
+def load(name):
+    emulator = headless.create_emulator(headless.load_settings())
+    with open(os.path.join('roms', name), 'rb') as rom:
+        emulator.load_to_memory(rom.read())
+    return emulator
+
+
+def test_step_back_restores_previous_frames():
+    emulator = load('INVADERS')
+    rewind = RewindBuffer(keyframe_interval=8)
+    states = []
+
+    def on_frame(emulator, cycle):
+        rewind.push(emulator)
+        states.append(emulator.snapshot())
+
+    headless.run(emulator, cycles=300, on_frame=on_frame)
+    assert len(rewind) == 30
+    for state in reversed(states[:-1]):
+        assert rewind.step_back(emulator)
+        assert emulator.snapshot() == state
+    assert not rewind.step_back(emulator)
+    assert emulator.snapshot() == states[0]
+
+    # Running again after a rewind
+    headless.run(emulator, cycles=100, on_frame=on_frame)
+    assert len(rewind) == 11
+    assert rewind.step_back(emulator)
+    assert emulator.snapshot() == states[-2]
+
+
+def test_memory_cap_drops_oldest_keyframes():
+    emulator = load('BLITZ')
+    rewind = RewindBuffer(memory_cap=8*1024, keyframe_interval=10)
+    headless.run(emulator, cycles=5000, on_frame=lambda emulator, cycle: rewind.push(emulator))
+    assert 0 < len(rewind) < 500
+    assert rewind.size <= 8*1024 or len(rewind.groups) == 1
+    while rewind.step_back(emulator):
+        pass
+    assert len(rewind) == 1
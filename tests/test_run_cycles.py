@@ -0,0 +1,99 @@
+import pytest
+from chip8emulator import headless
+from chip8emulator.emulator import BUDGET, DRAW, KEY_WAIT, HALT, FAULT, END
+from chip8emulator.idle import IdleLoops
+from chip8emulator.translator import BlockTranslator
+
+# 0x200 V0 += 1; DRAW; HALT; WAIT KEY V1; JUMP 0x200
+ROM = bytes([0x70, 0x01, 0xD0, 0x01, 0x0F, 0xFF, 0xF1, 0x0A, 0x12, 0x00])
+# 0x200 V0 += 1; DRAW; HALT; V1 = 0; JUMP 0x200
+LOOP = bytes([0x70, 0x01, 0xD0, 0x01, 0x0F, 0xFF, 0x61, 0x00, 0x12, 0x00])
+# 0x200 WAIT KEY V0; V1 = V0; V2 = 7; JUMP 0x206
+WAIT_KEY = bytes([0xF0, 0x0A, 0x81, 0x00, 0x62, 0x07, 0x12, 0x06])
+
+
+def create(rom):
+    emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=0))
+    emulator.load_to_memory(rom)
+    return emulator
+
+
+def test_budget():
+    emulator = create(LOOP)
+    stop = emulator.run_cycles(12)
+    assert (stop.reason, stop.cycles) == (BUDGET, 12)
+    assert emulator.pc == 0x204
+    assert emulator.V[0] == 3
+    assert emulator.pc_increment == 2
+
+
+@pytest.mark.parametrize('reason,cycles,pc', [(DRAW, 2, 0x204), (HALT, 3, 0x206),
+                                              (KEY_WAIT, 4, 0x208)])
+def test_stop_on(reason, cycles, pc):
+    emulator = create(ROM)
+    stop = emulator.run_cycles(100, stop_on=(reason,))
+    assert (stop.reason, stop.cycles) == (reason, cycles)
+    assert emulator.pc == pc
+
+
+@pytest.mark.parametrize('engine', ['interpreter', 'translator'])
+def test_wait_key_stops(engine):
+    emulator = create(WAIT_KEY)
+    run = BlockTranslator(emulator).run if engine == 'translator' else emulator.run_cycles
+    stop = run(10)
+    assert (stop.reason, stop.cycles) == (KEY_WAIT, 1)
+    assert emulator.key_wait == 0
+    assert emulator.pc == 0x202
+    assert emulator.V[2] == 0
+    # Nothing runs until the key arrives
+    assert (run(10).reason, emulator.pc) == (KEY_WAIT, 0x202)
+    assert emulator.key_pressed(5)
+    stop = run(10)
+    assert (stop.reason, stop.cycles) == (BUDGET, 10)
+    assert (emulator.V[1], emulator.V[2]) == (5, 7)
+
+
+def test_same_as_execute_opcode():
+    with open('roms/BRIX', 'rb') as rom:
+        data = rom.read()
+    batched = create(data)
+    stepped = create(data)
+    for i in range(50):
+        batched.run_cycles(97)
+        for j in range(97):
+            stepped.execute_opcode_from_memory()
+        assert batched.snapshot() == stepped.snapshot()
+
+
+def test_fault():
+    # 0x200 V0 = 1; V0 -= V0 (8XY5 raises when both are equal)
+    emulator = create(bytes([0x60, 0x01, 0x80, 0x05]))
+    stop = emulator.run_cycles(10)
+    assert (stop.reason, stop.cycles) == (FAULT, 2)
+    assert emulator.pc == 0x202
+    assert (emulator.exit_reason, emulator.exit_code) == ('close', -4)
+
+
+def test_illegal_return():
+    emulator = create(bytes([0x00, 0xEE]))
+    stop = emulator.run_cycles(10)
+    assert (stop.reason, stop.cycles) == (FAULT, 1)
+    assert emulator.exit_code == -3
+
+
+def test_end_of_memory():
+    emulator = create(bytes([0x1F, 0xFE]))
+    emulator.memory[0xFFE:] = bytes(2)
+    stop = emulator.run_cycles(10)
+    assert (stop.reason, stop.cycles) == (END, 2)
+    assert emulator.pc == 0x1000
+    assert emulator.exit_reason is None
+
+
+def test_idle_loops_are_skipped():
+    # 0x200 JUMP 0x200
+    emulator = create(bytes([0x12, 0x00]))
+    emulator.idle = IdleLoops(emulator)
+    stop = emulator.run_cycles(1000)
+    assert (stop.reason, stop.cycles) == (BUDGET, 1000)
+    assert emulator.idle.skipped == 998
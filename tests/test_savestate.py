@@ -0,0 +1,60 @@
+import hashlib
+import os
+import pytest
+from chip8emulator import headless, savestate
+
+
+def load_rom(name):
+    emulator = headless.create_emulator(dict(headless.load_settings(), seed=3))
+    with open(os.path.join('roms', name), 'rb') as rom:
+        data = rom.read()
+    emulator.load_to_memory(data)
+    return emulator, hashlib.sha256(data).digest()
+
+
+def test_save_and_load(tmp_path):
+    emulator, rom_hash = load_rom('BRIX')
+    headless.run(emulator, cycles=3000)
+    path = savestate.slot_path(str(tmp_path), rom_hash, 3)
+    savestate.save(path, emulator, rom_hash, 3, cycle=3000)
+    assert os.path.getsize(path) == savestate.FILE_SIZE
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    expected = emulator.snapshot()
+    following = headless.run(emulator, cycles=1000).framebuffer_hash
+
+    other, rom_hash = load_rom('BRIX')
+    info = savestate.load(path, other, rom_hash)
+    assert (info.slot, info.cycle, info.rom_hash) == (3, 3000, rom_hash)
+    assert other.snapshot() == expected
+    assert headless.run(other, cycles=1000).framebuffer_hash == following
+
+
+def test_other_rom(tmp_path):
+    emulator, rom_hash = load_rom('BRIX')
+    path = savestate.slot_path(str(tmp_path), rom_hash, 1)
+    savestate.save(path, emulator, rom_hash, 1)
+    other, other_hash = load_rom('PONG')
+    with pytest.raises(ValueError):
+        savestate.load(path, other, other_hash)
+    # Damaged files
+    with open(path, 'r+b') as f:
+        f.truncate(savestate.FILE_SIZE - 1)
+    with pytest.raises(ValueError):
+        savestate.load(path, other)
+
+
+def test_list_slots(tmp_path):
+    emulator, rom_hash = load_rom('BRIX')
+    headless.run(emulator, cycles=2000)
+    for slot in (2, 1):
+        savestate.save(savestate.slot_path(str(tmp_path), rom_hash, slot), emulator, rom_hash, slot)
+    pong, pong_hash = load_rom('PONG')
+    savestate.save(savestate.slot_path(str(tmp_path), pong_hash, 1), pong, pong_hash, 1)
+    (tmp_path / 'junk.c8s').write_bytes(b'C8SV')
+
+    slots = savestate.list_slots(str(tmp_path), rom_hash)
+    assert [info.slot for info in slots] == [1, 2]
+    assert slots[0].thumbnail == emulator.framebuffer_bytes()
+    assert len(slots[0].thumbnail_text().splitlines()) == 16
+    assert len(savestate.list_slots(str(tmp_path))) == 3
+    assert savestate.list_slots(str(tmp_path / 'none')) == []
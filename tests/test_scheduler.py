@@ -0,0 +1,90 @@
+from chip8emulator.scheduler import Scheduler, FramePacer
+
+
+def run_frames(scheduler, fps, seconds):
+    ticks = []
+    for frame in range(int(fps * seconds)):
+        scheduler.run(scheduler.advance(1 / fps), lambda n: True,
+                      lambda: ticks.append(scheduler.cycle))
+    return ticks
+
+
+def test_ticks_on_exact_cycles():
+    scheduler = Scheduler(600)
+    ticks = run_frames(scheduler, 60, 1)
+    assert scheduler.cycle == 600
+    assert ticks == list(range(10, 601, 10))
+
+
+def test_speed_does_not_depend_on_fps():
+    for fps in (24, 30, 60, 144, 1000):
+        scheduler = Scheduler(700)
+        ticks = run_frames(scheduler, fps, 3)
+        assert abs(scheduler.cycle - 2100) <= 1
+        assert len(ticks) in (179, 180)
+        # Tick k after cycle ceil(k * 700 / 60)
+        assert ticks[:3] == [12, 24, 35]
+
+
+def test_execute_stops_the_run():
+    scheduler = Scheduler(600)
+    executed = []
+
+    def execute(n):
+        executed.append(n)
+        return sum(executed) < 15
+    assert not scheduler.run(100, execute, lambda: None)
+    assert executed == [10, 10]
+
+
+def test_set_cpu_hz():
+    scheduler = Scheduler(600)
+    run_frames(scheduler, 60, 1)
+    scheduler.set_cpu_hz(120)
+    ticks = run_frames(scheduler, 60, 1)
+    assert scheduler.cycle == 720
+    assert ticks[:2] == [602, 604]
+    assert scheduler.ticks == 120
+
+
+def test_lag_is_not_caught_up():
+    scheduler = Scheduler(1000, max_lag=0.25)
+    assert scheduler.advance(5) == 250
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_pacer_sleeps_between_frames():
+    clock = FakeClock()
+    pacer = FramePacer(50, clock=clock, sleep=clock.sleep)
+    for i in range(10):
+        clock.now += 0.005
+        assert pacer.present_due()
+        pacer.wait()
+    assert abs(clock.now - 0.2) < 1e-9
+    assert all(abs(s - 0.015) < 1e-9 for s in clock.slept)
+
+
+def test_pacer_skips_frames_when_behind():
+    clock = FakeClock()
+    pacer = FramePacer(50, max_skip=2, clock=clock, sleep=clock.sleep)
+    presented = []
+    for i in range(6):
+        # Every frame takes three frame periods
+        clock.now += 0.06
+        presented.append(pacer.present_due())
+        pacer.wait()
+    assert presented.count(False) >= 3
+    assert True in presented[2:]
+    assert not clock.slept
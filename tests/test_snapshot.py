@@ -0,0 +1,97 @@
+import os
+import pytest
+from chip8emulator import Emulator, headless
+from chip8emulator.snapshot import SNAPSHOT
+from chip8emulator.translator import BlockTranslator
+
+
+def load(name):
+    emulator = headless.create_emulator(headless.load_settings())
+    with open(os.path.join('roms', name), 'rb') as rom:
+        emulator.load_to_memory(rom.read())
+    return emulator
+
+
+def test_restore_continues_the_same_run():
+    emulator = load('INVADERS')
+    headless.run(emulator, cycles=3000)
+    data = emulator.snapshot()
+    assert len(data) == SNAPSHOT.size
+    expected = headless.run(emulator, cycles=3000).framebuffer_hash
+
+    other = load('BLITZ')
+    other.restore(data)
+    assert other.snapshot() == data
+    assert other.dirty_rows == (1 << 32) - 1
+    assert headless.run(other, cycles=3000).framebuffer_hash == expected
+
+
+def test_restore_state(emu: Emulator):
+    emu.execute_opcode(0x2400)
+    emu.execute_opcode(0xA123)
+    emu.execute_opcode(0xF30A)
+    emu.keys = 1 << 4
+    emu.delay_timer = 7
+    data = emu.snapshot()
+
+    emu.execute_opcode(0x00EE)
+    emu.execute_opcode(0x00E0)
+    emu.key_wait = None
+    emu.restore(data)
+    assert emu.pc == 0x404
+    assert emu.stack == [0x200] and emu.stack_pointer == 0
+    assert emu.I == 0x123 and emu.V[3] == 211
+    assert emu.key_wait == 3
+    assert emu.keys == 1 << 4
+    assert emu.delay_timer == 7
+
+
+def test_delta(emu: Emulator):
+    base = emu.snapshot()
+    emu.I = 0
+    emu.execute_opcode(0xD355)
+    emu.execute_opcode(0x6A42)
+    delta = emu.snapshot(base)
+    full = emu.snapshot()
+    assert len(delta) < len(full) // 10
+
+    emu.restore(base)
+    assert emu.V[0xA] == 0
+    emu.restore(delta, base)
+    assert emu.snapshot() == full
+    with pytest.raises(ValueError):
+        emu.restore(delta)
+    with pytest.raises(ValueError):
+        emu.restore(delta, full)
+
+
+def test_invalid_data(emu: Emulator):
+    data = emu.snapshot()
+    for bad in (b'', b'XXXX' + data[4:], data[:4] + b'\x63' + data[5:], data[:-1]):
+        with pytest.raises(ValueError):
+            emu.restore(bad)
+
+
+def test_restore_invalidates_translated_blocks():
+    emulator = load('BLITZ')
+    translator = BlockTranslator(emulator)
+    data = emulator.snapshot()
+    translator.run(100)
+    assert translator.blocks
+    emulator.restore(data)
+    assert not translator.blocks
+
+
+def test_random_bytes_are_restored():
+    emulator = load('KALEID')
+    emulator.random.seed(99)
+    for i in range(1500):
+        emulator.random.byte()
+    data = emulator.snapshot()
+    expected = [emulator.random.byte() for i in range(2000)]
+
+    other = load('KALEID')
+    other.restore(data)
+    assert other.seed == 99
+    assert [other.random.byte() for i in range(2000)] == expected
+
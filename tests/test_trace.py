@@ -0,0 +1,35 @@
+import logging
+from chip8emulator import Emulator
+from chip8emulator.decoder import describe
+
+
+def test_describe():
+    assert describe(0x1208).split() == ['JUMP', '0x0208']
+    assert describe(0x6305) == 'V[3] = 5'
+    assert describe(0x8354) == 'V[3] += V[5]'
+    assert describe(0xF233) == 'I, I+1, I+2 = BCD(V2)'
+    assert describe(0x00EE) == 'Return'
+    assert describe(0x8358) == 'NOP'
+
+
+def test_trace_logs_every_instruction(caplog):
+    emu = Emulator({'trace': True})
+    emu.init_optable()
+    emu.load_to_memory(bytearray([0x61, 0x37, 0x71, 0x01]))
+    with caplog.at_level(logging.DEBUG, logger='chip8emulator.decoder'):
+        emu.execute_opcode_from_memory()
+        emu.execute_opcode_from_memory()
+    assert emu.V[1] == 0x38
+    messages = [r.getMessage() for r in caplog.records if r.name == 'chip8emulator.decoder']
+    assert len(messages) == 2
+    assert 'V[1] = 55' in messages[0]
+    assert 'V[1] = V[1] + 1' in messages[1]
+
+
+def test_fast_interpreter_does_not_log(create_emulator: Emulator, caplog):
+    create_emulator.load_to_memory(bytearray([0x61, 0x37, 0x71, 0x01]))
+    with caplog.at_level(logging.DEBUG, logger='chip8emulator.decoder'):
+        create_emulator.execute_opcode_from_memory()
+        create_emulator.execute_opcode_from_memory()
+    assert create_emulator.V[1] == 0x38
+    assert not [r for r in caplog.records if r.name == 'chip8emulator.decoder']
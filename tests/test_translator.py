@@ -0,0 +1,143 @@
+import os
+import pytest
+from chip8emulator import Emulator, headless
+from chip8emulator.emulator import BUDGET, DRAW, HALT, FAULT, END
+from chip8emulator.translator import BlockTranslator
+
+
+def create_machine():
+    e = Emulator({'is_paused': False})
+
+    @e.external('halt')
+    def halt(opcode):
+        pass
+
+    e.init_optable()
+    return e
+
+
+def state(e: Emulator):
+    return (e.pc, e.I, bytes(e.V), list(e.stack), e.stack_pointer,
+            bytes(e.memory), list(e.framebuffer))
+
+
+@pytest.mark.parametrize('rom', ['INVADERS', 'TETRIS', 'BLITZ', 'BRIX', 'KALEID', 'MAZE'])
+def test_translator_matches_interpreter(rom):
+    with open(os.path.join('roms', rom), 'rb') as f:
+        data = bytearray(f.read())
+    interpreted = create_machine()
+    translated = create_machine()
+    interpreted.load_to_memory(data)
+    translated.load_to_memory(data)
+    translator = BlockTranslator(translated)
+
+    # Odd step size, so that blocks are also split by the budget
+    for step in range(300):
+        interpreted.random.seed(step)
+        for i in range(7):
+            interpreted.execute_opcode_from_memory()
+        translated.random.seed(step)
+        translator.run(7)
+        assert state(interpreted) == state(translated)
+    assert translator.blocks
+
+
+def test_translator_runs_straight_line_code(create_emulator: Emulator):
+    create_emulator.load_to_memory(
+        bytearray([0x61, 0x37, 0x62, 0x45, 0x63, 0x1a, 0x12, 0x06]))
+    translator = BlockTranslator(create_emulator)
+    stop = translator.run(4)
+    assert (stop.reason, stop.cycles) == (BUDGET, 4)
+    assert create_emulator.V[1] == 0x37
+    assert create_emulator.V[2] == 0x45
+    assert create_emulator.V[3] == 0x1a
+    assert create_emulator.pc == 0x206
+    assert translator.blocks[0x200].length == 4
+
+
+def test_load_to_memory_invalidates_blocks(create_emulator: Emulator):
+    create_emulator.load_to_memory(bytearray([0x61, 0x01, 0x12, 0x00]))
+    translator = BlockTranslator(create_emulator)
+    translator.run(2)
+    assert 0x200 in translator.blocks
+
+    create_emulator.load_to_memory(bytearray([0x61, 0x02, 0x12, 0x00]))
+    assert 0x200 not in translator.blocks
+    translator.run(2)
+    assert create_emulator.V[1] == 2
+
+
+def test_register_dump_invalidates_blocks(create_emulator: Emulator):
+    # V0 = 0x63, V1 = 0x07, I = 0x206, then dump V0-V1 at I, i.e rewrite
+    # the instruction at 0x206 from 0x6305 to 0x6307
+    create_emulator.load_to_memory(bytearray([
+        0x60, 0x63, 0x61, 0x07, 0xA2, 0x06,
+        0x63, 0x05, 0x12, 0x0a,
+        0xF1, 0x55, 0x12, 0x06]))
+    translator = BlockTranslator(create_emulator)
+    translator.run(5)
+    assert create_emulator.V[3] == 5
+    assert 0x200 in translator.blocks
+
+    translator.run(2)
+    assert 0x200 not in translator.blocks
+    assert create_emulator.pc == 0x206
+    translator.run(1)
+    assert create_emulator.V[3] == 7
+
+
+def test_execution_ends_when_pc_greater_than_memory(create_emulator: Emulator):
+    translator = BlockTranslator(create_emulator)
+    while translator.run(10).reason != END:
+        pass
+    assert create_emulator.pc == 4096
+
+
+@pytest.mark.parametrize('reason,cycles,pc', [(DRAW, 2, 0x204), (HALT, 3, 0x206)])
+def test_stop_on(reason, cycles, pc):
+    # 0x200 V0 += 1; DRAW; HALT; JUMP 0x200
+    emulator = create_machine()
+    emulator.load_to_memory(bytearray([0x70, 0x01, 0xD0, 0x01, 0x0F, 0xFF, 0x12, 0x00]))
+    translator = BlockTranslator(emulator)
+    stop = translator.run(100, stop_on=(reason,))
+    assert (stop.reason, stop.cycles) == (reason, cycles)
+    assert emulator.pc == pc
+
+
+def test_headless_counts_instructions_run():
+    # 0x200 V0 += 1; HALT
+    rom = bytearray([0x70, 0x01, 0x0F, 0xFF])
+    for engine in ('interpreter', 'translator'):
+        emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, execution_engine=engine))
+        emulator.load_to_memory(rom)
+        result = headless.run(emulator, cycles=100)
+        assert (result.reason, result.instructions) == ('halt', 2)
+        assert emulator.V[0] == 1
+
+
+@pytest.mark.parametrize('rom', [
+    # V0 = 1; V1 = 2; V0 -= V0 (8XY5 raises when both are equal); V2 = 3
+    [0x60, 0x01, 0x61, 0x02, 0x80, 0x05, 0x62, 0x03, 0x12, 0x00],
+    # CALL 0x200, until the stack overflows
+    [0x60, 0x01, 0x22, 0x00],
+    # RETURN with an empty stack
+    [0x60, 0x01, 0x00, 0xEE, 0x12, 0x00],
+    # V0 = 0x20; SKIP IF NOT KEY V0 (no key 0x20)
+    [0x60, 0x20, 0xE0, 0xA1, 0x12, 0x00],
+])
+def test_fault_matches_interpreter(rom):
+    states = []
+    for engine in ('interpreter', 'translator'):
+        emulator = headless.create_emulator(
+            dict(headless.DEFAULT_SETTINGS, execution_engine=engine, seed=0))
+        closed = []
+        emulator.ext_functions['close'] = closed.append
+        emulator.load_to_memory(bytearray(rom))
+        if engine == 'translator':
+            stop = BlockTranslator(emulator).run(100)
+        else:
+            stop = emulator.run_cycles(100)
+        assert stop.reason == FAULT
+        assert len(closed) == 1
+        states.append((stop.cycles, closed, state(emulator)))
+    assert states[0] == states[1]
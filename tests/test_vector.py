@@ -0,0 +1,88 @@
+import os
+import random
+import pytest
+from chip8emulator import headless
+
+pytest.importorskip('numpy')
+from chip8emulator.vector import VectorEmulator  # noqa: E402
+
+# Changes the held keys every 100 cycles, for EX9E, EXA1 and FX0A
+SCRIPT = [(cycle, (1 << (cycle // 500 % 16)) if cycle % 1000 < 300 else 0)
+          for cycle in range(0, 20000, 100)]
+
+
+def random_program(rnd, size=256):
+    return bytes(rnd.randrange(256) for i in range(size))
+
+
+def assert_same(emulator, result, vec, i):
+    assert result.reason == vec.reason(i)
+    assert result.instructions == vec.instructions[i]
+    assert emulator.pc == vec.pc[i]
+    assert emulator.I == vec.I[i]
+    assert list(emulator.V) == vec.V[i].tolist()
+    assert emulator.stack == vec.stack[i, :max(vec.stack_pointer[i] + 1, 0)].tolist()
+    assert emulator.delay_timer == vec.delay_timer[i]
+    assert bytes(emulator.memory) == vec.memory[i].tobytes()
+    assert emulator.framebuffer_bytes() == vec.framebuffer_bytes(i)
+    assert emulator.dirty_rows == vec.dirty_rows[i]
+    if result.reason == 'close':
+        assert emulator.exit_code == vec.exit_code[i]
+
+
+def run_both(roms, cycles, seed=5, **schedule):
+    settings = headless.load_settings()
+    vec = VectorEmulator(len(roms), dict(settings, seed=seed))
+    for i, rom in enumerate(roms):
+        vec.load_to_memory(rom, machines=i)
+    vec.run(cycles, script=SCRIPT, **schedule)
+    for i, rom in enumerate(roms):
+        emulator = headless.create_emulator(dict(settings, seed=seed + i))
+        emulator.load_to_memory(rom)
+        result = headless.run(emulator, cycles=cycles, script=SCRIPT, **schedule)
+        assert_same(emulator, result, vec, i)
+    return vec
+
+
+def test_random_programs_match_emulator():
+    # Random programs mostly stop early, on faults (8XY5, DXYN past the end
+    # of the memory, ...), illegal returns or at the end of the memory, which
+    # covers the exits as well.
+    rnd = random.Random(1)
+    vec = run_both([random_program(rnd) for i in range(64)], 2000)
+    assert {'cycles', 'close', 'end'} <= {vec.reason(i) for i in range(64)}
+
+
+@pytest.mark.parametrize('names', [['BRIX', 'INVADERS', 'KALEID', 'BLITZ'],
+                                   ['MAZE', 'SYZYGY', 'TETRIS', 'WIPEOFF', 'TEST_ROM_DISPLAY_A']])
+def test_roms_match_emulator(names):
+    roms = []
+    for name in names:
+        with open(os.path.join('roms', name), 'rb') as rom:
+            roms.append(rom.read())
+    run_both(roms, 5000)
+
+
+def test_timer_schedule_matches_emulator():
+    with open(os.path.join('roms', 'BLITZ'), 'rb') as rom:
+        roms = [rom.read()]
+    # V0 = FF, delay timer = V0, then V1 = delay timer forever
+    roms.append(bytes([0x60, 0xFF, 0xF0, 0x0F, 0xF1, 0x07, 0x12, 0x04]))
+    vec = run_both(roms, 1000, cpu_hz=700, timer_hz=120)
+    assert vec.delay_timer[1] == 0xFF - 1000 * 120 // 700
+
+
+def test_random_bytes_match_emulator():
+    # More CXNN than a block of random bytes
+    rom = bytes([0xC3, 0x0F, 0xC4, 0xF0, 0x73, 0x01, 0x12, 0x00])
+    vec = VectorEmulator(3, {'seed': 40})
+    vec.load_to_memory(rom)
+    vec.run(4000)
+    for i in range(3):
+        emulator = headless.create_emulator(dict(headless.DEFAULT_SETTINGS, seed=40 + i))
+        emulator.load_to_memory(rom)
+        headless.run(emulator, cycles=4000)
+        assert list(emulator.V) == vec.V[i].tolist()
+        assert emulator.random.getstate() == (
+            vec.seeds[i], vec.random_block[i], vec.random_position[i])
+    assert vec.V[0].tolist() != vec.V[1].tolist()